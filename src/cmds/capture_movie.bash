@@ -0,0 +1,13 @@
+#!/bin/bash
+# writes the live view of the camera as MJPEG to stdout, the preview decodes the frames in-process
+# example: ./capture_movie.bash --model fuji --port usb:001,004
+
+args=("$@")
+for ((i=0; i<${#args[@]}; i++)); do
+    case ${args[i]} in
+        --model) model=${args[i+1]};;
+        --port) port=${args[i+1]};;
+    esac
+done
+
+exec gphoto2 --set-config movie=1 --stdout --capture-movie --camera "$model" --port "$port"
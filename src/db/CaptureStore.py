@@ -0,0 +1,137 @@
+'''
+This module contains the CaptureStore class, the capture table of the file based catalog. The table is partitioned
+by session into one Parquet file per session below .project/captures.
+Author: Sebastian Sander
+'''
+
+import csv
+import os
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from src.db.Transaction import write_file, remove_file, read_staged, REMOVED
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+
+def create_capture_record(meta_info, columns):
+    """
+    Returns the row of a capture, one string (or None) per column.
+    """
+    record = {col: meta_info.get(col) or None for col in columns}
+    record['collectionName'] = record.get('collectionName') or 'General'
+    record['timestamp'] = record.get('timestamp') or datetime.now().isoformat().split(".")[0]
+    return {col: None if value is None else str(value) for col, value in record.items()}
+
+
+class CaptureStore:
+    """
+    Capture table partitioned by session. Every session has its own Parquet file, so adding captures to a
+    session or removing a session costs O(session size), and queries only read the partitions and columns
+    they need.
+
+    Args:
+        store_dir (Path): directory of the partitions.
+        columns (list): the columns of the table, the keys of CSV_SCHEMA.
+    """
+
+    def __init__(self, store_dir, columns):
+        self.store_dir = Path(store_dir)
+        self.columns = list(columns)
+        self.schema = pa.schema([(col, pa.string()) for col in self.columns])
+
+    def exists(self):
+        return self.store_dir.is_dir()
+
+    def create(self):
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+
+    def append(self, sid, meta_infos):
+        """
+        Adds the captures described by meta_infos to the partition of session sid.
+        """
+        records = [create_capture_record(meta_info, self.columns) for meta_info in meta_infos]
+        if not records:
+            return
+        table = pa.Table.from_pylist(records, schema=self.schema)
+        existing = self._read_partition(sid)
+        if existing is not None:
+            table = pa.concat_tables([existing, table])
+        buffer = pa.BufferOutputStream()
+        pq.write_table(table, buffer)
+        write_file(self._partition(sid), buffer.getvalue().to_pybytes())
+
+    def remove_session(self, sid):
+        remove_file(self._partition(sid))
+
+    def clear(self):
+        for partition in self._partitions(None):
+            remove_file(partition)
+
+    def count(self, sid=None):
+        partitions = self._partitions([sid] if sid is not None else None)
+        return sum(pq.ParquetFile(partition).metadata.num_rows for partition in partitions)
+
+    def query(self, columns=None, sessions=None, **filters):
+        """
+        Reads the capture table.
+
+        Args:
+            columns (list): the columns to read, all columns by default.
+            sessions (list): the session ids whose partitions are read, all sessions by default.
+            **filters: column=value pairs the rows have to match.
+
+        Returns:
+            pd.DataFrame: the matching captures.
+        """
+        columns = list(columns) if columns is not None else self.columns
+        partitions = self._partitions(sessions)
+        if not partitions:
+            return pd.DataFrame(columns=columns)
+        expression = None
+        for col, value in filters.items():
+            condition = ds.field(col) == value
+            expression = condition if expression is None else expression & condition
+        dataset = ds.dataset([str(partition) for partition in partitions], schema=self.schema, format='parquet')
+        return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+    def export_csv(self, csv_file, header, sessions=None):
+        """
+        Writes the capture table to a CSV file with the given header, the partitions in the order of sessions.
+        """
+        tmp_file = Path(csv_file).with_suffix('.tmp')
+        with tmp_file.open('w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            for partition in self._partitions(sessions):
+                for batch in pq.ParquetFile(partition).iter_batches(columns=self.columns):
+                    writer.writerows(zip(*(batch.column(col).to_pylist() for col in self.columns)))
+        os.replace(tmp_file, csv_file)
+
+    def _read_partition(self, sid):
+        # sees the partition staged by the transaction of the current thread
+        partition = self._partition(sid)
+        staged = read_staged(partition)
+        if staged is REMOVED:
+            return None
+        if staged is not None:
+            return pq.read_table(pa.BufferReader(staged), schema=self.schema)
+        if partition.is_file():
+            return pq.read_table(partition, schema=self.schema)
+        return None
+
+    def _partition(self, sid):
+        return self.store_dir / f"{sid}.parquet"
+
+    def _partitions(self, sessions):
+        if sessions is None:
+            return sorted(self.store_dir.glob('*.parquet'))
+        return [self._partition(sid) for sid in sessions if self._partition(sid).is_file()]
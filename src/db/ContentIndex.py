@@ -0,0 +1,131 @@
+'''
+This module contains the ContentIndex class, which maps the content hashes of the captures of a project to their paths.
+Author: Sebastian Sander
+'''
+
+import json
+import threading
+from pathlib import Path
+
+from src.db.Transaction import append_file
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+
+class ContentIndex:
+    """
+    Content hash index of the captures of a project, kept in .project/.content_index.jsonl.
+
+    New captures are appended as one JSON line each, removed session directories are appended as a line with
+    the removed prefix. Identical images share a hash, so a lookup tells in O(1) whether an image is already part
+    of the project.
+
+    In a project shared by several stations every station appends to an index file of its own,
+    .content_index.<station>.jsonl, and the index is read from the files of all stations.
+
+    Args:
+        project_root_dir (Path): root directory of the project.
+        station (str): id of the station, None for a project with a single writer.
+    """
+    FILE_NAME = '.content_index.jsonl'
+
+    def __init__(self, project_root_dir, station=None):
+        self.index_dir = Path(project_root_dir) / '.project'
+        self.index_file = self.index_dir / (f".content_index.{station}.jsonl" if station else ContentIndex.FILE_NAME)
+        self.paths = {}
+        # capture path -> content hash
+        self.hashes = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            self.paths = {}
+            self.hashes = {}
+            for index_file in self._index_files():
+                with index_file.open() as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            logger.warning(f"Skipping corrupted entry in {index_file}")
+                            continue
+                        self._apply(entry)
+        return self
+
+    def __contains__(self, content_hash):
+        with self._lock:
+            return content_hash in self.paths
+
+    def get(self, content_hash):
+        with self._lock:
+            return list(self.paths.get(content_hash, []))
+
+    def hash_of(self, path):
+        with self._lock:
+            return self.hashes.get(path)
+
+    def indexed_paths(self):
+        with self._lock:
+            return {path for paths in self.paths.values() for path in paths}
+
+    def add(self, entries):
+        """
+        Adds captures to the index.
+
+        Args:
+            entries (list): (content_hash, capture_path) tuples.
+        """
+        lines = "".join(json.dumps({'hash': content_hash, 'path': path}) + "\n" for content_hash, path in entries)
+        append_file(self.index_file, lines, writer=self._write_entries)
+
+    def remove_prefix(self, prefix):
+        """
+        Removes all captures below the directory prefix, e.g. of a deleted session.
+        """
+        append_file(self.index_file, json.dumps({'remove_prefix': prefix}) + "\n", writer=self._write_entries)
+
+    def duplicates(self):
+        """
+        Returns the hashes shared by several captures with their paths.
+        """
+        with self._lock:
+            return {content_hash: list(paths) for content_hash, paths in self.paths.items() if len(paths) > 1}
+
+    def _index_files(self):
+        # the single writer index first, then the indexes of the stations
+        index_files = sorted(self.index_dir.glob('.content_index.*.jsonl'))
+        if (self.index_dir / ContentIndex.FILE_NAME).is_file():
+            index_files.insert(0, self.index_dir / ContentIndex.FILE_NAME)
+        return index_files
+
+    def _write_entries(self, path, lines):
+        # inside a transaction the entries are written and applied on commit
+        with self._lock:
+            with open(path, 'ab') as f:
+                f.write(lines)
+            for line in lines.splitlines():
+                self._apply(json.loads(line))
+
+    def _apply(self, entry):
+        if 'remove_prefix' in entry:
+            self._remove(entry['remove_prefix'])
+        else:
+            self._add(entry['hash'], entry['path'])
+
+    def _add(self, content_hash, path):
+        paths = self.paths.setdefault(content_hash, [])
+        if path not in paths:
+            paths.append(path)
+        self.hashes[path] = content_hash
+
+    def _remove(self, prefix):
+        paths = {}
+        for content_hash, hash_paths in self.paths.items():
+            hash_paths = [path for path in hash_paths if not path.startswith(prefix)]
+            if hash_paths:
+                paths[content_hash] = hash_paths
+        self.paths = paths
+        self.hashes = {path: content_hash for path, content_hash in self.hashes.items() if not path.startswith(prefix)}
@@ -6,20 +6,31 @@ Author: Sebastian Sander
 
 
 
-import yaml
 import uuid
 import hashlib
 from pathlib import Path
-import pandas as pd
-import csv
 import shutil
-from PIL import Image
-from PIL import ExifTags
+import threading
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
 from cryptography.fernet import Fernet
 import json
-from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtCore import QObject, pyqtSignal, QThreadPool
 from src.utils.Validation import DataValidator
+from src.utils.exif import write_user_comment
+from src.utils.ingest import ingest_capture, link_or_copy, content_hash, new_hasher
+from src.utils.sidecar import dump_sidecar, load_sidecar, find_sidecar, sidecar_path, SIDECAR_YAML
+from src.db.JsonCatalog import JsonCatalog, CSV_SCHEMA, get_csv_header
+from src.db.CaptureStore import create_capture_record
+from src.db.SQLiteCatalog import SQLiteCatalog
+from src.db.StationCatalog import StationCatalog
+from src.db.ContentIndex import ContentIndex
+from src.db.SearchIndex import SearchIndex
+from src.db.DerivativeCache import DerivativeCache
+from src.db.Transaction import TransactionManager, FSYNC_TRANSACTION, write_file
+from src.threads.SaveWorker import SaveWorker
+from src.threads.MergeWorker import MergeWorker
 
 import logging
 import logging.config
@@ -34,15 +45,35 @@ class DBAdapter(QObject):
     validation_error_signal = pyqtSignal(str)
     project_changed_signal = pyqtSignal(dict)
     session_created_signal = pyqtSignal(dict)
+    # the full sessions dict, emitted when a project is created, loaded, merged or closed
     sessions_signal = pyqtSignal(dict)
+    # deltas of the sessions dict: (sid, session), (sid, changed fields), (sid, capture path) and sid
+    session_added_signal = pyqtSignal(str, dict)
+    session_updated_signal = pyqtSignal(str, dict)
+    capture_added_signal = pyqtSignal(str, str)
+    session_removed_signal = pyqtSignal(str)
+    save_progress_signal = pyqtSignal(str, int)
+    save_completed_signal = pyqtSignal(dict)
+    save_failed_signal = pyqtSignal(str)
+    merge_progress_signal = pyqtSignal(int, int)
+    merge_completed_signal = pyqtSignal(bool)
+    merge_failed_signal = pyqtSignal(str)
 
     def __init__(self, db_manager):
         super().__init__()
         self.db_manager = db_manager
+        # a single thread keeps the saves in the order they were queued
+        self.save_pool = QThreadPool()
+        self.save_pool.setMaxThreadCount(1)
+        self.pending_saves = 0
+        self.merge_worker = None
 
     def create_session(self, session_data):
         sessions = self.db_manager.create_session(session_data)
-        self.sessions_signal.emit(sessions)
+        # sessions are kept in the order they were created, the new one is the last
+        sid = next(reversed(sessions), None)
+        if sid is not None:
+            self.session_added_signal.emit(sid, sessions[sid])
 
     def create_project(self, project_info):
         try:
@@ -59,7 +90,45 @@ class DBAdapter(QObject):
         self.project_changed_signal.emit(project_info)
         self.sessions_signal.emit(sessions)
 
+    def merge_project_async(self, source_adapter, keep_empty_sessions, link_files=False):
+        """
+        Merges the source project on the save thread. merge_completed_signal tells whether the merge was cancelled.
+        """
+        self.merge_worker = MergeWorker(self.db_manager, source_adapter, keep_empty_sessions, link_files)
+        self.merge_worker.signals.progress.connect(self.merge_progress_signal)
+        self.merge_worker.signals.completed.connect(self._on_merge_completed)
+        self.merge_worker.signals.cancelled.connect(self._on_merge_cancelled)
+        self.merge_worker.signals.failed.connect(self._on_merge_failed)
+        self.save_pool.start(self.merge_worker)
+
+    def get_import_stats(self):
+        return self.db_manager.get_import_stats()
+
+    def find_duplicates(self):
+        return self.db_manager.find_duplicates()
+
+    def cancel_merge(self):
+        if self.merge_worker is not None:
+            self.merge_worker.cancel()
+
+    def _on_merge_completed(self, project_info, sessions):
+        self._on_merge_done(project_info, sessions, False)
+
+    def _on_merge_cancelled(self, project_info, sessions):
+        self._on_merge_done(project_info, sessions, True)
+
+    def _on_merge_done(self, project_info, sessions, cancelled):
+        self.merge_worker = None
+        self.project_changed_signal.emit(project_info)
+        self.sessions_signal.emit(sessions)
+        self.merge_completed_signal.emit(cancelled)
+
+    def _on_merge_failed(self, message):
+        self.merge_worker = None
+        self.merge_failed_signal.emit(message)
+
     def clear_project(self):
+        self.wait_for_saves()
         self.db_manager.clear()
         self.project_changed_signal.emit({})
         self.sessions_signal.emit({})
@@ -74,6 +143,7 @@ class DBAdapter(QObject):
         return self.db_manager.verify_credentials(username, password)
 
     def load_project(self, project_dir):
+        self.wait_for_saves()
         project_info = self.db_manager.load_project(project_dir)
         sessions = self.db_manager.load_sessions()
         self.project_changed_signal.emit(project_info)
@@ -85,13 +155,41 @@ class DBAdapter(QObject):
 
     def save_image_data(self, payload):
         logger.info(f"Sending data to DB...")
-        project_info, sessions = self.db_manager.post_new_image(payload)
+        project_info, session = self.db_manager.post_new_image(payload)
         if not project_info:
             return False
-        self.project_changed_signal.emit(project_info)
-        self.sessions_signal.emit(sessions)
+        self._emit_capture_added(project_info, payload['sid'], session)
         return True
 
+    def save_image_data_async(self, payload):
+        """
+        Queues the payload for saving on the save thread. The result is reported by the save_*_signals.
+        """
+        logger.info(f"Queueing data for DB...")
+        worker = SaveWorker(self.db_manager, payload)
+        worker.signals.progress.connect(self.save_progress_signal)
+        worker.signals.completed.connect(self._on_save_completed)
+        worker.signals.failed.connect(self._on_save_failed)
+        self.pending_saves += 1
+        self.save_pool.start(worker)
+
+    def wait_for_saves(self, msecs=-1):
+        return self.save_pool.waitForDone(msecs)
+
+    def _on_save_completed(self, project_info, sid, session):
+        self.pending_saves -= 1
+        self._emit_capture_added(project_info, sid, session)
+        self.save_completed_signal.emit(project_info)
+
+    def _emit_capture_added(self, project_info, sid, session):
+        self.project_changed_signal.emit(project_info)
+        self.capture_added_signal.emit(sid, session['captures'][-1])
+        self.session_updated_signal.emit(sid, {'num_captures': session['num_captures']})
+
+    def _on_save_failed(self, message):
+        self.pending_saves -= 1
+        self.save_failed_signal.emit(message)
+
     def receive_data_from_db(self, data):
         if not DataValidator.validate_data_from_db(data):
             self.validation_error_signal.emit("Validation failed: Invalid data received from DB")
@@ -99,8 +197,10 @@ class DBAdapter(QObject):
         self.get_signal.emit(data)
 
     def delete_session(self, session_id):
-        project_info, sessions = self.db_manager.delete_session(session_id)
-        self.sessions_signal.emit(sessions)
+        # the project counter is updated by the queued saves as well
+        self.wait_for_saves()
+        project_info, _ = self.db_manager.delete_session(session_id)
+        self.session_removed_signal.emit(session_id)
         self.project_changed_signal.emit(project_info)
 
     def validate_admin(self, username, password):
@@ -148,47 +248,131 @@ class DBAdapter(QObject):
     def load_sessions(self):
         return self.db_manager.load_sessions()
 
-CSV_SCHEMA = {
-        "sessionName": None,
-        "collectionName": None,
-        "order": None,
-        "family": None,
-        "genus": None,
-        "species": None,
-        "museum": None,
-        "capturer": None,
-        "directory": None,
-        "timestamp": None
-    }
+    def export_catalog(self):
+        self.db_manager.export_catalog()
+
+    def get_cache_stats(self):
+        return self.db_manager.get_cache_stats()
+
+    def get_transaction_stats(self):
+        return self.db_manager.get_transaction_stats()
+
+    def get_derivative(self, capture, kind='thumbnail'):
+        return self.db_manager.get_derivative(capture, kind)
+
+    def get_derivative_stats(self):
+        return self.db_manager.get_derivative_stats()
+
+    def query_captures(self, columns=None, sessions=None, **filters):
+        return self.db_manager.query_captures(columns=columns, sessions=sessions, **filters)
+
+    def search_captures(self, page=0, page_size=50, **criteria):
+        return self.db_manager.search_captures(page=page, page_size=page_size, **criteria)
+
+    def get_search_values(self, field):
+        return self.db_manager.get_search_values(field)
+
+CATALOGS = {
+    JsonCatalog.name: JsonCatalog,
+    SQLiteCatalog.name: SQLiteCatalog,
+    StationCatalog.name: StationCatalog
+}
 
 class FileAgnosticDB:
-    def __init__(self):
+    """
+    File based project database. Images, sidecar files, users and keys are kept in the project directory,
+    the structured project state (project info, sessions, captures and museums) is kept by a catalog backend.
+
+    The metadata files written by one operation, e.g. adding a capture, are committed together by a
+    TransactionManager, see fsync_policy. Thumbnails and previews of new captures are generated in the background
+    and kept in a DerivativeCache.
+
+    Args:
+        catalog: catalog backend, e.g. JsonCatalog or SQLiteCatalog. Defaults to the JsonCatalog.
+        fsync_policy (str): 'none', 'transaction' (one fsync per operation) or 'batch' (one fsync per fsync_batch
+            operations).
+        fsync_batch (int): operations per fsync of the 'batch' policy.
+        derivative_cache_size (int): size cap of the derivative cache in bytes.
+        sidecar_format (str): 'yaml' or 'json', the format of the sidecars written for new captures and sessions.
+            Sidecars of both formats are read.
+    """
+    # threads copying images when importing sessions
+    IMPORT_WORKERS = 4
+
+    def __init__(self, catalog=None, fsync_policy=FSYNC_TRANSACTION, fsync_batch=8,
+                 derivative_cache_size=DerivativeCache.MAX_BYTES, sidecar_format=SIDECAR_YAML):
+        self.catalog = catalog if catalog is not None else JsonCatalog()
+        self.sidecar_format = sidecar_format
+        self.fsync_policy = fsync_policy
+        self.fsync_batch = fsync_batch
+        self.derivative_cache_size = derivative_cache_size
+        self.derivatives = None
+        # generates the derivatives of new captures, one at a time
+        self._derivative_pool = ThreadPoolExecutor(max_workers=1)
+        self._derivative_jobs = set()
+        self.transactions = None
         self.project_root_dir = None
         self.current_session = None
         self.fernet = None
         self.current_user = None
         self.captures_csv_header = FileAgnosticDB._get_csv_header()
+        self.import_stats = FileAgnosticDB._empty_import_stats()
+        self.content_index = None
+        self.search_index = None
+        self._search_lock = threading.Lock()
 
     def clear(self):
+        self.wait_for_derivatives()
+        self.catalog.close()
+        if self.transactions is not None:
+            self.transactions.close()
+        self.transactions = None
+        self.content_index = None
+        self.search_index = None
+        self.derivatives = None
         self.project_root_dir = None
         self.current_session = None
         self.fernet = None
         self.current_user = None
         self.captures_csv_header = FileAgnosticDB._get_csv_header()
         
-    def merge_project(self, source_adapter, keep_emty_sessions):
+    def merge_project(self, source_adapter, keep_emty_sessions, progress=None, cancel_event=None, link_files=False):
+        """
+        Imports the sessions of the source project that are not part of this project yet.
+
+        Args:
+            source_adapter: DBAdapter of the source project.
+            keep_emty_sessions (bool): import sessions without captures.
+            progress (callable): called with (imported captures, total captures).
+            cancel_event (threading.Event): stops the merge after the captures that are being copied.
+            link_files (bool): reflink or hardlink the images instead of copying them. The images keep the
+                exif comment of the source project. The bytes copied and linked are kept in import_stats.
+        """
+        self.import_stats = FileAgnosticDB._empty_import_stats()
         source_sessions = source_adapter.load_sessions()
         if not keep_emty_sessions:
             source_sessions = {key: session for key, session in source_sessions.items() if session['captures']}
         # get number of current sessions to check if a new sessions was created or not
         sessions = self.load_sessions()
         project_info = self.get_project_info()
+        total = sum(len(session['captures']) for sid, session in source_sessions.items() if sid not in sessions)
+        imported = 0
         for sid, source_session in source_sessions.items():
+            if cancel_event is not None and cancel_event.is_set():
+                break
             new_sessions = self.create_session(source_session.copy(), session_id=sid)
             if len(new_sessions) == len(sessions):
                 continue
-            # Copy data from source to target (you'll need to implement this)
-            project_info, sessions = self.import_session_data(source_session, sid, source_root=source_adapter.get_project_dir())
+            # captures imported or skipped in this session, the last progress report
+            session_done = [0]
+            def session_progress(done, _, offset=imported, session_done=session_done):
+                session_done[0] = done
+                if progress is not None:
+                    progress(offset + done, total)
+            project_info, sessions = self.import_session_data(source_session, sid, source_root=source_adapter.get_project_dir(),
+                                                              progress=session_progress, cancel_event=cancel_event,
+                                                              link_files=link_files)
+            imported += session_done[0]
         return project_info, sessions
     
     def get_value_name(self, value_str, pattern, splitter="_"):
@@ -198,129 +382,275 @@ class FileAgnosticDB:
             if pattern in part:
                 return part
 
-    def import_session_data(self, source_session, sid, source_root):
-        # create absolute path tupes for coying
-        project_info = self.get_project_info()
-        sessions = self.load_sessions()
-        source_caps = [Path(source_root) / cap_dir for cap_dir in source_session['captures']]
-        for source_cap in source_caps:
-            payload = {}
-            payload['img_dir'] = str(source_cap)
-            payload['sid'] = sid
-            with source_cap.with_suffix('.yml').open('r') as f:
-                meta_info = yaml.safe_load(f)
-            payload['meta_info'] = meta_info
-            project_info, sessions = self.post_new_image(payload)
-        return project_info, sessions
+    def import_session_data(self, source_session, sid, source_root, progress=None, cancel_event=None, link_files=False):
+        """
+        Copies the captures of a source session into the session sid of this project.
+
+        The images are copied by a thread pool, the catalog is updated once for the whole session. When the
+        import is cancelled or a copy fails, the captures copied so far are kept as long as they are numbered
+        without gaps; the error of a failed copy is raised after they were added to the catalog.
+
+        progress is called with (captures imported or skipped, captures of the source session).
+        """
+        with self.catalog.lock(f"session-{sid}"):
+            return self._import_session_data(source_session, sid, source_root, progress, cancel_event, link_files)
+
+    def _import_session_data(self, source_session, sid, source_root, progress, cancel_event, link_files):
+        session = self.catalog.get_session(sid)
+        session_dir = self.project_root_dir / session['session_dir']
+        # number all captures up front, the copies may finish in any order
+        jobs = []
+        hashes = set()
+        for cap_dir in source_session['captures']:
+            source_cap = Path(source_root) / cap_dir
+            meta_info = load_sidecar(find_sidecar(source_cap))
+            is_valid, msg = DataValidator.validate_meta_info(meta_info)
+            if is_valid:
+                is_valid, msg = DataValidator.validate_image_data(str(source_cap))
+            if not is_valid:
+                logger.warning(f"Skipping capture {source_cap}: {msg}")
+                continue
+            # captures of older projects have no hash in their meta data yet
+            meta_info['contentHash'] = meta_info.get('contentHash') or content_hash(source_cap)
+            if meta_info['contentHash'] in self.content_index or meta_info['contentHash'] in hashes:
+                logger.info(f"Skipping capture {source_cap}, it is already part of the project")
+                self.import_stats['files_skipped'] += 1
+                continue
+            hashes.add(meta_info['contentHash'])
+            meta_info_flat, img_name, meta_name = self._prepare_capture(meta_info, session)
+            jobs.append((source_cap, meta_info, meta_info_flat, img_name, meta_name))
+        num_skipped = len(source_session['captures']) - len(jobs)
+        if progress is not None:
+            progress(num_skipped, len(source_session['captures']))
+
+        done = [False] * len(jobs)
+        error = None
+        with ThreadPoolExecutor(max_workers=FileAgnosticDB.IMPORT_WORKERS) as executor:
+            futures = {executor.submit(self._write_capture, *job[1:], job[0], link=link_files): i for i, job in enumerate(jobs)}
+            pending = set(futures)
+            while pending:
+                finished, pending = wait(pending, timeout=0.1, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future.cancelled():
+                        continue
+                    try:
+                        method, bytes_copied = future.result()
+                    except Exception as e:
+                        # not done, the captures numbered after it are dropped like on cancel
+                        logger.error(f"Could not import {jobs[futures[future]][0]}: {e}")
+                        error = error or e
+                        continue
+                    self._count_import(method, bytes_copied, jobs[futures[future]][0])
+                    done[futures[future]] = True
+                    if progress is not None:
+                        progress(num_skipped + sum(done), len(source_session['captures']))
+                if error is not None or (cancel_event is not None and cancel_event.is_set()):
+                    for future in pending:
+                        future.cancel()
+
+        n_imported = done.index(False) if False in done else len(done)
+        for _, _, _, img_name, meta_name in jobs[n_imported:]:
+            # copied after a gap in the numbering, drop it so the next capture does not collide with it
+            (self.project_root_dir / img_name).unlink(missing_ok=True)
+            (self.project_root_dir / meta_name).unlink(missing_ok=True)
+        if n_imported < len(jobs):
+            logger.info(f"Import of session {sid} cancelled after {n_imported} of {len(jobs)} captures")
+        imported = jobs[:n_imported]
+        session['captures'] = session['captures'][:len(session['captures']) - len(jobs) + n_imported]
+        session['num_captures'] = len(session['captures'])
+        with self._transaction('import_session'):
+            write_file(sidecar_path(session_dir / session['name'], self.sidecar_format), dump_sidecar(session, self.sidecar_format))
+            self.catalog.add_captures(sid, [(str(img_name), meta_info_flat) for _, _, meta_info_flat, img_name, _ in imported])
+            self.content_index.add([(meta_info['contentHash'], str(img_name)) for _, meta_info, _, img_name, _ in imported])
+            self._index_captures([meta_info_flat for _, _, meta_info_flat, _, _ in imported])
+        if error is not None:
+            raise error
+        return self.get_project_info(), self.load_sessions()
+
+    def _write_capture(self, meta_info, meta_info_flat, img_name, meta_name, img_dir, move=False, link=False):
+        # writes the image with the meta data in its exif tag and the sidecar, returns how the image was written
+        if link:
+            # a linked image shares its content with the source, its exif data is left as it is
+            method, bytes_copied = link_or_copy(img_dir, self.project_root_dir / img_name)
+        else:
+            exif_info = {key: value for key, value in meta_info_flat.items() if key != 'captures'}
+            # the content hash is computed while the image is written, unless it is known already
+            hasher = new_hasher() if 'contentHash' not in meta_info else None
+            method = ingest_capture(img_dir, self.project_root_dir / img_name, comment=str(exif_info), move=move, hasher=hasher)
+            bytes_copied = (self.project_root_dir / img_name).stat().st_size if method == 'streamed' else 0
+            if hasher is not None:
+                meta_info['contentHash'] = meta_info_flat['contentHash'] = hasher.hexdigest()
+        write_file(self.project_root_dir / meta_name, dump_sidecar(meta_info, self.sidecar_format))
+        return method, bytes_copied
+
+    def _count_import(self, method, bytes_copied, img_dir):
+        if method in ('streamed', 'copy'):
+            self.import_stats['files_copied'] += 1
+            self.import_stats['bytes_copied'] += bytes_copied
+        else:
+            self.import_stats['files_linked'] += 1
+            self.import_stats['bytes_linked'] += Path(img_dir).stat().st_size
+
+    @staticmethod
+    def _empty_import_stats():
+        return {'files_copied': 0, 'bytes_copied': 0, 'files_linked': 0, 'bytes_linked': 0, 'files_skipped': 0}
+
+    def find_duplicates(self):
+        """
+        Returns the captures of the project that have the same image content, {content hash: [capture paths]}.
+        Captures that are not indexed yet, e.g. of projects created before the index existed, are hashed first.
+        """
+        indexed = self.content_index.indexed_paths()
+        missing = []
+        for session in self.load_sessions().values():
+            for capture in session['captures']:
+                if capture not in indexed and (self.project_root_dir / capture).is_file():
+                    missing.append(capture)
+        if missing:
+            logger.info(f"Hashing {len(missing)} captures missing in the content index")
+            with ThreadPoolExecutor(max_workers=FileAgnosticDB.IMPORT_WORKERS) as executor:
+                hashes = list(executor.map(lambda capture: content_hash(self.project_root_dir / capture), missing))
+            self.content_index.add(list(zip(hashes, missing)))
+        return self.content_index.duplicates()
+
+    def get_import_stats(self):
+        return dict(self.import_stats)
 
     def create_project(self, project_info):
         project_dir = Path(project_info['project_dir'])
         project_dir.mkdir(exist_ok=True)
         
-        # Create captures directory and CSV file
+        # Create captures directory and .project directory
         (project_dir / 'captures').mkdir(exist_ok=True)
-        self._create_captures_csv(project_dir)
-        
-        # Create .project directory and files
         project_data_dir = project_dir / '.project'
         project_data_dir.mkdir(exist_ok=True)
-        
-        (project_data_dir / '.project.json').touch()
-        (project_data_dir / '.sessions.json').write_text('{}')
-        (project_data_dir / '.museums.json').write_text('{}')
         (project_data_dir / '.tmp_cap').mkdir(exist_ok=True)
         
-        # Write project info to .project.json
-        with (project_data_dir / '.project.json').open('w') as f:
-            json.dump(project_info, f, indent=2)
+        # Write project info, sessions, museums and captures table to the catalog
+        self.catalog.create(project_dir, project_info)
         
         self.project_root_dir = project_dir
+        self.transactions = self._create_transactions()
+        self.content_index = ContentIndex(project_dir, station=self.catalog.station).load()
+        self.search_index = None
+        self.derivatives = DerivativeCache(project_dir, max_bytes=self.derivative_cache_size).load()
         self._initialize_key()
         return self.get_project_info()
 
     def create_session(self, session_data, session_id=None):
         if not session_id:
             session_id = str(uuid.uuid4())
-        sessions_file = self.project_root_dir / '.project' / '.sessions.json'
-        if not sessions_file.is_file():
-            raise FileNotFoundError(f"No sessions file found. {sessions_file}")
-        sessions = json.loads(sessions_file.read_text())
+        with self.catalog.lock('create-session'):
+            return self._create_session(session_data, session_id)
+
+    def _create_session(self, session_data, session_id):
+        sessions = self.load_sessions()
         if sessions.get(session_id, None):
             return sessions    
-        n_sessions = len(sessions)
-        session_data['name'] = f"session-{str(n_sessions + 1).zfill(3)}"
+        # the name is a label only, the directory is keyed by the session id and never renamed
+        session_data['name'] = f"session-{str(self._next_session_number(sessions)).zfill(3)}"
         session_data['creation_date'] = datetime.now().isoformat()
-        session_data['session_dir'] = (Path('captures') / f"{session_data['name']}").as_posix()
+        session_data['session_dir'] = (Path('captures') / session_id).as_posix()
         session_data['num_captures'] = 0
         session_data['captures'] = []
+        with self._transaction('create_session'):
+            self.catalog.add_session(session_id, session_data)
         sessions[session_id] = session_data
-        sessions_file.write_text(json.dumps(sessions, indent=2))
         Path(self.project_root_dir / session_data['session_dir']).mkdir()
         return sessions
 
     def load_sessions(self):
-        sessions_file = self.project_root_dir / ".project/.sessions.json"
-        if not sessions_file.is_file():
-            raise FileNotFoundError(f"Session data missing for {sessions_file}")
-        with sessions_file.open() as f:
-            sessions = json.load(f)
-        return sessions
+        return self.catalog.load_sessions()
+
+    def _next_session_number(self, sessions):
+        numbers = [0]
+        for session in sessions.values():
+            try:
+                numbers.append(int(session['name'].split('-')[-1]))
+            except (KeyError, ValueError):
+                continue
+        return max(numbers) + 1
         
-    def post_new_image(self, payload):
+    def post_new_image(self, payload, progress=None):
         # add the session id to the payload
+        progress = progress or (lambda stage, percent: None)
         img_dir = payload.get('img_dir', None)
         meta_info = payload.get('meta_info', {})
         sid = payload.get('sid')
 
         logger.info(f"Validating meta info")
+        progress("Validating", 0)
         is_valid, msg = DataValidator.validate_meta_info(meta_info)
+        # runs on the save thread, the message is returned for the save_failed_signal
         if not is_valid:
-            print("Invalid meta data", msg)
-            return False, []
+            logger.warning(f"Invalid meta data: {msg}")
+            return False, f"Invalid meta data: {msg}"
         is_valid, msg = DataValidator.validate_image_data(img_dir)
         if not is_valid:
-            print("Invalid image dir", msg)
-            return False, []
-        
-        sessions_file = self.project_root_dir / '.project' / '.sessions.json'
-        sessions = json.loads(sessions_file.read_text())
+            logger.warning(f"Invalid image dir {img_dir}: {msg}")
+            return False, f"Invalid image dir: {msg}"
+
+        # the captures of a session are numbered by one writer at a time, see StationCatalog
+        with self.catalog.lock(f"session-{sid}"):
+            session = self.catalog.get_session(sid)
+            if not session:
+                raise ValueError("Session not found")
+            session_dir = self.project_root_dir / session['session_dir']
+
+            meta_info_flat, img_name, meta_name = self._prepare_capture(meta_info, session)
+            # the metadata files of the capture are committed together
+            try:
+                with self._transaction('post_new_image'):
+                    progress("Writing meta data", 10)
+                    write_file(sidecar_path(session_dir / session['name'], self.sidecar_format), dump_sidecar(session, self.sidecar_format))
+                    # write the sidecar, copy the image and add the meta data to its exif tag in one pass
+                    progress("Writing image", 20)
+                    self._write_capture(meta_info, meta_info_flat, img_name, meta_name, img_dir, move=payload.get('move', False))
+                    progress("Updating catalog", 80)
+                    # add the capture to the catalog (sessions, captures table and project counter)
+                    self.catalog.add_capture(sid, str(img_name), meta_info_flat)
+                    self.content_index.add([(meta_info_flat['contentHash'], str(img_name))])
+                    self._index_captures([meta_info_flat])
+            except BaseException:
+                # the catalog was left unchanged, the image is not kept either
+                self._discard_capture(img_dir, self.project_root_dir / img_name, payload.get('move', False))
+                raise
+        self._queue_derivatives(meta_info_flat['contentHash'], self.project_root_dir / img_name)
+        project_info = self.get_project_info()
+        progress("Saved", 100)
+        # only the session of the capture, reading all sessions costs as much as the project is large
+        return project_info, self.catalog.get_session(sid)
 
-        session = sessions.get(sid)
-        if not session:
-            raise ValueError("Session not found")
-        
+    def _discard_capture(self, img_dir, img_path, moved):
+        if not img_path.is_file():
+            return
+        if moved and not Path(img_dir).exists():
+            # the capture is given back, it can be saved again
+            shutil.move(img_path, img_dir)
+        else:
+            img_path.unlink()
+
+    def _prepare_capture(self, meta_info, session):
+        """
+        Numbers a new capture of session, adds it to the session dict and returns the flat meta info of the
+        captures table together with the image and sidecar names.
+        """
         meta_info['Session Info'] = session
-        
         meta_info_flat = self._flatten_dict(meta_info)
         session['num_captures'] += 1
         meta_info_flat['captureID'] = session['num_captures'] # refactor session keys...
         meta_info_flat['sessionName'] = session['name']
         meta_info_flat['sessionDir'] = session['session_dir']
         meta_info_flat['collectionName'] = session['collection_name']
+        meta_info_flat['timestamp'] = datetime.now().isoformat().split(".")[0]
         img_name, meta_name = self._create_save_name(meta_info_flat)
         meta_info_flat['directory'] = str(img_name)
         session['captures'].append(str(img_name))
-        session_info = meta_info.pop('Session Info')
-        sessions_file.write_text(json.dumps(sessions, indent=2))
-        (self.project_root_dir / meta_name).write_text(yaml.dump(meta_info))
-        (self.project_root_dir / Path(session_info['session_dir']) / Path(f"{session['name']}.yml")).write_text(yaml.dump(session_info))
-        shutil.copy(img_dir,str((self.project_root_dir / img_name)))
-        # add meta data to new image exif tag
-        self._update_captures_csv(meta_info_flat)
-        project_info = self.get_project_info()
-        project_info['num_captures'] = str(int(project_info['num_captures']) + 1)
-        self._save_project_info(project_info)
-        meta_info_flat.pop('captures', None)
-        self.add_exif_info(str((self.project_root_dir / img_name)), str(meta_info_flat))
-        return project_info, sessions
+        meta_info.pop('Session Info')
+        return meta_info_flat, img_name, meta_name
 
     def get_project_info(self):
-        project_file = self.project_root_dir / '.project' / '.project.json'
-        if not project_file.is_file():
-            raise FileNotFoundError(f"Project INI file missing at {project_file}")
-        with project_file.open('r') as f:
-            project_info = json.load(f)
-        return project_info
+        return self.catalog.get_project_info()
 
     def is_duplicate_museum(self, museum, museums):
         for _, m in museums.items():
@@ -342,12 +672,11 @@ class FileAgnosticDB:
         return True
 
     def save_musems(self, museums):
-        museums_file = self.project_root_dir / '.project' / '.museums.json'
-        museums_file.write_text(json.dumps(museums, indent=2))
+        with self._transaction('save_museums'):
+            self.catalog.save_museums(museums)
 
     def get_museums(self):
-        museums_file = self.project_root_dir / '.project' / '.museums.json'
-        return json.loads(museums_file.read_text())
+        return self.catalog.get_museums()
 
     def edit_museum(self, original, updated):
         museums = self.get_museums()
@@ -404,6 +733,13 @@ class FileAgnosticDB:
     def load_project(self, project_dir):
         # handle white spaces in project_dir
         self.project_root_dir = Path(project_dir)
+        # repair the metadata files of a crashed session before they are read
+        self.transactions = self._create_transactions()
+        self.transactions.recover()
+        self.catalog.open(self.project_root_dir)
+        self.content_index = ContentIndex(self.project_root_dir, station=self.catalog.station).load()
+        self.search_index = None
+        self.derivatives = DerivativeCache(self.project_root_dir, max_bytes=self.derivative_cache_size).load()
         project_info = self.get_project_info()
         if not DataValidator.validate_project_config(project_info):
             raise ValueError(f"Project data are not valid for {project_dir}")
@@ -422,66 +758,110 @@ class FileAgnosticDB:
         # Process and load data from the database
 
     def delete_session(self, session_id):
-        sessions_file = self.project_root_dir / ".project" / ".sessions.json"
-        if not sessions_file.is_file():
-            raise FileNotFoundError(f"No sessions file in: {sessions_file}")
-
-        with sessions_file.open() as f:
-            sessions = json.load(f)
-
-        session_to_delete = sessions.get(session_id, None) 
+        session_to_delete = self.catalog.get_session(session_id)
         if not session_to_delete:
             raise FileNotFoundError(f"Session not in database: {session_id}")
 
-        session_name = session_to_delete['name']
-        # load csv file
-        capture_csv = pd.read_csv(self.project_root_dir / 'captures.csv')
-        capture_csv = capture_csv[capture_csv['Session Name'] != session_name]
-        capture_csv.to_csv(self.project_root_dir / 'captures.csv', index=False)
-        n_captures = str(len(capture_csv))
-        project_info = self.get_project_info()
-        project_info['num_captures'] = n_captures
-        self._save_project_info(project_info)
-        # Delete the session from the dictionary and delete the directory
-        del sessions[session_id]
         session_dir_to_delete = self.project_root_dir / Path(session_to_delete['session_dir'])
         if not session_dir_to_delete.is_dir():
             raise FileNotFoundError(f"Session directory {str(session_dir_to_delete)} does not exists.")
+        # Delete the session and its captures from the catalog and delete the directory,
+        # the other sessions keep their names and directories
+        with self._transaction('delete_session'):
+            self.catalog.remove_session(session_id)
+            self.content_index.remove_prefix(f"{session_to_delete['session_dir']}/")
         shutil.rmtree(str(session_dir_to_delete))
-
-        # Update session directories and names for remaining sessions
-        for i, (sid, session) in enumerate(sessions.items()):
-            new_session_dir = self.project_root_dir / "captures" / f"session-{i+1:03}"
-            old_session_dir = self.project_root_dir / sessions[sid]['session_dir']
-            if new_session_dir == old_session_dir:
-                continue
-            sessions[sid]['session_dir'] = str(new_session_dir.relative_to(self.project_root_dir)) 
-            sessions[sid]['name'] = f"session-{i+1:03}"
-            old_session_dir.rename(new_session_dir)
-
-        # Save the updated sessions to the file
-        with sessions_file.open('w') as f:
-            json.dump(sessions, f, indent=2)
-
-        # calc new total number of captures for the project
-        return project_info, sessions
+        if self.search_index is not None:
+            self.search_index.remove_prefix(f"{session_to_delete['session_dir']}/")
+        return self.get_project_info(), self.load_sessions()
     
     def add_exif_info(self, image_path, comment):
         try:
-            img = Image.open(image_path)
-            exif_data = img.getexif()
-
-            if exif_data:
-                exif_data[ExifTags.Base.UserComment] = comment
-                img.save(image_path, exif=exif_data)
-            else:
-                print("Bild enthält keine EXIF-Daten.")
-
+            # only the exif segment is rewritten, the image data is not re-encoded
+            write_user_comment(image_path, comment)
         except Exception as e:
             print(f"Fehler beim Schreiben des Kommentars: {e}")
 
     def get_project_dir(self):
         return self.project_root_dir
+
+    def export_catalog(self):
+        self.catalog.export()
+
+    def get_cache_stats(self):
+        return self.catalog.cache_stats()
+
+    def get_transaction_stats(self):
+        return dict(self.transactions.stats) if self.transactions is not None else {}
+
+    def get_derivative(self, capture, kind='thumbnail'):
+        """
+        Returns the path of a thumbnail or preview of a capture and generates it on a miss.
+
+        Args:
+            capture (str): path of the capture, relative to the project root or absolute.
+            kind (str): 'thumbnail' (256px) or 'preview' (1600px), see DERIVATIVE_SIZES.
+        """
+        source = self.project_root_dir / capture
+        relative = source.relative_to(self.project_root_dir).as_posix()
+        capture_hash = self.content_index.hash_of(relative)
+        if capture_hash is None:
+            # captures of projects created before the content index existed
+            capture_hash = content_hash(source)
+            self.content_index.add([(capture_hash, relative)])
+        return self.derivatives.get_or_create(capture_hash, source, kind)
+
+    def get_derivative_stats(self):
+        return self.derivatives.get_stats() if self.derivatives is not None else {}
+
+    def wait_for_derivatives(self):
+        wait(list(self._derivative_jobs))
+
+    def _queue_derivatives(self, capture_hash, source):
+        job = self._derivative_pool.submit(self._generate_derivatives, self.derivatives, capture_hash, source)
+        self._derivative_jobs.add(job)
+        job.add_done_callback(self._derivative_jobs.discard)
+
+    @staticmethod
+    def _generate_derivatives(derivatives, capture_hash, source):
+        try:
+            derivatives.generate(capture_hash, source)
+        except Exception as e:
+            # a missing derivative is generated again when it is requested
+            logger.warning(f"Generating the derivatives of {source} failed: {e}")
+
+    def query_captures(self, columns=None, sessions=None, **filters):
+        """
+        Returns the captures as a DataFrame, reading only the given columns (CSV_SCHEMA keys) of the given sessions.
+        """
+        return self.catalog.query_captures(columns=columns, sessions=sessions, **filters)
+
+    def search_captures(self, page=0, page_size=50, **criteria):
+        """
+        Searches the captures by order, family, genus, species, museum, capturer, session, collection and
+        capture date, see SearchIndex.search. The search index is built on the first search.
+        """
+        return self._search_index().search(page=page, page_size=page_size, **criteria)
+
+    def get_search_values(self, field):
+        return self._search_index().values(field)
+
+    def _search_index(self):
+        # the lock keeps captures saved in the background from slipping past a search index that is being built
+        with self._search_lock:
+            if self.search_index is None:
+                search_index = SearchIndex()
+                captures = self.query_captures(sessions=list(self.load_sessions().keys()))
+                search_index.add(captures.astype(object).where(captures.notna(), None).to_dict('records'))
+                logger.info(f"Built search index of {len(search_index)} captures")
+                self.search_index = search_index
+            return self.search_index
+
+    def _index_captures(self, meta_infos):
+        # a search index that is not built yet reads the captures from the catalog when it is needed
+        with self._search_lock:
+            if self.search_index is not None:
+                self.search_index.add([create_capture_record(meta_info, CSV_SCHEMA.keys()) for meta_info in meta_infos])
     
     def get_users(self):
         """
@@ -526,6 +906,17 @@ class FileAgnosticDB:
         encrypted_data = self.fernet.encrypt(json.dumps(existing_users).encode())
         self._save_credentials(encrypted_data)
 
+    def _create_transactions(self):
+        # every station of a shared project recovers its own log
+        log_name = f".transactions.{self.catalog.station}.log" if self.catalog.station else '.transactions.log'
+        return TransactionManager(self.project_root_dir / '.project' / log_name, fsync_policy=self.fsync_policy,
+                                  batch_size=self.fsync_batch, root_dir=self.project_root_dir)
+
+    def _transaction(self, name):
+        if self.transactions is None:
+            return nullcontext()
+        return self.transactions.transaction(name)
+
     def _flatten_dict(self, nested_dict):
         """Flattens a nested dictionary and keeps only the innermost keys."""
         flattened_dict = {}
@@ -538,14 +929,14 @@ class FileAgnosticDB:
         return flattened_dict
     
     def _save_project_info(self, project_info):
-        with open(self.project_root_dir / '.project/.project.json', 'w') as f:
-            json.dump(project_info, f, indent=2)
+        with self._transaction('save_project_info'):
+            self.catalog.save_project_info(project_info)
 
     def _save_credentials(self, encrypted_data):
         credentials_path = self.project_root_dir / ".project" / ".credentials"
         # Save the encrypted data to the file
-        with open(credentials_path, "wb") as f:
-            f.write(encrypted_data)
+        with self._transaction('save_credentials'):
+            write_file(credentials_path, encrypted_data)
 
     def _check_duplicate_users(self, existing_users, new_user):
         if any(user['username'] == new_user['username'] for user in existing_users):
@@ -587,18 +978,11 @@ class FileAgnosticDB:
     def _create_key(self, key_path):
         try:
             key = Fernet.generate_key()
-            with open(key_path, "wb") as key_file:
-                key_file.write(key)
+            write_file(key_path, key)
             self.fernet = Fernet(key)
         except Exception as e:
             raise RuntimeError(f"Failed to create encryption key: {str(e)}")
         
-    def _create_captures_csv(self, project_dir):
-        csv_file = project_dir / 'captures.csv'
-        with csv_file.open('w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(self.captures_csv_header)
-    
     def _create_save_name(self, meta_info):
         session_dir = Path(meta_info['sessionDir'])
         
@@ -607,28 +991,12 @@ class FileAgnosticDB:
         family_name = f"{meta_info['family']}".lower()
 
         img_name = session_dir / f"{meta_info['sessionName']}_cap-{meta_info['captureID']:04d}_order-{order_name}_species-{species_name}.jpg"
-        meta_name = img_name.with_suffix('.yml')
+        meta_name = sidecar_path(img_name, self.sidecar_format)
         
         return img_name, meta_name
 
     def _update_captures_csv(self, meta_info):
-        new_row = []
-        for col in CSV_SCHEMA.keys():
-            d = meta_info.get(col, None)
-            if not d:
-                if col == "collectionName":
-                    d = 'General'
-                else:
-                    continue
-            new_row.append(d)
-
-        time_stamp = datetime.now().isoformat().split(".")[0]
-        new_row.append(time_stamp)
-        csv_file = self.project_root_dir / 'captures.csv'
-        with open(csv_file, 'a', newline='') as csvfile:
-            writer = csv.writer(csvfile)
-            writer.writerow(new_row)
-        logger.info("Finished updating captures csv")
+        self.catalog.append_capture_row(meta_info)
 
     def _create_uuid_from_string(self, val: str):
         hex_string = hashlib.md5(val.encode("UTF-8")).hexdigest()
@@ -648,7 +1016,7 @@ class FileAgnosticDB:
             A string representing the CSV header with commas separating column names.
         """
 
-        return [key.title().replace("name", " Name") for key in CSV_SCHEMA.keys()]
+        return get_csv_header()
 
 class DummyDB:
     def __init__(self):
@@ -687,13 +1055,13 @@ class DummyDB:
     def load_sessions(self):
         return self.sessions
     
-    def post_new_image(self, payload):
+    def post_new_image(self, payload, progress=None):
         # Simulate updating capture counts
         session = self.sessions.get(payload['sid'])
         session['num_captures'] = 1
         self.project_info['num_captures'] += 1
         self.sessions[payload['sid']] = session
-        return self.project_info, self.sessions
+        return self.project_info, session
 
     def get_users(self):
         return [{'username': user['username'], 'role': user['role']} for user in self.users]
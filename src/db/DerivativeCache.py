@@ -0,0 +1,156 @@
+'''
+This module contains the DerivativeCache class, which keeps reduced-size versions (thumbnails and previews) of
+the captures of a project.
+Author: Sebastian Sander
+'''
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from PIL import Image, ImageOps
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+# derivative kind -> longest edge in pixels
+DERIVATIVE_SIZES = {
+    'thumbnail': 256,
+    'preview': 1600,
+}
+
+
+class DerivativeCache:
+    """
+    Cache of the derivatives of the captures of a project, kept in .project/derivatives/<kind>/.
+
+    Derivatives are JPEGs keyed by the content hash of their capture, so identical images share them and a
+    derivative never goes stale. The cache holds at most max_bytes, the least recently used derivatives are
+    evicted first. The access order survives restarts, a hit updates the modification time of the file.
+
+    Args:
+        project_root_dir (Path): root directory of the project.
+        max_bytes (int): size cap of the cache.
+        sizes (dict): derivative kind -> longest edge in pixels.
+    """
+    DIR_NAME = 'derivatives'
+    MAX_BYTES = 512 * 1024 * 1024
+    QUALITY = 85
+
+    def __init__(self, project_root_dir, max_bytes=MAX_BYTES, sizes=DERIVATIVE_SIZES):
+        self.cache_dir = Path(project_root_dir) / '.project' / DerivativeCache.DIR_NAME
+        self.max_bytes = max_bytes
+        self.sizes = dict(sizes)
+        # (kind, content hash) -> file size, least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.stats = {'hits': 0, 'misses': 0, 'generated': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            self.entries = OrderedDict()
+            files = []
+            for kind in self.sizes:
+                for file in (self.cache_dir / kind).glob('*/*.jpg'):
+                    stat = file.stat()
+                    files.append((stat.st_mtime_ns, kind, file.stem, stat.st_size))
+            for _, kind, content_hash, size in sorted(files):
+                self.entries[(kind, content_hash)] = size
+            self.total_bytes = sum(self.entries.values())
+        return self
+
+    def get(self, content_hash, kind='thumbnail'):
+        """
+        Returns the path of the derivative, None if it is not cached.
+        """
+        self._check_kind(kind)
+        with self._lock:
+            if (kind, content_hash) not in self.entries:
+                self.stats['misses'] += 1
+                return None
+            self.stats['hits'] += 1
+            self.entries.move_to_end((kind, content_hash))
+            path = self._path(kind, content_hash)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # removed behind the back of the cache
+            with self._lock:
+                self.total_bytes -= self.entries.pop((kind, content_hash), 0)
+            return None
+        return path
+
+    def get_or_create(self, content_hash, source, kind='thumbnail'):
+        """
+        Returns the path of the derivative and generates it from the source image on a miss.
+        """
+        path = self.get(content_hash, kind)
+        if path is None:
+            path = self.generate(content_hash, source, kinds=[kind])[kind]
+        return path
+
+    def generate(self, content_hash, source, kinds=None):
+        """
+        Generates the derivatives of a capture. The image is decoded once, at the reduced scale the largest
+        derivative needs, and the smaller derivatives are scaled down from the larger ones.
+
+        Returns:
+            dict: kind -> path of the derivative.
+        """
+        kinds = sorted(kinds or self.sizes, key=lambda kind: self.sizes[kind], reverse=True)
+        for kind in kinds:
+            self._check_kind(kind)
+        paths = {}
+        with Image.open(source) as image:
+            # JPEGs are decoded at 1/2, 1/4 or 1/8 of their size if that is still large enough
+            image.draft('RGB', (self.sizes[kinds[0]], self.sizes[kinds[0]]))
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            for kind in kinds:
+                image.thumbnail((self.sizes[kind], self.sizes[kind]))
+                paths[kind] = self._store(kind, content_hash, image)
+        self._evict()
+        return paths
+
+    def clear(self):
+        with self._lock:
+            for kind, content_hash in self.entries:
+                self._path(kind, content_hash).unlink(missing_ok=True)
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self.entries), bytes=self.total_bytes, max_bytes=self.max_bytes)
+
+    def _store(self, kind, content_hash, image):
+        path = self._path(kind, content_hash)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # concurrent generations of the same derivative, also by other stations, write their own temporary file
+        tmp_file = path.with_name(f".{path.stem}.{os.getpid()}.{threading.get_ident()}.tmp")
+        image.save(tmp_file, 'JPEG', quality=DerivativeCache.QUALITY)
+        os.replace(tmp_file, path)
+        size = path.stat().st_size
+        with self._lock:
+            self.total_bytes += size - self.entries.pop((kind, content_hash), 0)
+            self.entries[(kind, content_hash)] = size
+            self.stats['generated'] += 1
+        return path
+
+    def _evict(self):
+        with self._lock:
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                (kind, content_hash), size = self.entries.popitem(last=False)
+                self._path(kind, content_hash).unlink(missing_ok=True)
+                self.total_bytes -= size
+                self.stats['evicted'] += 1
+
+    def _path(self, kind, content_hash):
+        return self.cache_dir / kind / content_hash[:2] / f"{content_hash}.jpg"
+
+    def _check_kind(self, kind):
+        if kind not in self.sizes:
+            raise ValueError(f"Unknown derivative {kind}, use one of {', '.join(self.sizes)}")
@@ -0,0 +1,68 @@
+'''
+This module contains the FileCache class, an in-memory cache for parsed project files.
+Author: Sebastian Sander
+'''
+
+import os
+import threading
+
+MISSING = object()
+
+
+class FileCache:
+    """
+    Keeps parsed file contents in memory and revalidates them against the modification time and size of the
+    files they were read from. Changes made to the files by another process or station are picked up with the
+    next lookup.
+
+    Attributes:
+        hits (int): number of lookups answered from memory.
+        misses (int): number of lookups that required reading the files again.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def signature(*paths):
+        """
+        Returns the (mtime, size) of the given files. Missing files have the signature None.
+        """
+        sig = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+                sig.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                sig.append(None)
+        return tuple(sig)
+
+    def lookup(self, key, signature):
+        """
+        Returns the cached value for key if it was stored with the same signature, otherwise MISSING.
+        """
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return MISSING
+
+    def store(self, key, signature, value):
+        with self._lock:
+            self.entries[key] = (signature, value)
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries)}
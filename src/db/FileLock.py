@@ -0,0 +1,82 @@
+'''
+This module contains the FileLock class, an advisory lock on a file that is shared by several processes, e.g. the
+capture stations writing to one project on a network share.
+Author: Sebastian Sander
+'''
+
+import os
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows
+    fcntl = None
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+
+class LockedError(RuntimeError):
+    pass
+
+
+class FileLock:
+    """
+    Advisory lock on path (flock). Shared locks are held together by any number of processes, an exclusive
+    lock waits until all other locks are released. The lock file is created if it does not exist.
+
+    flock locks belong to an open file, so threads of one process exclude each other as well. On NFS, Linux
+    emulates flock with byte-range locks, which only exclude other processes: the threads of a process are
+    excluded by an additional in-process lock for exclusive locks.
+
+    Args:
+        path (Path): the lock file.
+        shared (bool): take a shared instead of an exclusive lock.
+        blocking (bool): wait for the lock. If False, LockedError is raised when the lock is taken.
+    """
+    _thread_locks = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, path, shared=False, blocking=True):
+        if fcntl is None:
+            raise RuntimeError("File locks need fcntl, which is not available on this platform")
+        self.path = Path(path)
+        self.shared = shared
+        self.blocking = blocking
+        self._fd = None
+        self._thread_lock = None
+
+    def acquire(self):
+        if not self.shared:
+            with FileLock._registry_lock:
+                self._thread_lock = FileLock._thread_locks.setdefault(self.path.resolve(), threading.Lock())
+            if not self._thread_lock.acquire(blocking=self.blocking):
+                self._thread_lock = None
+                raise LockedError(f"{self.path} is locked")
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        flags = (fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX) | (0 if self.blocking else fcntl.LOCK_NB)
+        try:
+            fcntl.flock(self._fd, flags)
+        except BlockingIOError:
+            self.release()
+            raise LockedError(f"{self.path} is locked")
+        return self
+
+    def release(self):
+        if self._fd is not None:
+            # closing the file releases the lock
+            os.close(self._fd)
+            self._fd = None
+        if self._thread_lock is not None:
+            self._thread_lock.release()
+            self._thread_lock = None
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
@@ -0,0 +1,302 @@
+'''
+This module contains the GlobalCatalog class, an index of the captures of many projects for lookups across
+projects. The catalog is a single SQLite file, the projects themselves are only read.
+Author: Sebastian Sander
+
+Usage:
+    python -m src.db.GlobalCatalog add [--recursive] <project_dir>...
+    python -m src.db.GlobalCatalog remove <project_dir>...
+    python -m src.db.GlobalCatalog scan
+    python -m src.db.GlobalCatalog projects
+    python -m src.db.GlobalCatalog search [--genus Carabus] [--museum ...] [--date 2025] [--page 0]
+'''
+
+import csv
+import json
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+import pyarrow.parquet as pq
+
+from src.db.FileCache import FileCache
+from src.db.JsonCatalog import CSV_SCHEMA, get_csv_header
+from src.db.SQLiteCatalog import SQLiteCatalog, CAPTURE_COLUMNS
+from src.db.SearchIndex import SEARCH_FIELDS
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_FILE = Path.home() / '.drawerCapture' / 'global_catalog.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    root TEXT PRIMARY KEY,
+    name TEXT,
+    num_captures INTEGER NOT NULL DEFAULT 0,
+    scanned TEXT
+);
+CREATE TABLE IF NOT EXISTS sources (
+    root TEXT NOT NULL REFERENCES projects(root) ON DELETE CASCADE,
+    source TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    PRIMARY KEY (root, source)
+);
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    root TEXT NOT NULL REFERENCES projects(root) ON DELETE CASCADE,
+    source TEXT NOT NULL,
+    session_name TEXT COLLATE NOCASE,
+    collection_name TEXT COLLATE NOCASE,
+    "order" TEXT COLLATE NOCASE,
+    family TEXT COLLATE NOCASE,
+    genus TEXT COLLATE NOCASE,
+    species TEXT COLLATE NOCASE,
+    museum TEXT COLLATE NOCASE,
+    capturer TEXT COLLATE NOCASE,
+    path TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_captures_source ON captures(root, source);
+CREATE INDEX IF NOT EXISTS idx_captures_order ON captures("order");
+CREATE INDEX IF NOT EXISTS idx_captures_family ON captures(family);
+CREATE INDEX IF NOT EXISTS idx_captures_genus ON captures(genus);
+CREATE INDEX IF NOT EXISTS idx_captures_species ON captures(species);
+CREATE INDEX IF NOT EXISTS idx_captures_museum ON captures(museum);
+CREATE INDEX IF NOT EXISTS idx_captures_timestamp ON captures(timestamp);
+"""
+
+
+def find_projects(directory):
+    """
+    Returns the project directories below directory, the directories with a .project folder.
+    """
+    return sorted(project_data_dir.parent for project_data_dir in Path(directory).rglob('.project')
+                  if project_data_dir.is_dir())
+
+
+class GlobalCatalog:
+    """
+    Index of the captures of many projects.
+
+    Projects are registered by their root directory and scanned incrementally: the capture table of a project is
+    read per source file (a Parquet partition per session, the catalog.db of SQLite projects or the captures.csv
+    of older projects) and a source is only read again if its mtime or size changed since the last scan.
+    Queries use the same search fields as SearchIndex and are answered from the index file alone.
+
+    Args:
+        catalog_file (Path): the index file, DEFAULT_CATALOG_FILE by default.
+    """
+    COLUMNS = list(CSV_SCHEMA.keys())
+
+    def __init__(self, catalog_file=None):
+        self.catalog_file = Path(catalog_file) if catalog_file is not None else DEFAULT_CATALOG_FILE
+        self.catalog_file.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(self.catalog_file)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def register(self, project_dir, scan=True):
+        """
+        Adds a project to the catalog and scans it.
+        """
+        root = Path(project_dir).resolve()
+        if not (root / '.project').is_dir():
+            raise FileNotFoundError(f"{root} is not a project directory")
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO projects (root, name) VALUES (?, ?)", (root.as_posix(), root.name))
+        if scan:
+            return self.scan(root)
+
+    def unregister(self, project_dir):
+        with self.conn:
+            self.conn.execute("DELETE FROM projects WHERE root = ?", (Path(project_dir).resolve().as_posix(),))
+
+    def projects(self):
+        """
+        Returns the registered projects with their name, number of captures and the time of the last scan.
+        """
+        rows = self.conn.execute("SELECT root, name, num_captures, scanned FROM projects ORDER BY name, root")
+        return [{'root': root, 'name': name, 'num_captures': num_captures, 'scanned': scanned}
+                for root, name, num_captures, scanned in rows]
+
+    def scan(self, project_dir=None):
+        """
+        Updates the index from the changed source files of one or all registered projects.
+
+        Returns:
+            dict: the number of sources read and removed.
+        """
+        if project_dir is None:
+            roots = [Path(project['root']) for project in self.projects()]
+        else:
+            roots = [Path(project_dir).resolve()]
+        stats = {'read': 0, 'removed': 0}
+        for root in roots:
+            if not (root / '.project').is_dir():
+                logger.warning(f"Skipping {root}, the project does not exist anymore")
+                continue
+            read, removed = self._scan_project(root)
+            stats['read'] += read
+            stats['removed'] += removed
+        return stats
+
+    def search_captures(self, page=0, page_size=50, date=None, date_from=None, date_to=None, project=None, **criteria):
+        """
+        Searches the captures of all projects, see SearchIndex.search for the criteria.
+
+        Args:
+            project (str): name or root directory of a project to restrict the search to.
+
+        Returns:
+            dict: total number of matches, the page, the page size and the captures of the page. Every capture
+            carries the name and the root directory of its project.
+        """
+        conditions, params = [], []
+        for field, values in criteria.items():
+            if field not in SEARCH_FIELDS:
+                raise ValueError(f"Unknown search field {field}, use one of {', '.join(SEARCH_FIELDS)}")
+            if values is None:
+                continue
+            values = list(values) if isinstance(values, (list, tuple, set)) else [values]
+            conditions.append(f"c.{CAPTURE_COLUMNS[SEARCH_FIELDS[field]]} IN ({', '.join('?' * len(values))})")
+            params.extend(str(value).strip() for value in values)
+        # dates are ISO strings, a prefix p covers all timestamps from p up to p + '\uffff'
+        for prefix, operator in ((date, '>='), (date_from, '>='), (date, '<='), (date_to, '<=')):
+            if prefix:
+                conditions.append(f"c.timestamp {operator} ?")
+                params.append(prefix if operator == '>=' else prefix + '\uffff')
+        if project is not None:
+            conditions.append("(p.name = ? OR p.root = ?)")
+            params.extend([project, project])
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"FROM captures c JOIN projects p ON p.root = c.root{where}"
+        total = self.conn.execute(f"SELECT COUNT(*) {query}", params).fetchone()[0]
+        columns = ", ".join(f"c.{CAPTURE_COLUMNS[col]}" for col in GlobalCatalog.COLUMNS)
+        rows = self.conn.execute(f"SELECT p.name, p.root, {columns} {query} ORDER BY p.name, c.id LIMIT ? OFFSET ?",
+                                 params + [page_size, page * page_size])
+        captures = [{'project': row[0], 'projectDir': row[1], **dict(zip(GlobalCatalog.COLUMNS, row[2:]))} for row in rows]
+        return {'total': total, 'page': page, 'page_size': page_size, 'captures': captures}
+
+    def get_search_values(self, field):
+        column = CAPTURE_COLUMNS[SEARCH_FIELDS[field]]
+        rows = self.conn.execute(f"SELECT DISTINCT {column} FROM captures WHERE {column} IS NOT NULL AND {column} != '' "
+                                 f"ORDER BY {column}")
+        return [value for (value,) in rows]
+
+    def _scan_project(self, root):
+        sources = self._sources(root)
+        known = dict(self.conn.execute("SELECT source, signature FROM sources WHERE root = ?", (root.as_posix(),)))
+        changed = [source for source, signature in sources.items() if known.get(source) != signature]
+        removed = [source for source in known if source not in sources]
+        # read the changed sources before the transaction, the project may be written to meanwhile and
+        # a source that changed after its signature was taken is read again by the next scan
+        rows = {source: self._read_source(root, source) for source in changed}
+        name = self._project_name(root)
+        columns = ", ".join(CAPTURE_COLUMNS[col] for col in GlobalCatalog.COLUMNS)
+        with self.conn:
+            for source in changed + removed:
+                self.conn.execute("DELETE FROM captures WHERE root = ? AND source = ?", (root.as_posix(), source))
+                self.conn.execute("DELETE FROM sources WHERE root = ? AND source = ?", (root.as_posix(), source))
+            for source in changed:
+                self.conn.executemany(f"INSERT INTO captures (root, source, {columns}) VALUES (?, ?{', ?' * len(GlobalCatalog.COLUMNS)})",
+                                      [(root.as_posix(), source, *row) for row in rows[source]])
+                self.conn.execute("INSERT INTO sources (root, source, signature) VALUES (?, ?, ?)",
+                                  (root.as_posix(), source, sources[source]))
+            num_captures = self.conn.execute("SELECT COUNT(*) FROM captures WHERE root = ?", (root.as_posix(),)).fetchone()[0]
+            self.conn.execute("UPDATE projects SET name = ?, num_captures = ?, scanned = ? WHERE root = ?",
+                              (name, num_captures, datetime.now().isoformat().split(".")[0], root.as_posix()))
+        if changed or removed:
+            logger.info(f"Scanned {root}: {len(changed)} sources read, {len(removed)} removed")
+        return len(changed), len(removed)
+
+    def _sources(self, root):
+        # source file relative to root -> signature of its files
+        db_file = root / '.project' / SQLiteCatalog.DB_NAME
+        if db_file.is_file():
+            # the captures of a SQLite project may still be in its write ahead log
+            return {db_file.relative_to(root).as_posix(): json.dumps(FileCache.signature(db_file, f"{db_file}-wal"))}
+        store_dir = root / '.project' / 'captures'
+        if store_dir.is_dir():
+            return {partition.relative_to(root).as_posix(): json.dumps(FileCache.signature(partition))
+                    for partition in sorted(store_dir.glob('*.parquet'))}
+        csv_file = root / 'captures.csv'
+        if csv_file.is_file():
+            return {'captures.csv': json.dumps(FileCache.signature(csv_file))}
+        return {}
+
+    def _read_source(self, root, source):
+        path = root / source
+        if path.name == SQLiteCatalog.DB_NAME:
+            conn = sqlite3.connect(f"{path.as_uri()}?mode=ro", uri=True)
+            try:
+                columns = ", ".join(CAPTURE_COLUMNS[col] for col in GlobalCatalog.COLUMNS)
+                return conn.execute(f"SELECT {columns} FROM captures ORDER BY id").fetchall()
+            finally:
+                conn.close()
+        if path.suffix == '.parquet':
+            table = pq.read_table(path, columns=GlobalCatalog.COLUMNS)
+            return list(zip(*(table.column(col).to_pylist() for col in GlobalCatalog.COLUMNS)))
+        header = dict(zip(get_csv_header(), CSV_SCHEMA.keys()))
+        with path.open(newline='') as f:
+            rows = [{header[key]: value for key, value in row.items() if key in header} for row in csv.DictReader(f)]
+        return [tuple(row.get(col) or None for col in GlobalCatalog.COLUMNS) for row in rows]
+
+    def _project_name(self, root):
+        try:
+            return json.loads((root / '.project' / '.project.json').read_text()).get('name') or root.name
+        except (FileNotFoundError, json.JSONDecodeError):
+            return root.name
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Index and search the captures of many projects")
+    parser.add_argument('--catalog', type=Path, default=DEFAULT_CATALOG_FILE, help="the index file")
+    commands = parser.add_subparsers(dest='command', required=True)
+    add_parser = commands.add_parser('add', help="register and scan projects")
+    add_parser.add_argument('project_dirs', nargs='+', type=Path)
+    add_parser.add_argument('--recursive', action='store_true', help="register all projects below the directories")
+    remove_parser = commands.add_parser('remove', help="remove projects from the index")
+    remove_parser.add_argument('project_dirs', nargs='+', type=Path)
+    commands.add_parser('scan', help="update the index from the changed project files")
+    commands.add_parser('projects', help="list the registered projects")
+    search_parser = commands.add_parser('search', help="search the captures of all projects")
+    for field in SEARCH_FIELDS:
+        search_parser.add_argument(f"--{field}", action='append')
+    for field in ('date', 'date-from', 'date-to', 'project'):
+        search_parser.add_argument(f"--{field}")
+    search_parser.add_argument('--page', type=int, default=0)
+    search_parser.add_argument('--page-size', type=int, default=50)
+
+    args = parser.parse_args()
+    catalog = GlobalCatalog(args.catalog)
+    if args.command == 'add':
+        for directory in args.project_dirs:
+            for project_dir in (find_projects(directory) if args.recursive else [directory]):
+                catalog.register(project_dir)
+    elif args.command == 'remove':
+        for project_dir in args.project_dirs:
+            catalog.unregister(project_dir)
+    elif args.command == 'scan':
+        print(catalog.scan())
+    elif args.command == 'projects':
+        for project in catalog.projects():
+            print(f"{project['name']}\t{project['num_captures']}\t{project['scanned']}\t{project['root']}")
+    elif args.command == 'search':
+        criteria = {field: getattr(args, field) for field in SEARCH_FIELDS if getattr(args, field)}
+        result = catalog.search_captures(page=args.page, page_size=args.page_size, date=args.date,
+                                         date_from=args.date_from, date_to=args.date_to, project=args.project, **criteria)
+        for capture in result['captures']:
+            print("\t".join([capture['project'], capture['order'] or '', capture['genus'] or '', capture['species'] or '',
+                             capture['museum'] or '', capture['timestamp'] or '',
+                             (Path(capture['projectDir']) / capture['directory']).as_posix()]))
+        print(f"{result['total']} captures, page {args.page + 1}")
+    catalog.close()
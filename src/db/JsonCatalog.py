@@ -0,0 +1,298 @@
+'''
+This module contains the JsonCatalog class, the file based catalog backend of the FileAgnosticDB.
+The catalog keeps the structured project state (project info, sessions, museums and the capture table)
+in the plain JSON/CSV files below the project directory.
+Author: Sebastian Sander
+'''
+
+import copy
+import csv
+import json
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+
+
+from src.db.SessionJournal import SessionJournal
+from src.db.FileCache import FileCache, MISSING
+from src.db.CaptureStore import CaptureStore
+from src.db.Transaction import write_file, read_staged
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+CSV_SCHEMA = {
+        "sessionName": None,
+        "collectionName": None,
+        "order": None,
+        "family": None,
+        "genus": None,
+        "species": None,
+        "museum": None,
+        "capturer": None,
+        "directory": None,
+        "timestamp": None
+    }
+
+
+def get_csv_header():
+    return [key.title().replace("name", " Name") for key in CSV_SCHEMA.keys()]
+
+
+def create_csv_row(meta_info):
+    new_row = []
+    for col in CSV_SCHEMA.keys():
+        d = meta_info.get(col, None)
+        if not d:
+            if col == "collectionName":
+                d = 'General'
+            else:
+                continue
+        new_row.append(d)
+    time_stamp = datetime.now().isoformat().split(".")[0]
+    new_row.append(time_stamp)
+    return new_row
+
+
+class JsonCatalog:
+    """
+    Catalog backend that stores the project state in the JSON/CSV files of the project:
+
+        .project/.project.json   project info
+        .project/.sessions.json  sessions including their capture lists
+        .project/.sessions.journal  session mutations since the last compaction
+        .project/.museums.json   museums
+        .project/captures/       capture table, one Parquet file per session
+        captures.csv             CSV export of the capture table, written by export() and close()
+
+    Every catalog backend provides the same methods, so the FileAgnosticDB does not need to know
+    where the state lives.
+
+    Parsed project info, museums and sessions are kept in a FileCache and are only read again when the
+    mtime or size of their files changed, e.g. because another station edited the project.
+    """
+    name = 'json'
+    # the catalog has a single writer, see StationCatalog for several stations writing to one project
+    station = None
+
+    def __init__(self, idle_timeout=SessionJournal.IDLE_TIMEOUT):
+        self.project_root_dir = None
+        self.idle_timeout = idle_timeout
+        self.journal = None
+        self.store = None
+        self.cache = FileCache()
+
+    def create(self, project_dir, project_info):
+        self.close()
+        self.project_root_dir = Path(project_dir)
+        self._create_captures_csv()
+        project_data_dir = self.project_root_dir / '.project'
+        write_file(project_data_dir / '.sessions.json', '{}')
+        write_file(project_data_dir / '.sessions.journal', '')
+        write_file(project_data_dir / '.museums.json', '{}')
+        self._captures()
+        self.save_project_info(project_info)
+
+    def open(self, project_dir):
+        self.close()
+        self.project_root_dir = Path(project_dir)
+
+    def close(self):
+        if self.store is not None:
+            # the capture table was used, keep the csv export up to date
+            self.export()
+        self.close_journal()
+        self.cache.invalidate()
+        self.store = None
+        self.project_root_dir = None
+
+    def compact(self):
+        self._sessions().compact()
+
+    def export(self):
+        """
+        Writes the capture table to captures.csv, the json files are the catalog itself.
+        """
+        self._captures().export_csv(self.project_root_dir / 'captures.csv', get_csv_header(), sessions=list(self.load_sessions().keys()))
+
+    def save_captures(self, captures):
+        """
+        Replaces the capture table.
+
+        Args:
+            captures (dict): sid -> list of meta infos keyed like CSV_SCHEMA.
+        """
+        store = self._captures()
+        store.clear()
+        for sid, meta_infos in captures.items():
+            store.append(sid, meta_infos)
+
+    def cache_stats(self):
+        return self.cache.stats()
+
+    def lock(self, name):
+        """
+        Returns a context manager that excludes other writers from the operation name. There are no other
+        writers of a JsonCatalog.
+        """
+        return nullcontext()
+
+    def get_project_info(self):
+        project_file = self.project_root_dir / '.project' / '.project.json'
+        if not project_file.is_file():
+            raise FileNotFoundError(f"Project INI file missing at {project_file}")
+        return self._read_json(project_file)
+
+    def save_project_info(self, project_info):
+        self._write_json(self.project_root_dir / '.project/.project.json', project_info)
+
+    def load_sessions(self):
+        return self._sessions().snapshot()
+
+    def get_session(self, sid):
+        return self._sessions().get(sid)
+
+    def add_session(self, sid, session):
+        self._append('add_session', sid, session=session)
+
+    def update_session(self, sid, fields):
+        self._append('update_session', sid, fields=fields)
+
+    def remove_session(self, sid):
+        session = self.get_session(sid)
+        self._append('remove_session', sid)
+        self._captures().remove_session(sid)
+        self._add_to_capture_count(-session['num_captures'])
+        return session
+
+    def query_captures(self, columns=None, sessions=None, **filters):
+        return self._captures().query(columns=columns, sessions=sessions, **filters)
+
+    def add_capture(self, sid, capture_path, meta_info):
+        self._append('add_capture', sid, path=capture_path)
+        self._captures().append(sid, [meta_info])
+        self._add_to_capture_count(1)
+        return self.get_session(sid)
+
+    def add_captures(self, sid, captures):
+        """
+        Adds several captures of a session with one journal entry and one project info update.
+
+        Args:
+            captures (list): (capture_path, meta_info) tuples.
+        """
+        if captures:
+            self._append('add_captures', sid, paths=[capture_path for capture_path, _ in captures])
+            self._captures().append(sid, [meta_info for _, meta_info in captures])
+            self._add_to_capture_count(len(captures))
+        return self.get_session(sid)
+
+    def append_capture_row(self, meta_info):
+        # appends to the csv export only, the capture table is kept in the store
+        csv_file = self.project_root_dir / 'captures.csv'
+        with open(csv_file, 'a', newline='') as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(create_csv_row(meta_info))
+        logger.info("Finished updating captures csv")
+
+    def get_museums(self):
+        return self._read_json(self.project_root_dir / '.project' / '.museums.json')
+
+    def save_museums(self, museums):
+        self._write_json(self.project_root_dir / '.project' / '.museums.json', museums)
+
+    def save_sessions(self, sessions):
+        """
+        Replaces all sessions, e.g. when exporting another catalog.
+        """
+        self.close_journal()
+        sessions_file = self.project_root_dir / '.project' / '.sessions.json'
+        write_file(sessions_file, json.dumps(sessions, indent=2))
+        write_file(self.project_root_dir / '.project' / '.sessions.journal', '')
+
+    def close_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = None
+
+    def _add_to_capture_count(self, delta):
+        project_info = self.get_project_info()
+        project_info['num_captures'] = str(max(int(project_info['num_captures']) + delta, 0))
+        self.save_project_info(project_info)
+
+    def _read_json(self, path):
+        staged = read_staged(path)
+        if staged is not None:
+            return json.loads(staged)
+        signature = FileCache.signature(path)
+        data = self.cache.lookup(path, signature)
+        if data is MISSING:
+            data = json.loads(path.read_text())
+            self.cache.store(path, signature, data)
+        return copy.deepcopy(data)
+
+    def _write_json(self, path, data):
+        if write_file(path, json.dumps(data, indent=2)):
+            self.cache.store(path, FileCache.signature(path), copy.deepcopy(data))
+
+    def _journal_files(self):
+        project_data_dir = self.project_root_dir / '.project'
+        return project_data_dir / '.sessions.json', project_data_dir / '.sessions.journal'
+
+    def _sessions(self):
+        journal_files = self._journal_files()
+        if self.journal is None:
+            self.cache.invalidate('sessions')
+            self.journal = SessionJournal(*journal_files, idle_timeout=self.idle_timeout,
+                                          on_compacted=self._remember_sessions, on_appended=self._remember_sessions)
+        if self.cache.lookup('sessions', FileCache.signature(*journal_files)) is MISSING:
+            # first access or the sessions were changed outside of this catalog
+            self.journal.load()
+            self._remember_sessions()
+        return self.journal
+
+    def _append(self, op, sid, **data):
+        # the journal remembers the sessions once the entry is written, see _sessions
+        self._sessions().append(op, sid, **data)
+
+    def _remember_sessions(self):
+        self.cache.store('sessions', FileCache.signature(*self._journal_files()), True)
+
+    def _captures(self):
+        if self.store is None:
+            self.store = CaptureStore(self.project_root_dir / '.project' / 'captures', CSV_SCHEMA.keys())
+            if not self.store.exists():
+                self._import_captures_csv()
+        return self.store
+
+    def _import_captures_csv(self):
+        """
+        Fills the capture store of a project created before the store existed from its captures.csv.
+        """
+        self.store.create()
+        csv_file = self.project_root_dir / 'captures.csv'
+        if not csv_file.is_file():
+            return
+        header = dict(zip(get_csv_header(), CSV_SCHEMA.keys()))
+        session_dirs = {f"{session['session_dir']}/": sid for sid, session in self.load_sessions().items()}
+        captures = {}
+        with csv_file.open(newline='') as f:
+            for row in csv.DictReader(f):
+                meta_info = {header[key]: value for key, value in row.items() if key in header}
+                directory = meta_info.get('directory') or ''
+                sid = next((sid for session_dir, sid in session_dirs.items() if directory.startswith(session_dir)), None)
+                if sid is None:
+                    logger.warning(f"Skipping capture {directory}, it belongs to no session")
+                    continue
+                captures.setdefault(sid, []).append(meta_info)
+        for sid, meta_infos in captures.items():
+            self.store.append(sid, meta_infos)
+        logger.info(f"Imported {sum(len(meta_infos) for meta_infos in captures.values())} captures from {csv_file}")
+
+    def _create_captures_csv(self):
+        csv_file = self.project_root_dir / 'captures.csv'
+        with csv_file.open('w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(get_csv_header())
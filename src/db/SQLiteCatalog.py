@@ -0,0 +1,324 @@
+'''
+This module contains the SQLiteCatalog class, an embedded SQLite catalog backend for the FileAgnosticDB.
+The catalog keeps projects, sessions, captures and museums in .project/catalog.db. Every mutation is a single
+transaction, so adding a capture costs the same no matter how large the project is. The JSON/CSV files of the
+file based catalog are written by export() and can still be used by external tools.
+Author: Sebastian Sander
+'''
+
+import csv
+import json
+import sqlite3
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from src.db.JsonCatalog import JsonCatalog, CSV_SCHEMA, get_csv_header
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS projects (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    name TEXT,
+    num_captures INTEGER NOT NULL DEFAULT 0,
+    info TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    sid TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    session_dir TEXT NOT NULL,
+    num_captures INTEGER NOT NULL DEFAULT 0,
+    info TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS captures (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sid TEXT NOT NULL REFERENCES sessions(sid) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    session_name TEXT,
+    collection_name TEXT,
+    "order" TEXT,
+    family TEXT,
+    genus TEXT,
+    species TEXT,
+    museum TEXT,
+    capturer TEXT,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_captures_sid ON captures(sid);
+CREATE INDEX IF NOT EXISTS idx_captures_taxon ON captures("order", family, genus, species);
+CREATE INDEX IF NOT EXISTS idx_captures_species ON captures(species);
+CREATE INDEX IF NOT EXISTS idx_captures_timestamp ON captures(timestamp);
+CREATE TABLE IF NOT EXISTS museums (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    city TEXT NOT NULL,
+    info TEXT NOT NULL
+);
+"""
+
+# csv schema key -> captures column
+CAPTURE_COLUMNS = {
+    "sessionName": "session_name",
+    "collectionName": "collection_name",
+    "order": '"order"',
+    "family": "family",
+    "genus": "genus",
+    "species": "species",
+    "museum": "museum",
+    "capturer": "capturer",
+    "directory": "path",
+    "timestamp": "timestamp",
+}
+
+
+class SQLiteCatalog:
+    """
+    Catalog backend that stores the project state in an embedded SQLite database.
+
+    Provides the same methods as the JsonCatalog. Sessions are returned in the same dict layout as
+    in .sessions.json, including the list of capture paths.
+
+    The catalog is used by the GUI thread, the save thread and the derivative threads. Every thread gets a
+    connection of its own, so their transactions never interleave; sqlite serializes the writers.
+    """
+    name = 'sqlite'
+    DB_NAME = 'catalog.db'
+    station = None
+
+    def __init__(self):
+        self.project_root_dir = None
+        self.is_open = False
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    @property
+    def conn(self):
+        """
+        The connection of the calling thread, None if no project is open.
+        """
+        if not self.is_open:
+            return None
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def create(self, project_dir, project_info):
+        self.close()
+        self.project_root_dir = Path(project_dir)
+        for suffix in ('', '-wal', '-shm'):
+            Path(f"{self._db_file()}{suffix}").unlink(missing_ok=True)
+        self.is_open = True
+        with self.conn:
+            self.conn.execute("INSERT INTO projects (id, name, num_captures, info) VALUES (1, ?, ?, ?)",
+                              (project_info.get('name'), int(project_info.get('num_captures', 0)), json.dumps(project_info)))
+        self.export()
+
+    def open(self, project_dir):
+        self.close()
+        self.project_root_dir = Path(project_dir)
+        is_new = not self._db_file().is_file()
+        self.is_open = True
+        if is_new:
+            self._import_json_catalog()
+
+    def close(self):
+        if not self.is_open:
+            return
+        self.export()
+        self.is_open = False
+        with self._connections_lock:
+            # the connections of the other threads are not in use any more
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+    def export(self):
+        """
+        Writes the catalog to the JSON/CSV files of the file based catalog.
+        """
+        json_catalog = JsonCatalog()
+        json_catalog.open(self.project_root_dir)
+        json_catalog.save_project_info(self.get_project_info())
+        json_catalog.save_sessions(self.load_sessions())
+        json_catalog.save_museums(self.get_museums())
+        captures = {}
+        columns = ", ".join(CAPTURE_COLUMNS.values())
+        for row in self.conn.execute(f"SELECT sid, {columns} FROM captures ORDER BY id"):
+            captures.setdefault(row[0], []).append(dict(zip(CAPTURE_COLUMNS.keys(), row[1:])))
+        json_catalog.save_captures(captures)
+        json_catalog.export()
+        logger.info(f"Exported catalog to {self.project_root_dir}")
+
+    def cache_stats(self):
+        # sqlite keeps its own page cache
+        return {}
+
+    def lock(self, name):
+        # sqlite locks the database itself
+        return nullcontext()
+
+    def get_project_info(self):
+        row = self.conn.execute("SELECT info, num_captures FROM projects WHERE id = 1").fetchone()
+        if row is None:
+            raise FileNotFoundError(f"Project data missing in {self._db_file()}")
+        project_info = json.loads(row[0])
+        project_info['num_captures'] = str(row[1])
+        return project_info
+
+    def save_project_info(self, project_info):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO projects (id, name, num_captures, info) VALUES (1, ?, ?, ?)",
+                              (project_info.get('name'), int(project_info.get('num_captures', 0)), json.dumps(project_info)))
+
+    def load_sessions(self):
+        sessions = {}
+        for sid, num_captures, info in self.conn.execute("SELECT sid, num_captures, info FROM sessions ORDER BY rowid"):
+            session = json.loads(info)
+            session['num_captures'] = num_captures
+            session['captures'] = []
+            sessions[sid] = session
+        for sid, path in self.conn.execute("SELECT sid, path FROM captures ORDER BY id"):
+            sessions[sid]['captures'].append(path)
+        return sessions
+
+    def get_session(self, sid):
+        row = self.conn.execute("SELECT num_captures, info FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        if row is None:
+            return None
+        session = json.loads(row[1])
+        session['num_captures'] = row[0]
+        session['captures'] = [path for (path,) in self.conn.execute("SELECT path FROM captures WHERE sid = ? ORDER BY id", (sid,))]
+        return session
+
+    def add_session(self, sid, session):
+        with self.conn:
+            self._insert_session(sid, session)
+
+    def update_session(self, sid, fields):
+        session = self.get_session(sid)
+        session.update(fields)
+        with self.conn:
+            self.conn.execute("UPDATE sessions SET name = ?, session_dir = ?, info = ? WHERE sid = ?",
+                              (session['name'], session['session_dir'], self._session_info(session), sid))
+
+    def remove_session(self, sid):
+        session = self.get_session(sid)
+        with self.conn:
+            self.conn.execute("DELETE FROM captures WHERE sid = ?", (sid,))
+            self.conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+            self.conn.execute("UPDATE projects SET num_captures = MAX(num_captures - ?, 0) WHERE id = 1", (session['num_captures'],))
+        return session
+
+    def add_capture(self, sid, capture_path, meta_info):
+        with self.conn:
+            self._insert_capture(sid, capture_path, meta_info)
+            self.conn.execute("UPDATE sessions SET num_captures = num_captures + 1 WHERE sid = ?", (sid,))
+            self.conn.execute("UPDATE projects SET num_captures = num_captures + 1 WHERE id = 1")
+        return self.get_session(sid)
+
+    def add_captures(self, sid, captures):
+        with self.conn:
+            for capture_path, meta_info in captures:
+                self._insert_capture(sid, capture_path, meta_info)
+            self.conn.execute("UPDATE sessions SET num_captures = num_captures + ? WHERE sid = ?", (len(captures), sid))
+            self.conn.execute("UPDATE projects SET num_captures = num_captures + ? WHERE id = 1", (len(captures),))
+        return self.get_session(sid)
+
+    def query_captures(self, columns=None, sessions=None, **filters):
+        """
+        Reads the captures table like CaptureStore.query, columns and filters use the CSV_SCHEMA keys.
+        """
+        columns = list(columns) if columns is not None else list(CSV_SCHEMA.keys())
+        select = ", ".join(f"{CAPTURE_COLUMNS[col]} AS \"{col}\"" for col in columns)
+        conditions, params = [], []
+        if sessions is not None:
+            conditions.append(f"sid IN ({', '.join('?' * len(sessions))})")
+            params.extend(sessions)
+        for col, value in filters.items():
+            conditions.append(f"{CAPTURE_COLUMNS[col]} = ?")
+            params.append(value)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        return pd.read_sql_query(f"SELECT {select} FROM captures{where} ORDER BY id", self.conn, params=params)
+
+    def get_museums(self):
+        return {m_id: json.loads(info) for m_id, info in self.conn.execute("SELECT id, info FROM museums ORDER BY rowid")}
+
+    def save_museums(self, museums):
+        with self.conn:
+            self.conn.execute("DELETE FROM museums")
+            self.conn.executemany("INSERT INTO museums (id, name, city, info) VALUES (?, ?, ?, ?)",
+                                  [(m_id, m['name'], m['city'], json.dumps(m)) for m_id, m in museums.items()])
+
+    def _db_file(self):
+        return self.project_root_dir / '.project' / SQLiteCatalog.DB_NAME
+
+    def _connect(self):
+        # only used by the thread that opened it, closed by the thread that closes the catalog
+        conn = sqlite3.connect(self._db_file(), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _session_info(self, session):
+        info = {key: value for key, value in session.items() if key not in ('captures', 'num_captures')}
+        return json.dumps(info)
+
+    def _insert_session(self, sid, session):
+        self.conn.execute("INSERT INTO sessions (sid, name, session_dir, num_captures, info) VALUES (?, ?, ?, ?, ?)",
+                          (sid, session['name'], session['session_dir'], session.get('num_captures', 0), self._session_info(session)))
+
+    def _insert_capture(self, sid, capture_path, meta_info):
+        row = {CAPTURE_COLUMNS[key]: meta_info.get(key) for key in CSV_SCHEMA.keys()}
+        row['collection_name'] = meta_info.get('collectionName') or 'General'
+        row['path'] = capture_path
+        row['timestamp'] = meta_info.get('timestamp') or datetime.now().isoformat().split(".")[0]
+        columns = ", ".join(['sid'] + list(row.keys()))
+        placeholders = ", ".join(["?"] * (len(row) + 1))
+        self.conn.execute(f"INSERT INTO captures ({columns}) VALUES ({placeholders})", [sid] + list(row.values()))
+
+    def _import_json_catalog(self):
+        """
+        Fills a new catalog from the JSON/CSV files of an existing project.
+        """
+        logger.info(f"Importing json catalog of {self.project_root_dir}")
+        json_catalog = JsonCatalog()
+        json_catalog.open(self.project_root_dir)
+        # bring captures.csv up to date with the capture store
+        json_catalog.export()
+        rows = {}
+        csv_file = self.project_root_dir / 'captures.csv'
+        if csv_file.is_file():
+            with csv_file.open(newline='') as f:
+                for row in csv.DictReader(f):
+                    rows[row.get('Directory')] = row
+        header = dict(zip(get_csv_header(), CSV_SCHEMA.keys()))
+        project_info = json_catalog.get_project_info()
+        with self.conn:
+            self.conn.execute("INSERT INTO projects (id, name, num_captures, info) VALUES (1, ?, 0, ?)",
+                              (project_info.get('name'), json.dumps(project_info)))
+            for sid, session in json_catalog.load_sessions().items():
+                self._insert_session(sid, session)
+                for capture_path in session['captures']:
+                    row = rows.get(capture_path, {})
+                    meta_info = {header[key]: value for key, value in row.items() if key in header}
+                    meta_info.setdefault('sessionName', session['name'])
+                    self._insert_capture(sid, capture_path, meta_info)
+            self.conn.execute("UPDATE projects SET num_captures = (SELECT COUNT(*) FROM captures) WHERE id = 1")
+            museums = json_catalog.get_museums()
+            json_catalog.close()
+            self.conn.executemany("INSERT INTO museums (id, name, city, info) VALUES (?, ?, ?, ?)",
+                                  [(m_id, m['name'], m['city'], json.dumps(m)) for m_id, m in museums.items()])
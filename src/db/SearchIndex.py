@@ -0,0 +1,148 @@
+'''
+This module contains the SearchIndex class, an in-memory inverted index over the capture table of a project.
+Author: Sebastian Sander
+'''
+
+import bisect
+import threading
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+# search field -> column of the capture table
+SEARCH_FIELDS = {
+    'order': 'order',
+    'family': 'family',
+    'genus': 'genus',
+    'species': 'species',
+    'museum': 'museum',
+    'capturer': 'capturer',
+    'session': 'sessionName',
+    'collection': 'collectionName',
+}
+DATE_FIELD = 'timestamp'
+
+
+def normalize(value):
+    return str(value).strip().lower()
+
+
+class SearchIndex:
+    """
+    Inverted index of the captures of a project. Every search field maps its values to the set of captures
+    having that value, the capture dates are kept sorted so that years, months and date ranges are resolved
+    with a binary search. A query intersects the posting sets of its criteria, starting with the smallest one.
+
+    The index lives in memory, it is built from the capture table when the first search runs and is updated
+    with every capture added or session removed afterwards.
+    """
+
+    def __init__(self):
+        self.captures = []
+        self.directories = {}
+        self.postings = {field: {} for field in SEARCH_FIELDS}
+        self.dates = {}
+        self.sorted_dates = []
+        self._lock = threading.Lock()
+
+    def add(self, records):
+        """
+        Adds captures to the index, captures that are indexed already are skipped.
+
+        Args:
+            records (list): rows of the capture table, dicts keyed like CSV_SCHEMA.
+        """
+        with self._lock:
+            for record in records:
+                if record.get('directory') in self.directories:
+                    continue
+                doc = len(self.captures)
+                self.captures.append(dict(record))
+                self.directories[record.get('directory')] = doc
+                for field, column in SEARCH_FIELDS.items():
+                    if record.get(column):
+                        self.postings[field].setdefault(normalize(record[column]), set()).add(doc)
+                date = (record.get(DATE_FIELD) or '')[:10]
+                if date:
+                    if date not in self.dates:
+                        bisect.insort(self.sorted_dates, date)
+                    self.dates.setdefault(date, set()).add(doc)
+
+    def remove_prefix(self, prefix):
+        """
+        Removes all captures below the directory prefix, e.g. of a deleted session.
+        """
+        with self._lock:
+            removed = {doc for doc, record in enumerate(self.captures)
+                       if record is not None and (record.get('directory') or '').startswith(prefix)}
+            if not removed:
+                return
+            for doc in removed:
+                del self.directories[self.captures[doc].get('directory')]
+                self.captures[doc] = None
+            for index in (*self.postings.values(), self.dates):
+                for value in list(index):
+                    index[value] -= removed
+                    if not index[value]:
+                        del index[value]
+            self.sorted_dates = sorted(self.dates)
+
+    def values(self, field):
+        """
+        Returns the indexed values of a search field, e.g. to offer them in a combo box.
+        """
+        column = SEARCH_FIELDS[field]
+        with self._lock:
+            docs = [min(docs) for docs in self.postings[field].values()]
+            return sorted({self.captures[doc][column] for doc in docs})
+
+    def search(self, page=0, page_size=50, date=None, date_from=None, date_to=None, **criteria):
+        """
+        Returns the captures matching all criteria, in the order they were captured.
+
+        Args:
+            page (int): the page of results to return, starting with 0.
+            page_size (int): captures per page.
+            date (str): ISO date prefix, e.g. '2025', '2025-03' or '2025-03-14'.
+            date_from (str), date_to (str): inclusive ISO date range, prefixes like date.
+            **criteria: search field=value pairs, see SEARCH_FIELDS. A list of values matches any of them.
+                Values are matched case insensitive.
+
+        Returns:
+            dict: total number of matches, the page, the page size and the captures of the page.
+        """
+        for field in criteria:
+            if field not in SEARCH_FIELDS:
+                raise ValueError(f"Unknown search field {field}, use one of {', '.join(SEARCH_FIELDS)}")
+        with self._lock:
+            candidates = []
+            for field, values in criteria.items():
+                if values is None:
+                    continue
+                values = values if isinstance(values, (list, tuple, set)) else [values]
+                candidates.append(set().union(*(self.postings[field].get(normalize(value), set()) for value in values)))
+            if date is not None or date_from is not None or date_to is not None:
+                candidates.append(self._date_range(date, date_from, date_to))
+            if candidates:
+                candidates.sort(key=len)
+                docs = candidates[0].intersection(*candidates[1:])
+            else:
+                docs = {doc for doc, record in enumerate(self.captures) if record is not None}
+            docs = sorted(docs)
+            start = page * page_size
+            captures = [dict(self.captures[doc]) for doc in docs[start:start + page_size]]
+        return {'total': len(docs), 'page': page, 'page_size': page_size, 'captures': captures}
+
+    def _date_range(self, date, date_from, date_to):
+        # dates are ISO strings, a prefix p covers all dates from p up to p + '\uffff'
+        low = max(filter(None, (date, date_from)), default='')
+        high = min((prefix + '\uffff' for prefix in (date, date_to) if prefix), default=None)
+        start = bisect.bisect_left(self.sorted_dates, low)
+        end = len(self.sorted_dates) if high is None else bisect.bisect_right(self.sorted_dates, high)
+        return set().union(*(self.dates[day] for day in self.sorted_dates[start:end]))
+
+    def __len__(self):
+        with self._lock:
+            return sum(record is not None for record in self.captures)
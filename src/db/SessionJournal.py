@@ -0,0 +1,183 @@
+'''
+This module contains the SessionJournal class, which keeps the sessions of a project as an append-only journal.
+Author: Sebastian Sander
+'''
+
+import json
+import os
+import threading
+from pathlib import Path
+
+from src.db.Transaction import append_file, write_file
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+
+class SessionJournal:
+    """
+    Append-only journal for the sessions of a project.
+
+    Every mutation is appended as one JSON line to the journal file and applied to an in-memory view of the
+    sessions. The view is folded back into the plain sessions file by compact(), which runs after the journal
+    was idle for idle_timeout seconds and when the journal is closed. All operations are idempotent, so
+    replaying a journal on top of an already compacted sessions file gives the same view. Inside a transaction
+    the mutation is written and applied to the view on commit.
+
+    Args:
+        sessions_file (Path): the compacted sessions file (.sessions.json).
+        journal_file (Path): the journal file, one JSON object per line.
+        idle_timeout (float): seconds without mutation after which the journal is compacted. None disables it.
+        on_compacted (callable): called after the journal was folded into the sessions file.
+        on_appended (callable): called after a mutation was written to the journal.
+    """
+    IDLE_TIMEOUT = 5.0
+
+    def __init__(self, sessions_file, journal_file, idle_timeout=IDLE_TIMEOUT, on_compacted=None, on_appended=None):
+        self.sessions_file = Path(sessions_file)
+        self.journal_file = Path(journal_file)
+        self.idle_timeout = idle_timeout
+        self.on_compacted = on_compacted
+        self.on_appended = on_appended
+        self.sessions = {}
+        self.num_entries = 0
+        # sid -> set of the capture paths of the session, built with the first capture added to it
+        self._capture_paths = {}
+        self._lock = threading.RLock()
+        self._timer = None
+
+    def load(self):
+        """
+        Reads the sessions file and replays the journal on top of it.
+        """
+        if not self.sessions_file.is_file():
+            raise FileNotFoundError(f"Session data missing for {self.sessions_file}")
+        with self._lock:
+            self.sessions = json.loads(self.sessions_file.read_text())
+            self._capture_paths = {}
+            self.num_entries = 0
+            if self.journal_file.is_file():
+                with self.journal_file.open() as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except json.JSONDecodeError:
+                            # torn write of the last entry
+                            logger.warning(f"Skipping corrupted journal entry in {self.journal_file}")
+                            continue
+                        self._apply(entry)
+                        self.num_entries += 1
+        return self
+
+    def append(self, op, sid, **data):
+        """
+        Applies a mutation to the view and appends it to the journal.
+
+        Args:
+            op (str): one of add_session, update_session, remove_session, add_capture, add_captures.
+            sid (str): id of the session.
+            **data: arguments of the operation.
+        """
+        entry = {'op': op, 'sid': sid, **data}
+        append_file(self.journal_file, json.dumps(entry) + "\n", writer=self._write_entry)
+
+    def _write_entry(self, path, line):
+        with self._lock:
+            with open(path, 'ab') as f:
+                f.write(line)
+            # apply a decoded copy, so the view does not share objects with the caller
+            self._apply(json.loads(line))
+            self.num_entries += 1
+        if self.on_appended is not None:
+            self.on_appended()
+        self._schedule_compaction()
+
+    def snapshot(self):
+        """
+        Returns a copy of the sessions view, the callers may change it.
+        """
+        with self._lock:
+            return {sid: dict(session, captures=list(session['captures'])) for sid, session in self.sessions.items()}
+
+    def get(self, sid):
+        """
+        Returns a copy of a single session or None.
+        """
+        with self._lock:
+            session = self.sessions.get(sid)
+            if session is None:
+                return None
+            return dict(session, captures=list(session['captures']))
+
+    def compact(self):
+        """
+        Writes the view to the sessions file and truncates the journal.
+        """
+        with self._lock:
+            self._cancel_timer()
+            if not self.num_entries:
+                return
+            tmp_file = self.sessions_file.with_suffix('.tmp')
+            with tmp_file.open('w') as f:
+                f.write(json.dumps(self.sessions, indent=2))
+                # the journal is truncated next, the compacted sessions must be on disk first
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.sessions_file)
+            write_file(self.journal_file, '')
+            logger.info(f"Compacted {self.num_entries} journal entries into {self.sessions_file}")
+            self.num_entries = 0
+            if self.on_compacted is not None:
+                self.on_compacted()
+
+    def close(self):
+        self.compact()
+
+    def _apply(self, entry):
+        op = entry['op']
+        sid = entry['sid']
+        if op in ('add_session', 'update_session', 'remove_session'):
+            # the captures of the session may be replaced
+            self._capture_paths.pop(sid, None)
+        if op == 'add_session':
+            self.sessions[sid] = entry['session']
+        elif op == 'update_session':
+            if sid in self.sessions:
+                self.sessions[sid].update(entry['fields'])
+        elif op == 'remove_session':
+            self.sessions.pop(sid, None)
+        elif op == 'add_capture':
+            self._add_captures(sid, [entry['path']])
+        elif op == 'add_captures':
+            self._add_captures(sid, entry['paths'])
+        else:
+            raise ValueError(f"Unknown journal operation {op}")
+
+    def _add_captures(self, sid, paths):
+        session = self.sessions.get(sid)
+        if session is None:
+            return
+        captures = self._capture_paths.get(sid)
+        if captures is None:
+            captures = self._capture_paths[sid] = set(session['captures'])
+        for path in paths:
+            if path not in captures:
+                captures.add(path)
+                session['captures'].append(path)
+                session['num_captures'] += 1
+
+    def _schedule_compaction(self):
+        if self.idle_timeout is None:
+            return
+        with self._lock:
+            self._cancel_timer()
+            self._timer = threading.Timer(self.idle_timeout, self.compact)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
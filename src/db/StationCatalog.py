@@ -0,0 +1,312 @@
+'''
+This module contains the StationCatalog class, the catalog backend for several capture stations writing to one
+project, e.g. on a network share, and the StationJournal class, the merged view of the session journals of the
+stations.
+Author: Sebastian Sander
+'''
+
+import json
+import os
+import re
+import socket
+from pathlib import Path
+
+from src.db.JsonCatalog import JsonCatalog
+from src.db.SessionJournal import SessionJournal
+from src.db.FileCache import FileCache, MISSING
+from src.db.FileLock import FileLock, LockedError
+from src.db.Transaction import after_commit
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+
+def default_station():
+    """
+    Returns the station id of this computer, its host name.
+    """
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', socket.gethostname()) or 'station'
+
+
+class StationJournal(SessionJournal):
+    """
+    Session journal of one station in a project written by several stations.
+
+    Every station appends its mutations to a journal file of its own below journal_dir, so stations never write
+    to the same file. The sessions are the sessions file with the journals of all stations replayed on top
+    (merge on read). refresh() applies the lines the other stations appended since the last read.
+
+    Appends hold a shared lock on lock_file, so they run in parallel. compact() holds the exclusive lock: it folds
+    the journals of all stations into the sessions file and truncates them.
+
+    Args:
+        sessions_file (Path): the compacted sessions file (.sessions.json).
+        journal_dir (Path): the directory of the station journals.
+        station (str): id of this station.
+        lock_file (Path): the lock file of the sessions.
+        legacy_journal (Path): the journal of the single writer catalog, read and compacted as well.
+        idle_timeout (float): seconds without mutation after which the journals are compacted. None disables it.
+        on_compacted (callable): called after the journals were folded into the sessions file.
+        on_appended (callable): called after a mutation was written to the journal of the station.
+    """
+
+    def __init__(self, sessions_file, journal_dir, station, lock_file, legacy_journal=None,
+                 idle_timeout=SessionJournal.IDLE_TIMEOUT, on_compacted=None, on_appended=None):
+        super().__init__(sessions_file, Path(journal_dir) / f"{station}.journal", idle_timeout, on_compacted,
+                         on_appended)
+        self.journal_dir = Path(journal_dir)
+        self.lock_file = Path(lock_file)
+        self.legacy_journal = Path(legacy_journal) if legacy_journal is not None else None
+        # journal -> bytes applied to the view
+        self.offsets = {}
+        self.base_signature = None
+
+    def journals(self):
+        journals = sorted(self.journal_dir.glob('*.journal'))
+        if self.legacy_journal is not None and self.legacy_journal.is_file():
+            journals.insert(0, self.legacy_journal)
+        return journals
+
+    def load(self):
+        """
+        Reads the sessions file and replays the journals of all stations on top of it.
+        """
+        if not self.sessions_file.is_file():
+            raise FileNotFoundError(f"Session data missing for {self.sessions_file}")
+        with self._lock:
+            self.base_signature = FileCache.signature(self.sessions_file)
+            self.sessions = json.loads(self.sessions_file.read_text())
+            self._capture_paths = {}
+            self.offsets = {}
+            self.num_entries = 0
+            self._repair_own_journal()
+            self._read_journals()
+        return self
+
+    def refresh(self):
+        """
+        Applies the entries the other stations appended since the last read. The view is loaded again if the
+        journals were compacted in between.
+        """
+        with self._lock:
+            compacted = FileCache.signature(self.sessions_file) != self.base_signature
+            if compacted or any(FileCache.signature(journal)[0] is None or journal.stat().st_size < offset
+                                for journal, offset in self.offsets.items()):
+                return self.load()
+            self._read_journals()
+        return self
+
+    def _write_entry(self, path, line):
+        with self._lock:
+            with FileLock(self.lock_file, shared=True):
+                # the entries of the other stations are applied first, the own entry is not read back. A compaction
+                # by another station truncated the journals, the view is loaded again then
+                self.refresh()
+                with open(path, 'ab') as f:
+                    f.write(line)
+                self.offsets[path] = self.offsets.get(path, 0) + len(line)
+            self._apply(json.loads(line))
+            self.num_entries += 1
+        if self.on_appended is not None:
+            self.on_appended()
+        self._schedule_compaction()
+
+    def count_captures(self):
+        with self._lock:
+            return sum(session['num_captures'] for session in self.sessions.values())
+
+    def compact(self):
+        """
+        Folds the journals of all stations into the sessions file and truncates them.
+        """
+        with self._lock:
+            self._cancel_timer()
+            with FileLock(self.lock_file):
+                # nobody appends while the exclusive lock is held, the view is complete
+                self.load()
+                if not self.num_entries:
+                    return
+                self._write_sessions(self.sessions)
+                for journal in self.journals():
+                    # truncated at once, also inside a transaction, the entries are in the sessions file already
+                    with journal.open('r+b') as f:
+                        f.truncate(0)
+                self.base_signature = FileCache.signature(self.sessions_file)
+                self.offsets = {journal: 0 for journal in self.journals()}
+                logger.info(f"Compacted {self.num_entries} journal entries of all stations into {self.sessions_file}")
+                self.num_entries = 0
+        if self.on_compacted is not None:
+            self.on_compacted()
+
+    def replace(self, sessions):
+        """
+        Replaces all sessions, the journals of all stations are truncated.
+        """
+        with self._lock:
+            self._cancel_timer()
+            with FileLock(self.lock_file):
+                self._write_sessions(sessions)
+                for journal in self.journals():
+                    with journal.open('r+b') as f:
+                        f.truncate(0)
+                self.load()
+
+    def _write_sessions(self, sessions):
+        tmp_file = self.sessions_file.with_name(f".{self.sessions_file.name}.{os.getpid()}.tmp")
+        with tmp_file.open('w') as f:
+            f.write(json.dumps(sessions, indent=2))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, self.sessions_file)
+
+    def _read_journals(self):
+        for journal in self.journals():
+            offset = self.offsets.get(journal, 0)
+            with journal.open('rb') as f:
+                f.seek(offset)
+                data = f.read()
+            # a line another station is writing right now is read with the next refresh
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping corrupted journal entry in {journal}")
+                    continue
+                self._apply(entry)
+                self.num_entries += 1
+            self.offsets[journal] = offset + end
+
+    def _repair_own_journal(self):
+        # a torn last line of a crashed run would swallow the next entry of this station
+        if not self.journal_file.is_file():
+            self.journal_file.parent.mkdir(parents=True, exist_ok=True)
+            self.journal_file.touch()
+            return
+        data = self.journal_file.read_bytes()
+        if data and not data.endswith(b"\n"):
+            logger.warning(f"Dropping the torn last entry of {self.journal_file}")
+            with self.journal_file.open('r+b') as f:
+                f.truncate(data.rfind(b"\n") + 1)
+
+
+class StationCatalog(JsonCatalog):
+    """
+    File based catalog for several capture stations writing to the same project at the same time, e.g. on a
+    network share. The files are the files of the JsonCatalog plus
+
+        .project/stations/<station>.journal  session mutations of a station since the last compaction
+        .project/stations/<station>.lock     held by the station while it has the project open
+        .project/locks/                      lock files of the sessions and of the journals
+
+    Stations append to their own journal only and read the sessions merged from the journals of all stations,
+    so saves of different stations run in parallel. The captures of a session are numbered under the lock of
+    the session, which only serializes stations that capture into the same session. The capture count of the
+    project is computed from the sessions instead of being updated by every save. The transaction log and
+    the content index are kept per station as well.
+
+    The locks are advisory flock locks, they need a file system that supports them, e.g. a local disk or NFS.
+
+    Args:
+        station (str): id of the station, the host name by default. Two processes cannot open a project with
+            the same station id.
+        idle_timeout (float): seconds without mutation after which the journals are compacted.
+    """
+    name = 'station'
+
+    def __init__(self, station=None, idle_timeout=SessionJournal.IDLE_TIMEOUT):
+        super().__init__(idle_timeout=idle_timeout)
+        self.station = station or default_station()
+        self.station_lock = None
+
+    def create(self, project_dir, project_info):
+        # the catalog closes the previous project first, which releases its station lock
+        super().create(project_dir, project_info)
+        self._open_station(project_dir)
+
+    def open(self, project_dir):
+        super().open(project_dir)
+        try:
+            self._open_station(project_dir)
+        except RuntimeError:
+            super().close()
+            raise
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self._close_station()
+
+    def lock(self, name):
+        """
+        Exclusive lock of the operation name across all stations, e.g. the numbering of the captures of a session.
+        """
+        return FileLock(self.project_root_dir / '.project' / 'locks' / f"{name}.lock")
+
+    def export(self):
+        # the csv export is shared by the stations
+        with FileLock(self._lock_file()):
+            super().export()
+
+    def get_project_info(self):
+        project_info = super().get_project_info()
+        project_info['num_captures'] = str(self._sessions().count_captures())
+        return project_info
+
+    def remove_session(self, sid):
+        session = super().remove_session(sid)
+        # the removal is folded into the sessions file as soon as it is committed, no journal of another station
+        # may add it again
+        after_commit(self.compact)
+        return session
+
+    def save_sessions(self, sessions):
+        self._sessions().replace(sessions)
+        self._remember_sessions()
+
+    def _add_to_capture_count(self, delta):
+        # the count is computed from the sessions, see get_project_info
+        pass
+
+    def _journal_files(self):
+        project_data_dir = self.project_root_dir / '.project'
+        return (project_data_dir / '.sessions.json', project_data_dir / '.sessions.journal',
+                *sorted((project_data_dir / 'stations').glob('*.journal')))
+
+    def _lock_file(self):
+        return self.project_root_dir / '.project' / 'locks' / 'sessions.lock'
+
+    def _sessions(self):
+        project_data_dir = self.project_root_dir / '.project'
+        if self.journal is None:
+            self.cache.invalidate('sessions')
+            self.journal = StationJournal(project_data_dir / '.sessions.json', project_data_dir / 'stations',
+                                          self.station, self._lock_file(), legacy_journal=project_data_dir / '.sessions.journal',
+                                          idle_timeout=self.idle_timeout, on_compacted=self._remember_sessions,
+                                          on_appended=self._remember_sessions)
+            self.journal.load()
+            self._remember_sessions()
+        elif self.cache.lookup('sessions', FileCache.signature(*self._journal_files())) is MISSING:
+            # another station changed the sessions
+            self.journal.refresh()
+            self._remember_sessions()
+        return self.journal
+
+    def _open_station(self, project_dir):
+        project_data_dir = Path(project_dir) / '.project'
+        (project_data_dir / 'stations').mkdir(parents=True, exist_ok=True)
+        (project_data_dir / 'locks').mkdir(exist_ok=True)
+        self.station_lock = FileLock(project_data_dir / 'stations' / f"{self.station}.lock", blocking=False)
+        try:
+            self.station_lock.acquire()
+        except LockedError:
+            self.station_lock = None
+            raise RuntimeError(f"Station {self.station} has the project {project_dir} open already")
+
+    def _close_station(self):
+        if self.station_lock is not None:
+            self.station_lock.release()
+        self.station_lock = None
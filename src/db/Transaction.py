@@ -0,0 +1,379 @@
+'''
+This module contains the TransactionManager class, which groups the metadata file writes of one logical operation
+into a transaction, and the write_file/append_file/remove_file/after_commit functions used by the catalog to write
+files.
+Author: Sebastian Sander
+'''
+
+import base64
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+# no fsync at all, files are still replaced atomically
+FSYNC_NONE = 'none'
+# one fsync of the transaction log per transaction
+FSYNC_TRANSACTION = 'transaction'
+# one fsync of the transaction log per batch_size transactions (group commit)
+FSYNC_BATCH = 'batch'
+FSYNC_POLICIES = (FSYNC_NONE, FSYNC_TRANSACTION, FSYNC_BATCH)
+
+_local = threading.local()
+
+
+def write_file(path, data):
+    """
+    Replaces the content of path with data (str or bytes).
+
+    Inside a transaction the write is staged and applied on commit, otherwise the file is replaced at once by
+    writing a temporary file and renaming it.
+
+    Returns:
+        bool: True if the file was written, False if the write was staged.
+    """
+    data = data.encode() if isinstance(data, str) else bytes(data)
+    transaction = getattr(_local, 'transaction', None)
+    if transaction is not None:
+        transaction.writes[Path(path)] = data
+        return False
+    _replace(Path(path), data)
+    return True
+
+
+def append_file(path, data, writer=None):
+    """
+    Appends data (str or bytes) to path.
+
+    Inside a transaction the append is staged and applied on commit, after the writes of the transaction,
+    otherwise it is written at once. The append-only files keep an in-memory view of their entries: they pass a
+    writer, which is called with path and data instead of appending the data itself, and update their view
+    there, so a discarded transaction leaves neither the file nor the view changed.
+    """
+    data = data.encode() if isinstance(data, str) else bytes(data)
+    writer = writer or _append
+    transaction = getattr(_local, 'transaction', None)
+    if transaction is not None:
+        transaction.appends.append((Path(path), data, writer))
+        return
+    writer(Path(path), data)
+
+
+def remove_file(path):
+    """
+    Removes path, on commit if a transaction is active.
+    """
+    transaction = getattr(_local, 'transaction', None)
+    if transaction is not None:
+        transaction.writes[Path(path)] = None
+        return
+    Path(path).unlink(missing_ok=True)
+
+
+def after_commit(callback):
+    """
+    Calls callback once the transaction of the current thread is committed, at once if no transaction is active.
+    The callback is dropped with a discarded transaction.
+    """
+    transaction = getattr(_local, 'transaction', None)
+    if transaction is not None:
+        transaction.callbacks.append(callback)
+        return
+    callback()
+
+
+def read_staged(path):
+    """
+    Returns the content staged for path by the transaction of the current thread. None if nothing is staged,
+    REMOVED if the file is staged for removal.
+    """
+    transaction = getattr(_local, 'transaction', None)
+    if transaction is None or Path(path) not in transaction.writes:
+        return None
+    data = transaction.writes[Path(path)]
+    return REMOVED if data is None else data
+
+
+REMOVED = object()
+
+
+def _replace(path, data, sync=False):
+    # writers of other processes and threads, e.g. the stations of a shared project, write their own temporary file
+    tmp_file = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_file, 'wb') as f:
+        f.write(data)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+def _append(path, data):
+    with open(path, 'ab') as f:
+        f.write(data)
+
+
+def _fsync(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except FileNotFoundError:
+        return
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Transaction:
+    """
+    The file mutations of one logical operation, see TransactionManager.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        # path -> new content, None removes the file
+        self.writes = {}
+        # (path, data, writer) of the appends done in the transaction
+        self.appends = []
+        # called after the commit, see after_commit
+        self.callbacks = []
+
+    def is_empty(self):
+        return not self.writes and not self.appends
+
+
+class TransactionManager:
+    """
+    Group commit for the metadata files of a project.
+
+    The files written by one operation, e.g. adding a capture, are staged in a Transaction and applied together
+    on commit: a redo record with the new contents is appended to the transaction log and fsynced, then every
+    file is replaced by writing a temporary file and renaming it, without an fsync of its own. The applied files
+    are fsynced once per checkpoint, when the log grew larger than checkpoint_size and when the manager is closed;
+    the log is truncated afterwards. A crash between two checkpoints is repaired by recover(), which replays the
+    redo records of the log.
+
+    Files larger than inline_size, e.g. the capture partitions, are not copied into the log. Their new content is
+    written to a shadow file next to them, which is fsynced with the log and renamed to the file on commit; the
+    record refers to the shadow file. The paths in the log are relative to root_dir, so a moved project is
+    recovered in place.
+
+    Args:
+        log_file (Path): the transaction log.
+        fsync_policy (str): FSYNC_NONE (no log and no fsync), FSYNC_TRANSACTION (one fsync per transaction) or
+            FSYNC_BATCH (one fsync per batch_size transactions, a crash loses at most the last batch).
+        batch_size (int): transactions per fsync for FSYNC_BATCH.
+        checkpoint_size (int): log size in bytes that triggers a checkpoint.
+        root_dir (Path): the directory the logged paths are relative to, the directory of the log by default.
+        inline_size (int): files up to this size in bytes are logged with their content.
+    """
+    CHECKPOINT_SIZE = 4 * 1024 * 1024
+    INLINE_SIZE = 64 * 1024
+
+    def __init__(self, log_file, fsync_policy=FSYNC_TRANSACTION, batch_size=8, checkpoint_size=CHECKPOINT_SIZE,
+                 root_dir=None, inline_size=INLINE_SIZE):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync_policy}, use one of {', '.join(FSYNC_POLICIES)}")
+        self.log_file = Path(log_file)
+        self.fsync_policy = fsync_policy
+        self.batch_size = batch_size
+        self.checkpoint_size = checkpoint_size
+        self.root_dir = Path(root_dir) if root_dir is not None else self.log_file.parent
+        self.inline_size = inline_size
+        self.stats = {'transactions': 0, 'files_written': 0, 'fsyncs': 0}
+        self._unsynced = set()
+        self._unsynced_commits = 0
+        # shadow files written since the last fsync of the log, with the files they replace
+        self._unsynced_shadows = []
+        self._num_shadows = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self, name=''):
+        """
+        Stages the file writes of the current thread until the block is left. The transaction is committed if the
+        block succeeds and discarded if it raises. Nested blocks join the outer transaction.
+        """
+        if getattr(_local, 'transaction', None) is not None:
+            yield _local.transaction
+            return
+        transaction = Transaction(name)
+        _local.transaction = transaction
+        try:
+            yield transaction
+        except BaseException:
+            logger.warning(f"Discarding transaction {name} with {len(transaction.writes)} staged writes and "
+                           f"{len(transaction.appends)} staged appends")
+            raise
+        finally:
+            _local.transaction = None
+        self.commit(transaction)
+        for callback in transaction.callbacks:
+            callback()
+
+    def commit(self, transaction):
+        if transaction.is_empty():
+            return
+        with self._lock:
+            shadows = {}
+            if self.fsync_policy != FSYNC_NONE:
+                shadows = self._write_shadows(transaction)
+                self._log(transaction, shadows)
+            for path, data in transaction.writes.items():
+                if data is None:
+                    path.unlink(missing_ok=True)
+                elif path in shadows:
+                    os.replace(shadows[path], path)
+                else:
+                    _replace(path, data)
+                self._unsynced.add(path)
+            for path, data, writer in transaction.appends:
+                writer(path, data)
+                self._unsynced.add(path)
+            self.stats['transactions'] += 1
+            self.stats['files_written'] += len(transaction.writes)
+            if self.fsync_policy != FSYNC_NONE and self.log_file.stat().st_size >= self.checkpoint_size:
+                self._checkpoint()
+
+    def checkpoint(self):
+        """
+        Makes the applied files durable and truncates the log.
+        """
+        with self._lock:
+            self._checkpoint()
+
+    def close(self):
+        self.checkpoint()
+
+    def recover(self):
+        """
+        Replays the redo records of the log after a crash. Returns the number of replayed transactions.
+        """
+        if not self.log_file.is_file():
+            return 0
+        replayed = 0
+        with self._lock:
+            with self.log_file.open() as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # the transaction was not committed completely
+                        logger.warning(f"Skipping torn record in {self.log_file}")
+                        continue
+                    self._replay(record)
+                    replayed += 1
+            self._checkpoint()
+            # shadow files of transactions whose record was torn
+            for shadow in self.log_file.parent.rglob(f".*.{self._shadow_tag()}.*.redo"):
+                shadow.unlink(missing_ok=True)
+        if replayed:
+            logger.info(f"Replayed {replayed} transactions from {self.log_file}")
+        return replayed
+
+    def _write_shadows(self, transaction):
+        # path -> shadow file with the new content of the large files
+        shadows = {}
+        for path, data in transaction.writes.items():
+            if data is None or len(data) <= self.inline_size:
+                continue
+            self._num_shadows += 1
+            shadow = path.with_name(f".{path.name}.{self._shadow_tag()}.{self._num_shadows}.redo")
+            with open(shadow, 'wb') as f:
+                f.write(data)
+            shadows[path] = shadow
+            self._unsynced_shadows.append((shadow, path))
+        return shadows
+
+    def _shadow_tag(self):
+        # the shadow files of the logs of other stations are left alone
+        return self.log_file.name.strip('.').replace('.', '-')
+
+    def _log(self, transaction, shadows):
+        writes = {}
+        for path, data in transaction.writes.items():
+            if data is None:
+                writes[self._relative(path)] = None
+            elif path in shadows:
+                writes[self._relative(path)] = {'shadow': self._relative(shadows[path])}
+            else:
+                writes[self._relative(path)] = base64.b64encode(data).decode()
+        record = {
+            'name': transaction.name,
+            'writes': writes,
+            'appends': [[self._relative(path), base64.b64encode(data).decode()] for path, data, _ in transaction.appends],
+        }
+        with self.log_file.open('a') as f:
+            f.write(json.dumps(record) + "\n")
+            self._unsynced_commits += 1
+            if self.fsync_policy == FSYNC_TRANSACTION or self._unsynced_commits >= self.batch_size:
+                # the shadow files the records refer to are made durable first, the renamed ones under their new name
+                for shadow, path in self._unsynced_shadows:
+                    _fsync(shadow if shadow.exists() else path)
+                self.stats['fsyncs'] += len(self._unsynced_shadows)
+                self._unsynced_shadows.clear()
+                f.flush()
+                os.fsync(f.fileno())
+                self.stats['fsyncs'] += 1
+                self._unsynced_commits = 0
+
+    def _relative(self, path):
+        try:
+            return path.relative_to(self.root_dir).as_posix()
+        except ValueError:
+            # outside of the project, e.g. the credentials
+            return path.as_posix()
+
+    def _resolve(self, path):
+        return self.root_dir / path
+
+    def _checkpoint(self):
+        if self.fsync_policy == FSYNC_NONE:
+            self._unsynced.clear()
+            return
+        if not self._unsynced and not self._unsynced_commits:
+            return
+        for path in self._unsynced:
+            _fsync(path)
+        for directory in {path.parent for path in self._unsynced}:
+            # the renames are only durable once their directory is synced
+            _fsync(directory)
+        self.stats['fsyncs'] += len(self._unsynced) + len({path.parent for path in self._unsynced})
+        self._unsynced.clear()
+        self._unsynced_commits = 0
+        _replace(self.log_file, b'', sync=True)
+        self.stats['fsyncs'] += 1
+
+    def _replay(self, record):
+        for path, data in record['writes'].items():
+            path = self._resolve(path)
+            if data is None:
+                path.unlink(missing_ok=True)
+            elif isinstance(data, dict):
+                shadow = self._resolve(data['shadow'])
+                if not shadow.is_file():
+                    # renamed before the crash
+                    continue
+                os.replace(shadow, path)
+            else:
+                _replace(path, base64.b64decode(data))
+            self._unsynced.add(path)
+        for path, data in record['appends']:
+            # the append-only files may have been compacted since, so the lines are matched by content instead of
+            # their offset. Their entries are idempotent and keyed by unique ids, appending a line again is harmless.
+            path, data = self._resolve(path), base64.b64decode(data)
+            content = path.read_bytes() if path.is_file() else b''
+            if data in content:
+                continue
+            with open(path, 'r+b' if path.is_file() else 'wb') as f:
+                # drop a torn last line, it would swallow the restored one
+                f.truncate(content.rfind(b"\n") + 1)
+                f.seek(0, os.SEEK_END)
+                f.write(data)
+            self._unsynced.add(path)
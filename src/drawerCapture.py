@@ -27,9 +27,13 @@ from src.widgets.CaptureView import CaptureView
 from src.widgets.ImageWidget import ImageWidget
 from src.widgets.PreviewPanel import PreviewPanel
 from src.widgets.SelectCameraListWidget import SelectCameraListWidget
-from src.db.DB import DBAdapter, FileAgnosticDB, DummyDB
+from src.db.DB import DBAdapter, FileAgnosticDB, DummyDB, CATALOGS
+from src.utils.sidecar import SIDECAR_FORMATS, SIDECAR_YAML
+from src.threads.CameraThread import CAMERA_BACKENDS, close_sessions, set_backend
 from src.widgets.Project import (ProjectCreator, ProjectLoader, ProjectViewer, LoginWidget, 
-                                 UserManager, MuseumManager, UserSettings, SessionCreator, ProjectMerger) 
+                                 UserManager, MuseumManager, UserSettings, SessionCreator, ProjectMerger,
+                                 CaptureSearch, CatalogBrowser) 
+from src.db.GlobalCatalog import GlobalCatalog
 from src.utils.searching import init_taxonomy
 
 logging.config.fileConfig('configs/logging/logging.conf',
@@ -127,6 +131,10 @@ class MainWindow(QMainWindow):
             QIcon('assets/icons/museum.png'), "Manage Museums", self)
         self.merge_projects_action = QAction(
             QIcon('assets/icons/add.png'), "Merge Projects", self)
+        self.search_captures_action = QAction(
+            QIcon('assets/icons/folder.png'), "Search Captures", self)
+        self.global_catalog_action = QAction(
+            QIcon('assets/icons/open.png'), "Global Catalog", self)
 
         # User menu actions
         self.login_action = QAction(
@@ -161,6 +169,8 @@ class MainWindow(QMainWindow):
         self.project_menu.addAction(self.manage_museums_action)
         self.project_menu.addSeparator()
         self.project_menu.addAction(self.merge_projects_action)
+        self.project_menu.addAction(self.search_captures_action)
+        self.project_menu.addAction(self.global_catalog_action)
         
         self.user_menu.addAction(self.login_action)
         self.user_menu.addSeparator()
@@ -218,6 +228,9 @@ class MainWindow(QMainWindow):
         self.db_adapter.project_changed_signal.connect(self.capture_view.panel.set_image_dir)
         self.image_view.close_signal.connect(self.on_data_collected)
         self.merge_projects_action.triggered.connect(self.merge_projects)
+        self.search_captures_action.triggered.connect(self.search_captures)
+        self.global_catalog_action.triggered.connect(self.browse_global_catalog)
+        self.db_adapter.save_progress_signal.connect(self.on_save_progress)
         self.start_live_preview_action.triggered.connect(self.start_live_preview)
         self.dark_mode_action.triggered.connect(self.set_dark_mode)
         self.light_mode_action.triggered.connect(self.set_light_mode)
@@ -236,14 +249,32 @@ class MainWindow(QMainWindow):
     def exit_application(self):
         self.close()
 
+    def on_save_progress(self, stage, percent):
+        self.statusBar().showMessage(f"{stage} ({percent}%)", 3000)
+
+    def closeEvent(self, event):
+        # finish queued saves, closing the catalog writes back the exportable project files
+        self.db_adapter.wait_for_saves()
+        self.db.clear()
+        close_sessions()
+        super().closeEvent(event)
+
     def merge_projects(self):
-        source_project_adapter = DBAdapter(FileAgnosticDB())
+        source_project_adapter = DBAdapter(FileAgnosticDB(catalog=type(self.db.catalog)()))
         self.project_merger = ProjectMerger(target_project_adapter=self.db_adapter, 
                                             soure_project_adapter=source_project_adapter)
         self.setEnabled(False)
         self.project_merger.close_signal.connect(self.setEnabled)
         self.project_merger.show()
 
+    def search_captures(self):
+        self.capture_search = CaptureSearch(self.db_adapter)
+        self.capture_search.show()
+
+    def browse_global_catalog(self):
+        self.catalog_browser = CatalogBrowser(GlobalCatalog())
+        self.catalog_browser.show()
+
     def manage_museums(self):
         self.museum_manager = MuseumManager(self.db_adapter, self.db_adapter.get_current_user())
         self.museum_manager.show()
@@ -314,12 +345,14 @@ class MainWindow(QMainWindow):
             self.set_enabled_capture_features(False)
             self.set_enabled_user_features(False)
             self.new_session_action.setEnabled(False)
+            self.search_captures_action.setEnabled(False)
             self.stacked_widget.setCurrentWidget(self.project_view)
         if self.mode == 'Project Mode': # Project loaded
             self.set_enabled_project_features(True)
             self.set_enabled_capture_features(False)
             self.set_enabled_user_features(True)
             self.new_session_action.setEnabled(True)
+            self.search_captures_action.setEnabled(True)
             self.stacked_widget.setCurrentWidget(self.project_view)
         elif self.mode == 'Data Collection Mode': # image view active
             self.set_enabled_project_features(False)
@@ -327,6 +360,7 @@ class MainWindow(QMainWindow):
             self.set_enabled_user_features(False)
             self.set_enabled_admin_features(False)
             self.new_session_action.setEnabled(False)
+            self.search_captures_action.setEnabled(False)
             self.stacked_widget.setCurrentWidget(self.image_view)
         elif self.mode == 'Capture Mode': # capture view is active
             self.set_enabled_project_features(False)
@@ -334,6 +368,7 @@ class MainWindow(QMainWindow):
             self.set_enabled_user_features(False)
             self.set_enabled_admin_features(False)
             self.new_session_action.setEnabled(False)
+            self.search_captures_action.setEnabled(False)
             self.stacked_widget.setCurrentWidget(self.capture_view)
         self.update_ui_based_on_role()
         self.set_window_title()
@@ -377,6 +412,8 @@ class MainWindow(QMainWindow):
 
     def on_camera_selected(self, camera):
         self.camera_fetcher.close()
+        # the session of the previous camera is released
+        close_sessions()
         self.project_view.set_camera_data(camera)
         self.camera_connected = True
         self.capture_view.set_camera_data(camera)
@@ -426,20 +463,30 @@ if __name__ == '__main__':
                         help="set the style", default=styles[0])
     parser.add_argument('--geo-data', choices=['level-0', 'level-1'])
     parser.add_argument('--fs', type=int, default=1)
+    parser.add_argument('--catalog', choices=list(CATALOGS.keys()), default='json',
+                        help="catalog backend for the project state")
+    parser.add_argument('--sidecar', choices=list(SIDECAR_FORMATS.keys()), default=SIDECAR_YAML,
+                        help="format of the meta data sidecars of new captures")
+    parser.add_argument('--station', default=None,
+                        help="station id for the station catalog, the host name by default")
+    parser.add_argument('--camera', choices=list(CAMERA_BACKENDS.keys()), default='gphoto2',
+                        help="camera backend, the simulated camera needs no hardware")
 
     args = parser.parse_args()
+    catalog = CATALOGS[args.catalog](station=args.station) if args.catalog == 'station' else CATALOGS[args.catalog]()
+    set_backend(CAMERA_BACKENDS[args.camera]())
     if args.debug:
         logger.setLevel(level=logging.DEBUG)
         logger.debug("debug mode enabled")
         logger.info("loading taxonomy")
         taxonomy = init_taxonomy(TAXONOMY['test'])
-        db = FileAgnosticDB()
+        db = FileAgnosticDB(catalog=catalog, sidecar_format=args.sidecar)
     else:
         logger.setLevel(level=logging.INFO)
         logger.debug("debug mode disabled")
         logger.info("loading taxonomy")
         taxonomy = init_taxonomy(TAXONOMY['prod'])
-        db = FileAgnosticDB()
+        db = FileAgnosticDB(catalog=catalog, sidecar_format=args.sidecar)
     geo_data_dir = GEO[args.geo_data]
 
     app = QApplication(sys.argv)
@@ -2,7 +2,7 @@
 """
 Module: CameraFetcher
 Author: Sebastian Sander
-This module contains the `CameraFetcher` class, which is a subclass of `QThread`. It fetches connected cameras using gphoto2.
+This module contains the `CameraFetcher` class, which is a subclass of `QThread`. It fetches the cameras connected to the camera backend, with gphoto2 --auto-detect if the backend cannot detect them itself.
     - finished: A signal that is emitted when the camera fetching process is finished. The signal carries a list of connected cameras.
     - WAIT_TIME_MS (int): The maximum time to wait for the camera fetching process to finish.
     - proc (QProcess): The QProcess instance that runs the camera fetching process.
@@ -23,6 +23,8 @@ logging.config.fileConfig('configs/logging/logging.conf', disable_existing_logge
 
 from PyQt6.QtCore import pyqtSignal, QThread, QProcess
 
+from src.threads.CameraThread import get_backend
+
 logger = logging.getLogger(__name__)
 class CameraFetcher(QThread):
     """
@@ -56,6 +58,14 @@ class CameraFetcher(QThread):
         self.error = []
         cameras = []
         self.cameras_data = []
+        detected = get_backend().detect()
+        if detected is not None:
+            logger.info(f"fetching cameras of the {get_backend().name} backend")
+            # camera data as listed by gphoto2 --auto-detect, model and port
+            self.cameras_data = [f"{model}  {port}" for model, port in detected]
+            cameras = [model for model, _ in detected] or ['No cameras found']
+            self.finished.emit(cameras)
+            return
         if self.proc is None:
             logger.info("fetching cameras")
             self.proc = QProcess()
@@ -0,0 +1,120 @@
+"""
+Module: CameraSession.py
+Author: Sebastian Sander
+This module contains the interface of the camera backends: the CameraBackend class, which detects cameras and opens
+sessions, and the CameraSession class, an open connection to one camera. The gphoto2 backend is implemented in
+GPhoto2Camera.py, a simulated camera in SimulatedCamera.py.
+"""
+
+import threading
+from pathlib import Path
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+
+class CameraSessionError(RuntimeError):
+    pass
+
+
+class CameraSession:
+    """
+    An open connection to a camera. Previews and captures reuse the connection. The methods may be called from
+    different worker threads, the camera is used by one of them at a time.
+
+    Attributes:
+    -----------
+    model : str
+        The camera model as listed by the backend.
+    port : str
+        The camera port, e.g. usb:001,028.
+    previewing : bool
+        True while the camera is in live view, the next capture leaves it first.
+    """
+
+    def __init__(self, model, port):
+        self.model = model
+        self.port = port
+        self.previewing = False
+        self._lock = threading.RLock()
+
+    @property
+    def is_open(self):
+        raise NotImplementedError
+
+    def open(self):
+        """
+        Opens the connection if it is not open. Returns the session, raises CameraSessionError on failure.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def capture_preview(self):
+        """
+        Returns the next live view frame as JPEG bytes. The camera enters live view with the first call.
+        """
+        raise NotImplementedError
+
+    def stop_preview(self):
+        raise NotImplementedError
+
+    def trigger_capture(self):
+        """
+        Captures an image and returns its path on the camera.
+        """
+        raise NotImplementedError
+
+    def download(self, camera_path, target):
+        """
+        Downloads the image at camera_path to target and removes it from the camera.
+        """
+        raise NotImplementedError
+
+    def set_config(self, name, value):
+        raise NotImplementedError
+
+    def capture(self, target):
+        """
+        Leaves live view, captures an image and downloads it to target.
+
+        Returns:
+            Path: the downloaded image.
+        """
+        target = Path(target)
+        with self._lock:
+            self.stop_preview()
+            camera_path = self.trigger_capture()
+            self.download(camera_path, target)
+        logger.info(f"captured {camera_path} to {target}")
+        return target
+
+
+class CameraBackend:
+    """
+    Detects cameras and opens sessions to them.
+
+    Attributes:
+    -----------
+    name : str
+        The name of the backend, e.g. for the command line.
+    script_fallback : bool
+        True if the workers run the gphoto2 scripts when the backend cannot open a camera.
+    """
+    name = None
+    script_fallback = False
+
+    def detect(self):
+        """
+        Returns the connected cameras as (model, port) tuples, None if the backend cannot detect cameras.
+        """
+        raise NotImplementedError
+
+    def create_session(self, model, port):
+        """
+        Returns a new, unopened session of the camera.
+        """
+        raise NotImplementedError
@@ -2,17 +2,25 @@
 Module: CameraStreamer
 Author: Sebastian Sander
 This module contains the CameraStreamer class, which is a thread that streams video from a camera device.
+The live view frames are read in-process from the camera session, or from the MJPEG stream gphoto2 writes to a
+pipe, and decoded by a MJPEGDecoder. The loopback mode pipes the stream through ffmpeg into a video4linux
+loopback device instead, for other programs reading the device.
 """
 
 
 import logging
 import logging.config
+import re
+import threading
 import time
 
 from PyQt6.QtCore import pyqtSignal, QProcess, QThread, QObject
 from pathlib import Path
 
 from src.threads.CameraThread import CameraWorker
+from src.threads.CameraSession import CameraSessionError
+from src.threads.MJPEGDecoder import MJPEGDecoder
+from src.threads.FrameBuffer import FrameBuffer
 
 logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
@@ -21,77 +29,258 @@ logger = logging.getLogger(__name__)
 class CameraStreamerSignals(QObject):
     building_stream = pyqtSignal()
     stream_enabled = pyqtSignal(str)
+    preview_ready = pyqtSignal()
+    state_changed = pyqtSignal(str)
+    stream_failed = pyqtSignal(str)
 
 class CameraStreamer(CameraWorker):
     """
     A thread that streams video from a camera device.
 
+    The streamer runs through the states building -> ready -> streaming -> stopping -> idle. The stream is ready
+    with the first decoded frame, or in loopback mode when the stream script reports its first frame. The worker
+    blocks on the camera or on the output of the script while it waits, it never sleeps a fixed time or spins.
+    The frames are decoded on the thread of the decoder, the worker only reads them. At most fs frames per second
+    are decoded, the decoded frames are put into the frame buffer the preview panel takes them from. The camera
+    session is sampled by the worker, so its frames reach the decoder at fs already; the pipe delivers every frame
+    of the camera, there the decoder samples them.
+
     Attributes:
         streamRunning (pyqtSignal): A signal emitted when the video stream is running.
         buildingStream (pyqtSignal): A signal emitted when the video stream is being built.
         streamStopped (pyqtSignal): A signal emitted when the video stream has stopped.
+        preview_ready (pyqtSignal): A signal emitted with the first decoded frame.
+        state_changed (pyqtSignal): Emits the new state.
+        stream_failed (pyqtSignal): Emits the reason when the stream could not be started or broke down.
 
     Args:
+        fs (int): The sampling frequency in frames per second.
         cameraData (dict): A dictionary containing information about the camera device.
+        loopback (bool): Stream into the video4linux loopback device instead of decoding the frames.
+        frames (FrameBuffer): The buffer the decoded (ret, frame) tuples are put into.
 
     """
-    signals = CameraStreamerSignals()
-
-    def __init__(self, fs, cameraData=None):
+    IDLE = 'idle'
+    BUILDING = 'building'
+    READY = 'ready'
+    STREAMING = 'streaming'
+    STOPPING = 'stopping'
+
+    READY_TIMEOUT_MS = 30_000
+    RESET_TIMEOUT_MS = 5_000
+    # longest wait for output of the script before the stop request is checked again
+    WAIT_MS = 250
+    # ffmpeg reports the first frame written to the loopback device
+    READY_PATTERN = re.compile(r"frame=\s*[1-9]")
+    MAX_LOG_CHUNKS = 100
+
+    def __init__(self, fs, cameraData=None, loopback=False, frames=None):
         """
         Initializes the CameraStreamer object.
 
         Args:
+            fs (int): The sampling frequency in frames per second.
             cameraData (dict): A dictionary containing information about the camera device.
+            loopback (bool): Stream into the video4linux loopback device instead of decoding the frames.
+            frames (FrameBuffer): The buffer the decoded (ret, frame) tuples are put into.
 
         """
         logger.debug("initializing camera streamer")
         super().__init__(cameraData=cameraData)
-        self.fs = fs # sampling fqequency in milliseconds
-        self.config['--script'] = 'src/cmds/open_video_stream.bash'
-        self.config['--dir'] = self._get_device_dir().as_posix()
-        self.config['--fs'] = str(fs)
-        self.running = False
+        # every streamer has its own signals, the panel connects to them for each stream it starts
+        self.signals = CameraStreamerSignals()
+        self.fs = fs # sampling frequency in frames per second
+        self.frames = frames if frames is not None else FrameBuffer()
+        self.loopback = loopback
+        if loopback:
+            self.config['--script'] = 'src/cmds/open_video_stream.bash'
+            self.config['--fs'] = str(fs)
+        else:
+            self.config['--script'] = 'src/cmds/capture_movie.bash'
+        # the sampling frequency of the decoder is set for the stream in run
+        self.decoder = MJPEGDecoder(self._on_decoded)
+        self.state = CameraStreamer.IDLE
+        self._state_changed = threading.Condition()
+        self._stop_requested = threading.Event()
 
     def run(self):
         """
-        Enable connection to camera
+        Streams until stop_running is called or the stream breaks down.
 
         """
         logger.info("running camera streamer thread")
-        if not self.proc:
-            logger.debug("emitting building stream signal and configuring process")
-            self.signals.building_stream.emit()
-            self.proc = QProcess()
-            self.proc.readyReadStandardOutput.connect(self.printStdOut)
-            self.proc.setCurrentReadChannel(1)
-            self.proc.readyReadStandardError.connect(self.printStdErr)
-
-            logger.debug("starting video stream process")
-            logger.info("================ RUN CMD IN SUBPROC =================")
-            logger.info(" ".join(self._buildKwargs()))
-            self.proc.start('bash', self._buildKwargs())
-
-            started = self.proc.waitForStarted()
-            if not started:
-                logger.error("failed to start video stream process")
+        self._stop_requested.clear()
+        self._set_state(CameraStreamer.BUILDING)
+        self.signals.building_stream.emit()
+        try:
+            if self.open_session() is not None:
+                # sampled by _stream_in_process, a second throttle in the decoder would only add latency
+                self.decoder.fs = None
+                self.decoder.start()
+                self._stream_in_process()
+            elif not self.use_scripts():
+                self._fail(f"could not open {self.model} at {self.port}")
+            elif self.loopback:
+                self._stream_to_loopback()
+            else:
+                self.decoder.fs = self.fs
+                self.decoder.start()
+                self._stream_from_pipe()
+        finally:
+            self._set_state(CameraStreamer.STOPPING)
+            self.decoder.stop()
+            if self.session is not None:
+                self._stop_preview()
+            elif self.proc is not None:
                 self.quit()
+            self._set_state(CameraStreamer.IDLE)
 
-            self.proc.waitForReadyRead(-1)
-            time.sleep(6)
+    def _stream_from_pipe(self):
+        """
+        Runs the movie script, which writes the live view as MJPEG to its stdout, and decodes the frames until
+        stop_running is called.
+        """
+        self.proc = QProcess()
+        # stdout is the stream, only stderr is logged
+        self.proc.readyReadStandardError.connect(self.printStdErr)
+        self.proc.setReadChannel(QProcess.ProcessChannel.StandardOutput)
+
+        logger.debug("starting live view process")
+        logger.info(" ".join(self._buildKwargs()))
+        self.proc.start('bash', self._buildKwargs())
+        if not self.proc.waitForStarted():
+            self._fail("failed to start live view process")
+            return
+
+        deadline = time.monotonic() + CameraStreamer.READY_TIMEOUT_MS / 1000
+        while not self._stop_requested.is_set():
+            if self.state == CameraStreamer.BUILDING:
+                if 'error' in "".join(self.error_log).lower():
+                    self._fail(f"Error trying to connect to camera. {self.error_log}")
+                    return
+                if time.monotonic() > deadline:
+                    self._fail(f"no live view frame after {CameraStreamer.READY_TIMEOUT_MS} ms")
+                    return
+            if self.proc.state() == QProcess.ProcessState.NotRunning and not self.proc.bytesAvailable():
+                self._fail(f"live view process exited. {self.error_log[-1:]}")
+                return
+            # returns with the next chunk of the stream, the decoder becomes ready with the first frame
+            self.proc.waitForReadyRead(CameraStreamer.WAIT_MS)
+            self.decoder.feed(self.proc.readAllStandardOutput().data())
+            del self.error_log[:-CameraStreamer.MAX_LOG_CHUNKS]
+
+    def _stream_to_loopback(self):
+        """
+        Runs the stream script, which pipes the live view into the loopback device, until stop_running is called.
+        """
+        # the loopback device is only needed by the script
+        device_dir = self._get_device_dir()
+        if device_dir is None:
+            self._fail("no video4linux loopback device found")
+            return
+        self.config['--dir'] = device_dir.as_posix()
+        self.proc = QProcess()
+        self.proc.readyReadStandardOutput.connect(self.printStdOut)
+        self.proc.setCurrentReadChannel(1)
+        self.proc.readyReadStandardError.connect(self.printStdErr)
+
+        logger.debug("starting video stream process")
+        logger.info("================ RUN CMD IN SUBPROC =================")
+        logger.info(" ".join(self._buildKwargs()))
+        self.proc.start('bash', self._buildKwargs())
+        if not self.proc.waitForStarted():
+            self._fail("failed to start video stream process")
+            return
+
+        deadline = time.monotonic() + CameraStreamer.READY_TIMEOUT_MS / 1000
+        while not CameraStreamer.READY_PATTERN.search("".join(self.error_log)):
             if 'error' in "".join(self.error_log).lower():
-                logger.warning(f"Error trying to connect to camera. {self.error_log}")
-                self.quit()
-
-            logger.info("Camera connected")
-            self.signals.stream_enabled.emit(self.config['--dir'])
-            self.running = True
-            while self.running:
-                continue
-            self.quit()
+                self._fail(f"Error trying to connect to camera. {self.error_log}")
+                return
+            if self.proc.state() == QProcess.ProcessState.NotRunning:
+                self._fail(f"video stream process exited. {self.error_log}")
+                return
+            if time.monotonic() > deadline:
+                self._fail(f"video stream not ready after {CameraStreamer.READY_TIMEOUT_MS} ms")
+                return
+            if self._stop_requested.is_set():
+                return
+            # returns with the next output of the script, the slots append it to the log
+            self.proc.waitForReadyRead(CameraStreamer.WAIT_MS)
+
+        logger.info("Camera connected")
+        self._set_state(CameraStreamer.READY)
+        self.signals.stream_enabled.emit(self.config['--dir'])
+        self._set_state(CameraStreamer.STREAMING)
+        while not self._stop_requested.is_set():
+            if self.proc.state() == QProcess.ProcessState.NotRunning:
+                self._fail(f"video stream process exited. {self.error_log[-1:]}")
+                return
+            # the output is read on, a full pipe would block ffmpeg
+            self.proc.waitForReadyRead(CameraStreamer.WAIT_MS)
+            del self.error_log[:-CameraStreamer.MAX_LOG_CHUNKS]
+
+    def _stream_in_process(self):
+        """
+        Reads the live view frames through the camera session until stop_running is called.
+        """
+        logger.info("streaming live view through the camera session")
+        interval = 1 / self.fs if self.fs else 0
+        next_sample = time.monotonic()
+        while True:
+            # waits for the next sample, a stop request ends the wait
+            if self._stop_requested.wait(max(next_sample - time.monotonic(), 0)):
+                return
+            next_sample = time.monotonic() + interval
+            try:
+                # blocks until the camera delivers the next frame, the decoder decodes it meanwhile
+                self.decoder.submit(self.session.capture_preview())
+            except CameraSessionError as e:
+                self._fail(f"live view stopped: {e}")
+                return
+
+    def _on_decoded(self, ret, frame):
+        # called on the thread of the decoder
+        if self.state == CameraStreamer.BUILDING:
+            if not ret:
+                return
+            # ready with the first decoded frame
+            self._set_state(CameraStreamer.READY)
+            self.signals.preview_ready.emit()
+            self._set_state(CameraStreamer.STREAMING)
+        if self.state == CameraStreamer.STREAMING:
+            self.frames.put((ret, frame))
+
+    def _stop_preview(self):
+        try:
+            # the camera leaves live view, the session stays open for the next capture
+            self.session.stop_preview()
+        except CameraSessionError as e:
+            logger.warning(f"could not stop live view: {e}")
 
     def stop_running(self):
-        self.running = False
+        """
+        Asks the streamer to stop, it returns after the current frame. Can be called from any thread.
+        """
+        self._stop_requested.set()
+
+    def wait_for_state(self, states, timeout=None):
+        """
+        Blocks until the streamer is in one of the given states. Returns False if the timeout in seconds passed.
+        """
+        with self._state_changed:
+            return self._state_changed.wait_for(lambda: self.state in states, timeout)
+
+    def _set_state(self, state):
+        logger.debug(f"camera streamer {self.state} -> {state}")
+        with self._state_changed:
+            self.state = state
+            self._state_changed.notify_all()
+        self.signals.state_changed.emit(state)
+
+    def _fail(self, message):
+        logger.warning(message)
+        self.signals.stream_failed.emit(message)
 
     def quit(self):
         """
@@ -100,19 +289,21 @@ class CameraStreamer(CameraWorker):
         """
         logger.info("quitting camera streamer thread")
         self.wasRunning = False
-        logger.info("stopping video stream process")
-        self.proc.terminate()
-        self.proc.waitForFinished(1000)
-        self.proc = None
-        self.reset_camera()
+        if self.proc is not None:
+            logger.info("stopping video stream process")
+            self.proc.terminate()
+            self.proc.waitForFinished(1000)
+            self.proc = None
+            self.reset_camera()
         super().quit()
 
     def reset_camera(self):
         proc = QProcess()
         proc.start('gphoto2', ['--set-config','movie=0'])
         logger.info("resetting camera movie mode")
-        if proc.waitForFinished():
-            proc.terminate()
+        if not proc.waitForFinished(CameraStreamer.RESET_TIMEOUT_MS):
+            logger.warning(f"camera movie mode not reset within {CameraStreamer.RESET_TIMEOUT_MS} ms")
+            proc.kill()
 
     def _get_device_dir(self):
         """
@@ -2,16 +2,74 @@
 Module: CameraThread.py
 Author: Sebastian Sander
 This module contains the definition of the CameraWorker class, which is a QThread subclass for capturing images from a camera using gphoto2.
+The workers use the shared CameraSession of the camera, opened by the selected camera backend. The gphoto2
+backend falls back to the gphoto2 scripts in src/cmds if the libgphoto2 Python bindings are not installed.
 """
 
 import subprocess
+import threading
 import logging
 import logging.config
 from PyQt6.QtCore import QRunnable
 
+from src.threads.CameraSession import CameraSessionError
+from src.threads.GPhoto2Camera import GPhoto2Backend
+from src.threads.SimulatedCamera import SimulatedBackend
+
 logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
 logger = logging.getLogger(__name__)
 
+CAMERA_BACKENDS = {
+    GPhoto2Backend.name: GPhoto2Backend,
+    SimulatedBackend.name: SimulatedBackend
+}
+
+_backend = GPhoto2Backend()
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def set_backend(backend):
+    """
+    Selects the camera backend of all workers. The sessions of the previous backend are closed.
+    """
+    global _backend
+    close_sessions()
+    _backend = backend
+
+
+def get_backend():
+    return _backend
+
+
+def get_session(model, port):
+    """
+    Returns the open session of the camera, shared by all workers. None if the backend cannot open the camera.
+    """
+    if not model or not port:
+        return None
+    with _sessions_lock:
+        if (model, port) not in _sessions:
+            _sessions[(model, port)] = _backend.create_session(model, port)
+        session = _sessions[(model, port)]
+    try:
+        return session.open()
+    except CameraSessionError as e:
+        logger.warning(f"{e}{', falling back to the gphoto2 scripts' if _backend.script_fallback else ''}")
+        return None
+
+
+def close_sessions():
+    """
+    Closes the sessions of all cameras, e.g. when the application quits or another camera is selected.
+    """
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
+
+
 class CameraWorker(QRunnable):
     """
     A QThread subclass for capturing images from a camera using gphoto2.
@@ -26,6 +84,8 @@ class CameraWorker(QRunnable):
         A dictionary containing configuration options for gphoto2.
     proc : subprocess.Popen or None
         A subprocess object representing the gphoto2 process.
+    session : CameraSession or None
+        The open camera session, None if the scripts are used.
 
     Methods:
     --------
@@ -33,6 +93,10 @@ class CameraWorker(QRunnable):
         Sets the camera model and port based on the given cameraData string.
     getCameraDataAsString() -> str:
         Returns a string representation of the camera model and port.
+    open_session() -> CameraSession or None:
+        Returns the shared session of the camera, None if it cannot be opened.
+    use_scripts() -> bool:
+        Whether the gphoto2 scripts are run because there is no session.
     _stopGphoto2Slaves() -> None:
         Stops any running gphoto2 slave processes.
     _procFinished() -> None:
@@ -57,6 +121,7 @@ class CameraWorker(QRunnable):
         self.error_log = []
 
         self.proc = None
+        self.session = None
 
     def set_camera_data(self, model, port):
         """
@@ -87,6 +152,27 @@ class CameraWorker(QRunnable):
         """
         return f"Camera Name: {self.model}, Port: {self.port}"
 
+    def open_session(self):
+        """
+        Returns the shared session of the camera, None if it cannot be opened.
+
+        Returns:
+        --------
+        CameraSession or None
+        """
+        self.session = get_session(self.model, self.port)
+        return self.session
+
+    def use_scripts(self):
+        """
+        Whether the gphoto2 scripts are run because there is no session.
+
+        Returns:
+        --------
+        bool
+        """
+        return self.session is None and get_backend().script_fallback
+
     def _stopGphoto2Slaves(self):
         """
         Stops any running gphoto2 slave processes.
@@ -167,4 +253,6 @@ class CameraWorker(QRunnable):
         --------
         None
         """
-        self._stopGphoto2Slaves()
\ No newline at end of file
+        if self.session is None:
+            # the session stays open for the next worker
+            self._stopGphoto2Slaves()
\ No newline at end of file
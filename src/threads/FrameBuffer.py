@@ -0,0 +1,84 @@
+"""
+Module: FrameBuffer.py
+Author: Sebastian Sander
+This module contains the FrameBuffer class, a small ring buffer which hands the live view frames from the capture
+workers to the preview panel. The workers put frames at the sampling rate of the stream, the panel takes the latest
+frame at its own refresh rate. A full buffer drops its oldest frame, so a slow display loses frames instead of
+queueing them.
+"""
+
+import threading
+from collections import deque
+
+
+class FrameBuffer:
+    """
+    A bounded, thread-safe buffer of (ret, frame) tuples shared by one producer and one consumer.
+
+    Attributes:
+    -----------
+    capacity : int
+        The number of frames the buffer holds, 1 to 3 keeps the preview close to the camera.
+    stats : dict
+        put, taken and dropped frames, and the largest queue depth seen.
+    """
+    DEFAULT_CAPACITY = 2
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        if capacity < 1:
+            raise ValueError(f"The capacity of a frame buffer must be at least 1, got {capacity}")
+        self.capacity = capacity
+        self._frames = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._stats = {'put': 0, 'taken': 0, 'dropped': 0, 'max_depth': 0}
+
+    @property
+    def depth(self):
+        with self._lock:
+            return len(self._frames)
+
+    @property
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, depth=len(self._frames))
+
+    def put(self, frame):
+        """
+        Adds a frame, the oldest frame is dropped if the buffer is full. Never blocks the producer.
+        """
+        with self._lock:
+            if len(self._frames) == self.capacity:
+                self._stats['dropped'] += 1
+            self._frames.append(frame)
+            self._stats['put'] += 1
+            self._stats['max_depth'] = max(self._stats['max_depth'], len(self._frames))
+
+    def get(self):
+        """
+        Returns the oldest frame, None if the buffer is empty.
+        """
+        with self._lock:
+            if not self._frames:
+                return None
+            self._stats['taken'] += 1
+            return self._frames.popleft()
+
+    def get_latest(self):
+        """
+        Returns the newest frame and drops the older ones, None if the buffer is empty.
+        """
+        with self._lock:
+            if not self._frames:
+                return None
+            self._stats['dropped'] += len(self._frames) - 1
+            self._stats['taken'] += 1
+            frame = self._frames.pop()
+            self._frames.clear()
+            return frame
+
+    def clear(self):
+        """
+        Removes the frames of a previous stream, they do not count as dropped.
+        """
+        with self._lock:
+            self._frames.clear()
@@ -0,0 +1,146 @@
+"""
+Module: GPhoto2Camera.py
+Author: Sebastian Sander
+This module contains the gphoto2 camera backend. GPhoto2Session keeps one connection to a camera open through the
+libgphoto2 Python bindings. If the bindings are not installed or the camera cannot be opened, the workers fall back
+to the gphoto2 scripts in src/cmds.
+"""
+
+import logging
+import logging.config
+
+try:
+    import gphoto2 as gp
+except ImportError:
+    # the workers run the gphoto2 command line scripts instead
+    gp = None
+
+from src.threads.CameraSession import CameraSession, CameraBackend, CameraSessionError
+
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+
+class GPhoto2Session(CameraSession):
+    """
+    An open connection to a camera through libgphoto2. The camera is initialized once, so a capture costs no
+    process start and no re-enumeration of the USB bus.
+    """
+
+    def __init__(self, model, port):
+        super().__init__(model, port)
+        self.camera = None
+
+    @property
+    def is_open(self):
+        return self.camera is not None
+
+    def open(self):
+        if gp is None:
+            raise CameraSessionError("The gphoto2 Python bindings are not installed")
+        with self._lock:
+            if self.camera is not None:
+                return self
+            try:
+                camera = gp.Camera()
+                abilities_list = gp.CameraAbilitiesList()
+                abilities_list.load()
+                camera.set_abilities(abilities_list[abilities_list.lookup_model(self.model)])
+                port_info_list = gp.PortInfoList()
+                port_info_list.load()
+                camera.set_port_info(port_info_list[port_info_list.lookup_path(self.port)])
+                camera.init()
+            except gp.GPhoto2Error as e:
+                raise CameraSessionError(f"Could not open {self.model} at {self.port}: {e}") from e
+            self.camera = camera
+            self.previewing = False
+            logger.info(f"opened camera session for {self.model} at {self.port}")
+        return self
+
+    def close(self):
+        with self._lock:
+            if self.camera is None:
+                return
+            try:
+                if self.previewing:
+                    self._set_config('movie', 0)
+                self.camera.exit()
+            except gp.GPhoto2Error as e:
+                logger.warning(f"could not close the camera session cleanly: {e}")
+            self.camera = None
+            self.previewing = False
+            logger.info(f"closed camera session for {self.model} at {self.port}")
+
+    def capture_preview(self):
+        with self._lock:
+            camera_file = self._call(lambda camera: camera.capture_preview())
+            self.previewing = True
+            return bytes(memoryview(camera_file.get_data_and_size()))
+
+    def stop_preview(self):
+        with self._lock:
+            if self.camera is not None and self.previewing:
+                # leaves live view in-process, the scripts run gphoto2 --set-config movie=0 for it
+                self._call(lambda camera: self._set_config('movie', 0))
+            self.previewing = False
+
+    def trigger_capture(self):
+        with self._lock:
+            camera_path = self._call(lambda camera: camera.capture(gp.GP_CAPTURE_IMAGE))
+            return f"{camera_path.folder.rstrip('/')}/{camera_path.name}"
+
+    def download(self, camera_path, target):
+        folder, name = camera_path.rsplit('/', 1)
+        folder = folder or '/'
+        with self._lock:
+            camera_file = self._call(lambda camera: camera.file_get(folder, name, gp.GP_FILE_TYPE_NORMAL))
+            camera_file.save(str(target))
+            try:
+                self.camera.file_delete(folder, name)
+            except gp.GPhoto2Error as e:
+                # some bodies keep the image in a RAM buffer that cannot be deleted
+                logger.debug(f"could not delete {camera_path} on the camera: {e}")
+
+    def set_config(self, name, value):
+        with self._lock:
+            self._call(lambda camera: self._set_config(name, value))
+
+    def _set_config(self, name, value):
+        config = self.camera.get_config()
+        try:
+            widget = config.get_child_by_name(name)
+        except gp.GPhoto2Error:
+            logger.debug(f"{self.model} has no config {name}")
+            return
+        widget.set_value(value)
+        self.camera.set_config(config)
+
+    def _call(self, operation):
+        # a failed call usually means the camera was unplugged or switched off, the next call opens it again
+        self.open()
+        try:
+            return operation(self.camera)
+        except gp.GPhoto2Error as e:
+            self.close()
+            raise CameraSessionError(f"{self.model} at {self.port}: {e}") from e
+
+
+class GPhoto2Backend(CameraBackend):
+    """
+    Cameras connected by USB, controlled through libgphoto2. Without the Python bindings, cameras are detected and
+    controlled by the gphoto2 command line tools.
+    """
+    name = 'gphoto2'
+    script_fallback = True
+
+    def detect(self):
+        if gp is None:
+            return None
+        try:
+            return [(model, port) for model, port in gp.Camera.autodetect()]
+        except gp.GPhoto2Error as e:
+            logger.warning(f"could not detect cameras: {e}")
+            return []
+
+    def create_session(self, model, port):
+        return GPhoto2Session(model, port)
@@ -3,6 +3,7 @@ Module: ImageCapture
 Author: Sebastian Sander
 A module for capturing images from a camera.
 This module provides a thread-based approach to capturing images from a camera. It utilizes the PyQt6 library for handling signals and threads. The captured images can be saved to a specified directory with a unique name based on the current timestamp.
+The image is captured through the session of the camera backend if there is one, by the capture script otherwise.
 Classes:
 - ImageCapture: A thread for capturing images from a camera.
 Functions:
@@ -28,6 +29,7 @@ logging.config.fileConfig('configs/logging/logging.conf', disable_existing_logge
 from datetime import datetime
 from PyQt6.QtCore import pyqtSignal, QProcess, QObject
 from src.threads.CameraThread import CameraWorker
+from src.threads.CameraSession import CameraSessionError
 
 logger = logging.getLogger(__name__)
 
@@ -70,6 +72,12 @@ class ImageCapture(CameraWorker):
         self.quit()
 
     def _captureImage(self):
+        if self.open_session() is not None:
+            self._capture_in_process()
+            return
+        if not self.use_scripts():
+            self._handle_failure(f"could not open {self.model} at {self.port}")
+            return
         self.proc = QProcess()
         self.proc.readyReadStandardError.connect(self.printStdErr)
         self.proc.readyReadStandardOutput.connect(self.printStdOut)
@@ -89,7 +97,7 @@ class ImageCapture(CameraWorker):
 
         if not self.proc.waitForFinished(ImageCapture.WAIT_TIME_MS):
             # try to load image anyway
-            self.signals.img_captured.emit(f"{self.config['--image_dir']}/{self.config['--image_name']}{self.config['--image_format']}")
+            self.signals.img_captured.emit(self._image_path())
             self._handle_failure(f"image capture process did not finish in {ImageCapture.WAIT_TIME_MS} ms. {self.get_std_err()}")
             return
 
@@ -98,7 +106,21 @@ class ImageCapture(CameraWorker):
             return
 
         logger.info("image capture process finished")
-        self.signals.img_captured.emit(f"{self.config['--image_dir']}/{self.config['--image_name']}{self.config['--image_format']}")
+        self.signals.img_captured.emit(self._image_path())
+
+    def _capture_in_process(self):
+        logger.debug("capturing image through the camera session")
+        self.set_image_name()
+        try:
+            self.session.capture(self._image_path())
+        except CameraSessionError as e:
+            self._handle_failure(f"image capture failed: {e}")
+            return
+        logger.info("image capture finished")
+        self.signals.img_captured.emit(self._image_path())
+
+    def _image_path(self):
+        return f"{self.config['--image_dir']}/{self.config['--image_name']}{self.config['--image_format']}"
 
     def _handle_failure(self, message):
         logger.warning(message)
@@ -115,7 +137,8 @@ class ImageCapture(CameraWorker):
         Quits the image capture thread and emits the imageCaptured signal.
         """
         logger.info("quitting image capture worker")
-        self.proc.terminate()
+        if self.proc is not None:
+            self.proc.terminate()
 
 def handle_capture(response):
     print(response)
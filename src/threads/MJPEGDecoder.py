@@ -0,0 +1,331 @@
+"""
+Module: MJPEGDecoder.py
+Author: Sebastian Sander
+This module contains the MJPEGSplitter class, which splits the MJPEG live view stream of a camera into its JPEG
+frames on the JPEG markers, and the MJPEGDecoder class, which decodes the frames in a worker thread. Together they
+replace the gphoto2 -> ffmpeg -> v4l2loopback -> OpenCV chain of the preview. Run the module to compare the CPU
+time and latency of both:
+
+    python -m src.threads.MJPEGDecoder --frames 300
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+SOI = b'\xff\xd8'
+EOI = 0xD9
+SOS = 0xDA
+
+
+class MJPEGSplitter:
+    """
+    Splits a byte stream of concatenated JPEGs into frames. The marker segments of a frame are skipped by their
+    length, so the end of image marker of an embedded thumbnail does not end the frame. Bytes before a start of
+    image marker and truncated frames are dropped.
+
+    Attributes:
+    -----------
+    max_frame_bytes : int
+        Frames growing larger are dropped, the stream is searched for the next start of image marker.
+    dropped : int
+        The number of dropped truncated or oversized frames.
+    """
+    MAX_FRAME_BYTES = 32 * 1024 * 1024
+
+    def __init__(self, max_frame_bytes=MAX_FRAME_BYTES):
+        self.max_frame_bytes = max_frame_bytes
+        self.dropped = 0
+        self.buffer = bytearray()
+        # parse state of the frame at the start of the buffer
+        self.in_frame = False
+        self.pos = 0
+        self.in_scan = False
+
+    def feed(self, data):
+        """
+        Adds data of the stream and returns the frames completed by it.
+        """
+        self.buffer += data
+        frames = []
+        while True:
+            if not self.in_frame:
+                start = self.buffer.find(SOI)
+                if start < 0:
+                    # a trailing 0xff may be the first byte of the next start of image marker
+                    del self.buffer[:max(len(self.buffer) - 1, 0)]
+                    return frames
+                del self.buffer[:start]
+                self.in_frame, self.pos, self.in_scan = True, 2, False
+            end = self._parse()
+            if end is None:
+                if len(self.buffer) > self.max_frame_bytes:
+                    self._drop()
+                    continue
+                return frames
+            if end < 0:
+                self._drop()
+                continue
+            frames.append(bytes(self.buffer[:end]))
+            del self.buffer[:end]
+            self.in_frame = False
+
+    def _drop(self):
+        self.dropped += 1
+        del self.buffer[:2]
+        self.in_frame = False
+
+    def _parse(self):
+        # returns the length of the frame, None if it is incomplete, -1 if it is corrupted
+        buffer, size = self.buffer, len(self.buffer)
+        while True:
+            if self.in_scan:
+                # entropy coded data, 0xff is followed by a stuffed 0x00, a restart marker or a fill byte
+                i = buffer.find(b'\xff', self.pos)
+                while 0 <= i < size - 1 and (buffer[i + 1] == 0x00 or 0xD0 <= buffer[i + 1] <= 0xD7):
+                    i = buffer.find(b'\xff', i + 2)
+                if i < 0:
+                    self.pos = size
+                    return None
+                if i == size - 1:
+                    self.pos = i
+                    return None
+                self.pos = i
+                self.in_scan = False
+            if self.pos + 2 > size:
+                return None
+            if buffer[self.pos] != 0xFF:
+                return -1
+            marker = buffer[self.pos + 1]
+            if marker == 0xFF:
+                # fill byte
+                self.pos += 1
+                continue
+            if marker == EOI:
+                return self.pos + 2
+            if marker == 0xD8:
+                # the next frame starts, this one was truncated
+                return -1
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                self.pos += 2
+                continue
+            if self.pos + 4 > size:
+                return None
+            length = (buffer[self.pos + 2] << 8) | buffer[self.pos + 3]
+            if length < 2:
+                return -1
+            if self.pos + 2 + length > size:
+                return None
+            self.pos += 2 + length
+            if marker == SOS:
+                self.in_scan = True
+
+
+class MJPEGDecoder:
+    """
+    Decodes JPEG frames in a worker thread. The source feeds the stream or submits whole frames and never waits
+    for the decoder. When the decoder falls behind, the frames waiting for it are dropped undecoded and the newest
+    frame is decoded next, so the preview shows the latest frame and not a growing backlog. With a sampling
+    frequency, the decoder waits between two frames and only decodes the newest frame that arrived meanwhile.
+
+    Attributes:
+    -----------
+    on_frame : callable
+        Called on the worker thread with (ret, frame) for every decoded frame, frame is a BGR array.
+    fs : int
+        Decodes at most fs frames per second, None decodes every frame the decoder keeps up with.
+    stats : dict
+        received, decoded, dropped (undecoded) and failed (undecodable) frames.
+    sequence : int
+        The number of frames received before the frame on_frame is called with, read it in on_frame to tell which
+        frame of the stream was decoded.
+    """
+
+    def __init__(self, on_frame, max_frame_bytes=MJPEGSplitter.MAX_FRAME_BYTES, fs=None):
+        self.on_frame = on_frame
+        self.fs = fs
+        self.splitter = MJPEGSplitter(max_frame_bytes)
+        self.stats = {'received': 0, 'decoded': 0, 'dropped': 0, 'failed': 0}
+        self.sequence = None
+        # (sequence, jpeg) of the frame waiting for the worker
+        self._pending = None
+        self._stopping = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        with self._condition:
+            self._pending = None
+            self._stopping = False
+        # a frame left over from the previous stream is dropped
+        self.splitter = MJPEGSplitter(self.splitter.max_frame_bytes)
+        self._thread = threading.Thread(target=self._run, name='MJPEGDecoder', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """
+        Stops the worker after the frame it decodes. Frames waiting for it are dropped.
+        """
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def feed(self, data):
+        """
+        Adds data of a MJPEG stream, the completed frames are submitted.
+        """
+        for frame in self.splitter.feed(data):
+            self.submit(frame)
+
+    def submit(self, jpeg):
+        with self._condition:
+            if self._pending is not None:
+                self.stats['dropped'] += 1
+            self._pending = (self.stats['received'], jpeg)
+            self.stats['received'] += 1
+            self._condition.notify_all()
+
+    def _run(self):
+        interval = 1 / self.fs if self.fs else 0
+        next_sample = time.monotonic()
+        while True:
+            with self._condition:
+                # frames arriving before the next sample replace each other
+                self._condition.wait_for(lambda: self._stopping, max(next_sample - time.monotonic(), 0))
+                self._condition.wait_for(lambda: self._pending is not None or self._stopping)
+                if self._stopping:
+                    return
+                (self.sequence, jpeg), self._pending = self._pending, None
+            next_sample = time.monotonic() + interval
+            frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+            with self._condition:
+                self.stats['decoded' if frame is not None else 'failed'] += 1
+            try:
+                self.on_frame(frame is not None, frame)
+            except Exception:
+                logger.exception("failed to hand over a decoded frame")
+
+
+def benchmark(num_frames=150, size=(1024, 680), fps=30):
+    """
+    Streams num_frames synthetic live view frames at fps through a pipe into the in-process decoder and, if
+    ffmpeg is installed, through ffmpeg transcoding to rawvideo yuv420p like the loopback chain. The loopback
+    device and OpenCV reading it are emulated by the conversion of the raw frames to BGR. Without ffmpeg the
+    chain is emulated in-process: decode, conversion to yuv420p and back.
+
+    Returns:
+        dict: pipeline -> {'cpu_ms': CPU time per frame, 'latency_ms': mean latency from writing a frame to the
+        pipe until it is decoded, 'frames': decoded frames}.
+    """
+    from src.threads.SimulatedCamera import SimulatedSession
+
+    session = SimulatedSession('Simulated Camera', 'usb:sim', preview_size=size, latency={'preview': 0, 'open': 0})
+    jpegs = [session.capture_preview() for _ in range(min(num_frames, 30))]
+    width, height = size
+    results = {}
+
+    def stream(write, close):
+        # writes the frames at the frame rate of the camera, returns the write time of every frame
+        sent = []
+        start = time.perf_counter()
+        for i in range(num_frames):
+            delay = start + i / fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            sent.append(time.perf_counter())
+            write(jpegs[i % len(jpegs)])
+        close()
+        return sent
+
+    def run(name, consume, extra_cpu=lambda: 0.0):
+        read_fd, write_fd = os.pipe()
+        sent = []
+        writer = threading.Thread(target=lambda: sent.extend(stream(lambda data: os.write(write_fd, data),
+                                                                    lambda: os.close(write_fd))))
+        cpu_start = time.process_time()
+        writer.start()
+        received = consume(read_fd)
+        writer.join()
+        os.close(read_fd)
+        cpu = time.process_time() - cpu_start + extra_cpu()
+        latencies = [done - sent[i] for i, done in received]
+        results[name] = {'cpu_ms': 1000 * cpu / max(len(received), 1),
+                         'latency_ms': 1000 * sum(latencies) / max(len(latencies), 1),
+                         'frames': len(received)}
+
+    def in_process(read_fd):
+        received = []
+        # frames the decoder falls behind with are dropped, every decoded frame is paired with its own send time
+        decoder = MJPEGDecoder(lambda ret, frame: received.append((decoder.sequence, time.perf_counter())))
+        decoder.start()
+        while data := os.read(read_fd, 65536):
+            decoder.feed(data)
+        while decoder.stats['decoded'] + decoder.stats['dropped'] + decoder.stats['failed'] < decoder.stats['received']:
+            time.sleep(0.001)
+        decoder.stop()
+        return received
+
+    def emulated_chain(read_fd):
+        received = []
+        splitter = MJPEGSplitter()
+        while data := os.read(read_fd, 65536):
+            for jpeg in splitter.feed(data):
+                frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+                raw = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420).tobytes()
+                cv2.cvtColor(np.frombuffer(raw, np.uint8).reshape(height * 3 // 2, width), cv2.COLOR_YUV2BGR_I420)
+                received.append((len(received), time.perf_counter()))
+        return received
+
+    def ffmpeg_chain(read_fd):
+        received = []
+        proc = subprocess.Popen(['ffmpeg', '-loglevel', 'error', '-f', 'mjpeg', '-i', 'pipe:0',
+                                 '-f', 'rawvideo', '-pix_fmt', 'yuv420p', 'pipe:1'],
+                                stdin=read_fd, stdout=subprocess.PIPE)
+        frame_bytes = width * height * 3 // 2
+        while raw := proc.stdout.read(frame_bytes):
+            if len(raw) < frame_bytes:
+                break
+            cv2.cvtColor(np.frombuffer(raw, np.uint8).reshape(height * 3 // 2, width), cv2.COLOR_YUV2BGR_I420)
+            received.append((len(received), time.perf_counter()))
+        proc.wait()
+        return received
+
+    def children_cpu():
+        # only called where ffmpeg runs, resource is not available on every platform
+        import resource
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+
+    run('mjpeg (in-process)', in_process)
+    if shutil.which('ffmpeg'):
+        cpu_before = children_cpu()
+        run('ffmpeg rawvideo chain', ffmpeg_chain, lambda: children_cpu() - cpu_before)
+    else:
+        run('decode -> yuv420p -> decode (emulated chain)', emulated_chain)
+    return results
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Compare the in-process MJPEG decoder with the ffmpeg loopback chain")
+    parser.add_argument('--frames', type=int, default=150)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--size', type=int, nargs=2, default=[1024, 680])
+    args = parser.parse_args()
+    for name, result in benchmark(args.frames, tuple(args.size), args.fps).items():
+        print(f"{name:46}cpu {result['cpu_ms']:6.2f} ms/frame\tlatency {result['latency_ms']:6.2f} ms\t{result['frames']} frames")
@@ -0,0 +1,73 @@
+"""
+Module: MergeWorker.py
+Author: Sebastian Sander
+This module contains the MergeWorker class, a QRunnable that merges the sessions of a source project into the
+current project off the GUI thread.
+"""
+
+import threading
+import traceback
+import logging
+import logging.config
+from PyQt6.QtCore import QRunnable, QObject, pyqtSignal
+
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+
+class MergeSignals(QObject):
+    progress = pyqtSignal(int, int)
+    completed = pyqtSignal(dict, dict)
+    cancelled = pyqtSignal(dict, dict)
+    failed = pyqtSignal(str)
+
+
+class MergeWorker(QRunnable):
+    """
+    Runs FileAgnosticDB.merge_project and reports its progress.
+
+    Attributes:
+    -----------
+    db_manager : FileAgnosticDB
+        The target project.
+    source_adapter : DBAdapter
+        The adapter of the source project.
+    keep_empty_sessions : bool
+        Import sessions without captures.
+    link_files : bool
+        Link the images instead of copying them.
+    signals : MergeSignals
+        progress(imported, total), completed(project_info, sessions), cancelled(project_info, sessions)
+        and failed(message).
+    """
+
+    def __init__(self, db_manager, source_adapter, keep_empty_sessions, link_files=False):
+        super().__init__()
+        self.db_manager = db_manager
+        self.source_adapter = source_adapter
+        self.keep_empty_sessions = keep_empty_sessions
+        self.link_files = link_files
+        self.cancel_event = threading.Event()
+        self.signals = MergeSignals()
+
+    def cancel(self):
+        """
+        Stops the merge after the captures that are currently copied.
+        """
+        self.cancel_event.set()
+
+    def run(self):
+        logger.info(f"merging {self.source_adapter.get_project_dir()} in background")
+        try:
+            project_info, sessions = self.db_manager.merge_project(self.source_adapter, self.keep_empty_sessions,
+                                                                   progress=self.signals.progress.emit,
+                                                                   cancel_event=self.cancel_event,
+                                                                   link_files=self.link_files)
+        except Exception as e:
+            logger.error(f"merging {self.source_adapter.get_project_dir()} failed: {traceback.format_exc()}")
+            self.signals.failed.emit(str(e))
+            return
+        if self.cancel_event.is_set():
+            self.signals.cancelled.emit(project_info, sessions)
+        else:
+            self.signals.completed.emit(project_info, sessions)
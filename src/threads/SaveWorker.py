@@ -0,0 +1,61 @@
+"""
+Module: SaveWorker.py
+Author: Sebastian Sander
+This module contains the SaveWorker class, a QRunnable that stores a captured image and its meta data in the
+project database off the GUI thread.
+"""
+
+import traceback
+import logging
+import logging.config
+from PyQt6.QtCore import QRunnable, QObject, pyqtSignal
+
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+
+class SaveSignals(QObject):
+    progress = pyqtSignal(str, int)
+    completed = pyqtSignal(dict, str, dict)
+    failed = pyqtSignal(str)
+
+
+class SaveWorker(QRunnable):
+    """
+    Runs FileAgnosticDB.post_new_image for a single payload.
+
+    The worker is meant to be started on a QThreadPool with a single thread, so saves are written one after
+    the other in the order they were queued.
+
+    Attributes:
+    -----------
+    db_manager : FileAgnosticDB
+        The database the capture is written to.
+    payload : dict
+        The payload as passed to post_new_image (img_dir, meta_info, sid).
+    signals : SaveSignals
+        progress(stage, percent), completed(project_info, sid, session) and failed(message). Only the session
+        of the capture is sent back, not the whole sessions dict. A payload failing the validation is reported
+        by failed with the validation message.
+    """
+
+    def __init__(self, db_manager, payload):
+        super().__init__()
+        self.db_manager = db_manager
+        self.payload = payload
+        self.signals = SaveSignals()
+
+    def run(self):
+        logger.info(f"saving {self.payload.get('img_dir')} in background")
+        try:
+            project_info, session = self.db_manager.post_new_image(self.payload, progress=self.signals.progress.emit)
+        except Exception as e:
+            logger.error(f"saving {self.payload.get('img_dir')} failed: {traceback.format_exc()}")
+            self.signals.failed.emit(str(e))
+            return
+        if not project_info:
+            # the session is the validation message then
+            self.signals.failed.emit(f"{session}, {self.payload.get('img_dir')} was not saved")
+            return
+        sid = self.payload['sid']
+        self.signals.completed.emit(project_info, sid, session)
@@ -0,0 +1,247 @@
+"""
+Module: SimulatedCamera.py
+Author: Sebastian Sander
+This module contains the simulated camera backend. The simulated camera produces synthetic live view frames and
+full size JPEG captures with configurable latencies and injected failures, so the capture pipeline can be run and
+benchmarked without a camera:
+
+    python src/drawerCapture.py --camera simulated
+
+Run the module to measure the throughput of capturing and saving with the simulated camera:
+
+    python -m src.threads.SimulatedCamera --captures 50
+"""
+
+import random
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from src.threads.CameraSession import CameraSession, CameraBackend, CameraSessionError
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+# operation -> seconds, roughly the timings of a Sony Alpha body over USB
+SIMULATED_LATENCY = {
+    'open': 0.5,
+    'preview': 1 / 30,
+    'capture': 0.4,
+    'download': 0.3,
+}
+
+
+class SimulatedSession(CameraSession):
+    """
+    A simulated camera. Every capture is a distinct JPEG of capture_size pixels, so the captures of a session have
+    distinct content hashes.
+
+    Args:
+        model (str): the camera model.
+        port (str): the camera port.
+        preview_size (tuple): width and height of the live view frames.
+        capture_size (tuple): width and height of the captures.
+        latency (dict): operation -> seconds the operation takes, see SIMULATED_LATENCY.
+        failure_rate (dict): operation -> probability that the operation fails.
+        seed (int): seed of the failures and of the image noise.
+    """
+
+    def __init__(self, model, port, preview_size=(1024, 680), capture_size=(6000, 4000), latency=None,
+                 failure_rate=None, seed=None):
+        super().__init__(model, port)
+        self.preview_size = tuple(preview_size)
+        self.capture_size = tuple(capture_size)
+        self.latency = dict(SIMULATED_LATENCY, **(latency or {}))
+        self.failure_rate = dict(failure_rate or {})
+        self.random = random.Random(seed)
+        self.config = {}
+        self.stats = {'previews': 0, 'captures': 0, 'downloads': 0, 'failures': 0}
+        # camera path -> JPEG bytes of captures that were not downloaded yet
+        self.storage = {}
+        self.opened = False
+        self._forced_failures = {}
+        self._capture_base = None
+
+    @property
+    def is_open(self):
+        return self.opened
+
+    def fail_next(self, operation, count=1):
+        """
+        Makes the next count calls of operation fail.
+        """
+        with self._lock:
+            self._forced_failures[operation] = self._forced_failures.get(operation, 0) + count
+
+    def open(self):
+        with self._lock:
+            if self.opened:
+                return self
+            self._run('open')
+            self.opened = True
+            self.previewing = False
+            logger.info(f"opened simulated camera {self.model} at {self.port}")
+        return self
+
+    def close(self):
+        with self._lock:
+            self.opened = False
+            self.previewing = False
+            self.storage.clear()
+
+    def capture_preview(self):
+        with self._lock:
+            self.open()
+            self._run('preview')
+            self.previewing = True
+            self.stats['previews'] += 1
+            frame = self._preview_frame(self.stats['previews'])
+        return cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, 80])[1].tobytes()
+
+    def stop_preview(self):
+        with self._lock:
+            self.previewing = False
+
+    def trigger_capture(self):
+        with self._lock:
+            self.open()
+            self._run('capture')
+            self.stats['captures'] += 1
+            camera_path = f"/store_00010001/DCIM/100MSDCF/DSC{self.stats['captures']:05d}.JPG"
+            self.storage[camera_path] = self._capture_image(self.stats['captures'])
+        return camera_path
+
+    def download(self, camera_path, target):
+        with self._lock:
+            self.open()
+            if camera_path not in self.storage:
+                raise CameraSessionError(f"{camera_path} is not on the simulated camera")
+            self._run('download')
+            Path(target).write_bytes(self.storage.pop(camera_path))
+            self.stats['downloads'] += 1
+
+    def set_config(self, name, value):
+        with self._lock:
+            self.config[name] = value
+
+    def _run(self, operation):
+        # takes the latency of the operation, then fails it if a failure is due
+        if self.latency.get(operation):
+            time.sleep(self.latency[operation])
+        forced = self._forced_failures.get(operation, 0)
+        if forced:
+            self._forced_failures[operation] = forced - 1
+        if forced or self.random.random() < self.failure_rate.get(operation, 0):
+            self.stats['failures'] += 1
+            if operation != 'open':
+                # like a camera that was unplugged, the session has to be opened again
+                self.opened = False
+            raise CameraSessionError(f"Simulated {operation} failure of {self.model} at {self.port}")
+
+    def _preview_frame(self, number):
+        # a gradient with a bar that moves with the frame number
+        width, height = self.preview_size
+        frame = np.empty((height, width, 3), dtype=np.uint8)
+        frame[..., 0] = np.linspace(0, 255, width, dtype=np.uint8)[None, :]
+        frame[..., 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+        frame[..., 2] = 96
+        x = (number * 8) % width
+        frame[:, x:x + 16] = 255
+        return frame
+
+    def _capture_image(self, number):
+        if self._capture_base is None or self._capture_base.shape[:2] != self.capture_size[::-1]:
+            width, height = self.capture_size
+            rng = np.random.default_rng(self.random.randrange(2 ** 32))
+            base = np.empty((height, width, 3), dtype=np.uint8)
+            base[..., 0] = np.linspace(0, 255, width, dtype=np.uint8)[None, :]
+            base[..., 1] = np.linspace(0, 255, height, dtype=np.uint8)[:, None]
+            base[..., 2] = rng.integers(0, 64, (height, width), dtype=np.uint8)
+            self._capture_base = base
+        image = self._capture_base.copy()
+        # the capture number makes every capture distinct
+        cv2.putText(image, f"{number:05d}", (image.shape[1] // 10, image.shape[0] // 2), cv2.FONT_HERSHEY_SIMPLEX,
+                    image.shape[0] / 200, (255, 255, 255), max(image.shape[0] // 100, 1))
+        return cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 95])[1].tobytes()
+
+
+class SimulatedBackend(CameraBackend):
+    """
+    A backend with one simulated camera. The options are passed to the SimulatedSession.
+    """
+    name = 'simulated'
+    MODEL = 'Simulated Camera'
+    # starts with usb like the ports of real cameras, the capture view splits the camera data there
+    PORT = 'usb:sim'
+
+    def __init__(self, **session_options):
+        self.session_options = session_options
+
+    def detect(self):
+        return [(SimulatedBackend.MODEL, SimulatedBackend.PORT)]
+
+    def create_session(self, model, port):
+        return SimulatedSession(model, port, **self.session_options)
+
+
+def benchmark(num_captures=10, capture_size=(1200, 800), latency=None):
+    """
+    Captures num_captures images with the simulated camera and saves them into a new project in a temporary
+    directory, like the capture view does.
+
+    Returns:
+        dict: 'captures_per_s' captured and saved, 'num_captures' saved.
+    """
+    import tempfile
+    from src.db.DB import FileAgnosticDB
+    from src.threads.CameraThread import set_backend
+    from src.threads.GPhoto2Camera import GPhoto2Backend
+    from src.threads.ImageCapture import ImageCapture
+
+    latency = dict({'open': 0, 'preview': 0, 'capture': 0, 'download': 0}, **(latency or {}))
+    set_backend(SimulatedBackend(capture_size=capture_size, latency=latency, seed=0))
+    captured = []
+    ImageCapture.signals.img_captured.connect(captured.append)
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = FileAgnosticDB()
+            db.create_project({'project_dir': str(Path(tmp_dir) / 'project'), 'num_captures': 0, 'name': 'benchmark',
+                               'description': 'capture benchmark', 'date': time.strftime('%Y-%m-%d'),
+                               'authors': 'benchmark'})
+            session = {'name': None, 'Capturer': 'benchmark', 'Museum': 'benchmark', 'collection_name': 'benchmark',
+                       'captures': []}
+            sid = list(db.create_session(session).keys())[-1]
+            meta_info = {'sessionName': 'benchmark', 'order': 'Coleoptera', 'family': 'Carabidae',
+                         'genus': 'Carabus', 'species': 'Carabus auratus', 'museum': 'benchmark',
+                         'capturer': 'benchmark', 'captureID': 1}
+            start = time.perf_counter()
+            for _ in range(num_captures):
+                capture = ImageCapture()
+                capture.set_camera_data(SimulatedBackend.MODEL, SimulatedBackend.PORT)
+                capture.set_image_dir(db.project_root_dir / '.project' / '.tmp_cap')
+                capture.run()
+                db.post_new_image({'img_dir': captured[-1], 'meta_info': dict(meta_info), 'sid': sid, 'move': True})
+            elapsed = time.perf_counter() - start
+            db.wait_for_derivatives()
+            saved = db.load_sessions()[sid]['num_captures']
+            db.catalog.close()
+    finally:
+        ImageCapture.signals.img_captured.disconnect(captured.append)
+        set_backend(GPhoto2Backend())
+    return {'captures_per_s': num_captures / elapsed, 'num_captures': saved}
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Measure the throughput of capturing and saving with the simulated camera")
+    parser.add_argument('--captures', type=int, default=10)
+    parser.add_argument('--size', type=int, nargs=2, default=[1200, 800])
+    parser.add_argument('--latency', action='store_true', help="simulate the latencies of a real camera")
+    args = parser.parse_args()
+    result = benchmark(args.captures, tuple(args.size), SIMULATED_LATENCY if args.latency else None)
+    print(f"{result['captures_per_s']:.1f} captures/s captured and saved, {result['num_captures']} captures")
@@ -0,0 +1,68 @@
+"""
+Module: ThumbnailWorker.py
+Author: Sebastian Sander
+This module contains the ThumbnailWorker class, a QRunnable that decodes a capture at thumbnail resolution off
+the GUI thread.
+"""
+
+import threading
+import logging
+import logging.config
+from PyQt6.QtCore import QRunnable, QObject, pyqtSignal, Qt
+from PyQt6.QtGui import QImage, QImageReader
+
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+
+class ThumbnailSignals(QObject):
+    decoded = pyqtSignal(str, QImage)
+
+
+class ThumbnailWorker(QRunnable):
+    """
+    Decodes an image scaled down to fit into size x size pixels. The image is scaled by the decoder, JPEGs are
+    decoded at a reduced resolution, so the full size image is never held in memory.
+
+    Attributes:
+    -----------
+    path : str
+        The image to decode.
+    size : int
+        The edge length of the thumbnail.
+    cancel_event : threading.Event
+        Set by the owner when the thumbnail is no longer needed. A cancelled worker that did not start yet
+        returns at once without decoding.
+    resolve : callable
+        Maps path to the file that is decoded, e.g. to a cached derivative of the image. Called on the worker
+        thread.
+    signals : ThumbnailSignals
+        decoded(path, image), the image is null if the file could not be decoded.
+    """
+
+    def __init__(self, path, size, cancel_event=None, resolve=None):
+        super().__init__()
+        self.path = path
+        self.size = size
+        self.cancel_event = cancel_event or threading.Event()
+        self.resolve = resolve
+        self.signals = ThumbnailSignals()
+
+    def run(self):
+        if self.cancel_event.is_set():
+            return
+        source = self.path
+        if self.resolve is not None:
+            try:
+                source = str(self.resolve(self.path))
+            except Exception as e:
+                logger.warning(f"could not resolve {self.path}, decoding the image: {e}")
+        reader = QImageReader(source)
+        reader.setAutoTransform(True)
+        if reader.size().isValid():
+            reader.setScaledSize(reader.size().scaled(self.size, self.size, Qt.AspectRatioMode.KeepAspectRatio))
+        image = reader.read()
+        if image.isNull():
+            logger.warning(f"could not decode {self.path}: {reader.errorString()}")
+        if not self.cancel_event.is_set():
+            self.signals.decoded.emit(self.path, image)
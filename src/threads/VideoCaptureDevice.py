@@ -9,36 +9,41 @@ import logging
 import logging.config
 logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
 
+import time
+
 import cv2
 from PyQt6.QtCore import QRunnable, pyqtSignal, QObject
-import time
+
+from src.threads.FrameBuffer import FrameBuffer
 logger = logging.getLogger(__name__)
 
 
 class VideoDeviceSignals(QObject):
     device_open = pyqtSignal()
-    send_frame = pyqtSignal(tuple)
 
 class VideoCaptureDevice(QRunnable):
     """
     A class representing a video capture device.
 
     Attributes:
-    - deviceOpen (pyqtSignal): A signal emitted when the device is opened.
+    - signals (VideoDeviceSignals): device_open is emitted when the device is opened. Every device has its own
+      signals, the panel connects to them for each stream it starts.
     - device (cv2.VideoCapture): The video capture device.
     - videoStreamDir (str): The directory of the video stream.
+    - fs (int): The sampling frequency in frames per second, the frames in between are grabbed but not decoded.
+    - frames (FrameBuffer): The buffer the sampled (ret, frame) tuples are put into, the preview panel takes them.
 
     Methods:
     - run(): Opens the video stream device.
     - setVideoStreamDir(videoStreamDir): Sets the directory of the video stream.
     - quit(): Quits the video capture device thread and releases the video stream device.
     """
-    signals = VideoDeviceSignals()
-
-    def __init__(self, fs, device_dir=None):
+    def __init__(self, fs, device_dir=None, frames=None):
         super().__init__()
+        self.signals = VideoDeviceSignals()
         self.device_dir = None
         self.fs = fs
+        self.frames = frames if frames is not None else FrameBuffer()
         self.running = False
         self.device_dir = device_dir
 
@@ -46,12 +51,11 @@ class VideoCaptureDevice(QRunnable):
         """
         Runs the video capture device thread.
 
-        If the video stream directory is not set, the function returns.
+        If the video stream directory is not set, the default device is opened.
         If the device is not opened, it opens the video stream device at the specified directory and emits a signal.
         If the device is already open, it logs a message and returns.
         """
-        time.sleep(2)
-        self.signals.device_open.emit()
+        # the streamer enables the device with its first frame, there is nothing to wait for
         if self.device_dir is None:
             logger.debug(f"video stream dir not set. Setting default device {0}")
             cap = cv2.VideoCapture(0, cv2.CAP_V4L)
@@ -60,10 +64,22 @@ class VideoCaptureDevice(QRunnable):
             cap = cv2.VideoCapture(self.device_dir)
         if cap.isOpened():
             self.device_open = cap.isOpened()
-            
+            self.signals.device_open.emit()
+
+            interval = 1 / self.fs if self.fs else 0
+            next_sample = time.monotonic()
             while self.device_open:
-                out = cap.read()
-                self.signals.send_frame.emit(out)
+                # grab blocks until the device has the next frame and keeps its queue drained
+                if not cap.grab():
+                    logger.warning("video device delivered no frame, stopping")
+                    self.frames.put((False, None))
+                    break
+                now = time.monotonic()
+                if now < next_sample:
+                    continue
+                next_sample = now + interval
+                # only the sampled frames are decoded
+                self.frames.put(cap.retrieve())
             logger.debug(f"releasing video device...")
             cap.release()
         else:
@@ -0,0 +1,190 @@
+"""
+Module: exif.py
+Author: Sebastian Sander
+
+This module writes EXIF meta data into JPEG files without decoding and re-encoding the image.
+
+Only the APP1 (Exif) segment of the JPEG byte stream is parsed and replaced, the entropy coded image data is
+copied as is. The cost of writing a comment is therefore independent of the image resolution and the image
+quality is not touched.
+
+Functions:
+- write_user_comment: Writes the UserComment tag of a JPEG file in place.
+- read_user_comment: Reads the UserComment tag of an image file.
+- split_app1: Splits a JPEG byte stream around its Exif segment.
+- read_head: Reads the segments of a JPEG file up to its Exif segment.
+- build_app1: Builds an Exif segment with an updated UserComment.
+- app1_segment: Wraps an Exif payload into a JPEG segment.
+
+Usage:
+    python -m src.utils.exif <image.jpg> [repetitions]
+    benchmarks write_user_comment against the PIL decode/re-encode path on a copy of the image.
+"""
+
+import os
+import struct
+from pathlib import Path
+from PIL import Image, ExifTags
+
+SOI = b'\xff\xd8'
+APP1 = 0xE1
+EXIF_HEADER = b'Exif\x00\x00'
+MAX_SEGMENT_SIZE = 0xFFFF - 2
+
+
+def split_app1(data):
+    """
+    Splits a JPEG byte stream into the bytes before the Exif segment, the Exif payload and the bytes after it.
+
+    If the image has no Exif segment, the payload is None and the split position is after the leading
+    APP0 (JFIF) segment, which is where a new Exif segment has to be inserted.
+
+    Args:
+        data (bytes): the JPEG file content.
+
+    Returns:
+        tuple: (head, exif_payload, tail) with exif_payload starting with the Exif header.
+    """
+    if data[:2] != SOI:
+        raise ValueError("Not a JPEG file")
+    pos = 2
+    insert_pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError(f"Corrupted JPEG marker at byte {pos}")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            # fill byte
+            pos += 1
+            continue
+        if marker == 0xDA or marker == 0xD9:
+            # start of scan or end of image, no more meta data segments
+            break
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        if length < 2:
+            # the length counts its own two bytes
+            raise ValueError(f"Corrupted JPEG segment length {length} at byte {pos}")
+        end = pos + 2 + length
+        if marker == APP1 and data[pos + 4:pos + 10] == EXIF_HEADER:
+            return data[:pos], data[pos + 4:end], data[end:]
+        if marker == 0xE0:
+            insert_pos = end
+        pos = end
+    return data[:insert_pos], None, data[insert_pos:]
+
+
+def read_head(f):
+    """
+    Reads a JPEG file object up to and including its Exif segment, the file object is left at the first byte
+    that can be copied unchanged. The segments before the start of scan are walked like split_app1 does, the Exif
+    segment may follow any of them.
+
+    Returns:
+        tuple: (head, exif_payload) like split_app1, the payload is None if the image has no Exif segment. The
+        head ends after the APP0 segment then, where a new Exif segment has to be inserted.
+    """
+    head = f.read(2)
+    if head != SOI:
+        raise ValueError("Not a JPEG file")
+    # file position and head length a new Exif segment is inserted at
+    insert = (f.tell(), len(head))
+    while True:
+        pos = f.tell()
+        marker = f.read(4)
+        if len(marker) < 4:
+            break
+        if marker[0] != 0xFF:
+            raise ValueError(f"Corrupted JPEG marker at byte {pos}")
+        if marker[1] in (0xDA, 0xD9):
+            # start of scan or end of image, no more meta data segments
+            break
+        if marker[1] == 0xFF:
+            # fill byte
+            f.seek(pos + 1)
+            head += marker[:1]
+            continue
+        length = struct.unpack('>H', marker[2:4])[0]
+        if length < 2:
+            # f.read of a negative size would read the whole file
+            raise ValueError(f"Corrupted JPEG segment length {length} at byte {pos}")
+        segment = f.read(length - 2)
+        if marker[1] == APP1 and segment[:6] == EXIF_HEADER:
+            return head, segment
+        head += marker + segment
+        if marker[1] == 0xE0:
+            insert = (f.tell(), len(head))
+    f.seek(insert[0])
+    return head[:insert[1]], None
+
+
+def build_app1(payload, comment):
+    """
+    Returns a complete Exif segment, the existing payload (or None) with the UserComment set to comment.
+    """
+    exif = Image.Exif()
+    if payload is not None:
+        exif.load(payload)
+    exif[ExifTags.Base.UserComment] = comment
+    return app1_segment(exif.tobytes())
+
+
+def app1_segment(payload):
+    if len(payload) > MAX_SEGMENT_SIZE:
+        raise ValueError(f"Exif data of {len(payload)} bytes does not fit into a JPEG segment")
+    return b'\xff' + bytes([APP1]) + struct.pack('>H', len(payload) + 2) + payload
+
+
+def write_user_comment(image_path, comment):
+    """
+    Writes the UserComment tag of a JPEG file by replacing its Exif segment.
+
+    The tag is stored in IFD0, like FileAgnosticDB did with PIL, so Image.getexif() returns it.
+    The file is replaced atomically.
+
+    Args:
+        image_path (str or Path): path of the JPEG file.
+        comment (str): the comment to store.
+    """
+    image_path = Path(image_path)
+    data = image_path.read_bytes()
+    head, payload, tail = split_app1(data)
+    segment = build_app1(payload, comment)
+    tmp_path = image_path.with_name(f".{image_path.name}.exif")
+    with open(tmp_path, 'wb') as f:
+        f.write(head)
+        f.write(segment)
+        f.write(tail)
+    os.replace(tmp_path, image_path)
+
+
+def read_user_comment(image_path):
+    with Image.open(image_path) as img:
+        return img.getexif().get(ExifTags.Base.UserComment)
+
+
+def _write_user_comment_pil(image_path, comment):
+    # the decode/re-encode path used before, kept for the benchmark
+    img = Image.open(image_path)
+    exif_data = img.getexif()
+    exif_data[ExifTags.Base.UserComment] = comment
+    img.save(image_path, exif=exif_data)
+
+
+if __name__ == "__main__":
+    import sys
+    import shutil
+    import tempfile
+    from time import perf_counter
+
+    src_image = Path(sys.argv[1])
+    repetitions = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    comment = str({'order': 'Coleoptera', 'family': 'Carabidae', 'genus': 'Carabus', 'species': 'auratus'})
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, writer in (('pil', _write_user_comment_pil), ('app1', write_user_comment)):
+            image_path = Path(tmp_dir) / f"{name}{src_image.suffix}"
+            shutil.copy(src_image, image_path)
+            start = perf_counter()
+            for _ in range(repetitions):
+                writer(image_path, comment)
+            elapsed = (perf_counter() - start) / repetitions
+            print(f"{name:5s} {elapsed * 1000:8.2f} ms/image  {image_path.stat().st_size / 1e6:6.2f} MB")
@@ -0,0 +1,169 @@
+"""
+Module: ingest.py
+Author: Sebastian Sander
+
+This module moves a captured image to its final location in a project in a single pass.
+
+The source is streamed once into a temporary file next to the destination. The Exif segment carrying the
+meta data is written on the way, so the image is not read again afterwards. The temporary file is then renamed
+to the destination, so readers never see a half written capture. A moved capture is streamed as well: renaming
+it would save the copy, but the Exif segment grows with the meta data and has to be written in front of the
+image data anyway.
+
+Captures that are imported unchanged, e.g. when merging projects on the same volume, can be linked instead of
+copied: a copy-on-write reflink is used where the filesystem supports it, a hardlink otherwise and a streamed
+copy if neither works.
+
+The content hash of a capture is a blake2b digest of the file without its Exif segment, so it identifies the
+image independent of the meta data written into it. It is computed while the capture is streamed.
+
+Functions:
+- ingest_capture: Moves or copies a capture to its destination, inserting the meta data comment.
+- link_or_copy: Links a capture to its destination, copies it if linking is not possible.
+- content_hash: Returns the content hash of a capture.
+- new_hasher: Returns the hash object used for content hashes.
+"""
+
+import errno
+import hashlib
+import os
+import shutil
+from pathlib import Path
+from src.utils.exif import read_head, build_app1, app1_segment
+
+try:
+    import fcntl
+except ImportError:
+    # no reflinks on windows
+    fcntl = None
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+COPY_BUFFER_SIZE = 1024 * 1024
+# linux ioctl cloning the extents of a file, _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+
+def new_hasher():
+    return hashlib.blake2b(digest_size=20)
+
+
+def content_hash(path):
+    """
+    Returns the hex digest of the file at path without its Exif segment.
+    """
+    hasher = new_hasher()
+    _hash_file(hasher, path)
+    return hasher.hexdigest()
+
+
+def _hash_file(hasher, path):
+    with open(path, 'rb') as f:
+        try:
+            head, _ = read_head(f)
+        except ValueError:
+            # not a jpeg, hash the whole file
+            f.seek(0)
+            head = b''
+        hasher.update(head)
+        for chunk in iter(lambda: f.read(COPY_BUFFER_SIZE), b''):
+            hasher.update(chunk)
+
+
+def ingest_capture(src, dst, comment=None, move=False, hasher=None):
+    """
+    Writes the capture src to dst.
+
+    Args:
+        src (str or Path): the captured image.
+        dst (str or Path): the final location of the capture.
+        comment (str): written to the UserComment Exif tag of JPEG captures. None keeps the file unchanged.
+        move (bool): remove src after it was written to dst.
+        hasher: hash object updated with the content of the capture like content_hash, see new_hasher.
+
+    Returns:
+        str: 'streamed', the content of src was written to dst.
+    """
+    src, dst = Path(src), Path(dst)
+    part = dst.with_name(f".{dst.name}.part")
+    try:
+        with open(src, 'rb') as fsrc, open(part, 'wb') as fdst:
+            try:
+                head, payload = read_head(fsrc)
+                segment = app1_segment(payload) if payload is not None else b''
+            except ValueError:
+                fsrc.seek(0)
+                head, payload, segment = b'', None, b''
+                if comment is not None:
+                    logger.warning(f"Could not write meta data to {dst}: not a JPEG file")
+            if head and comment is not None:
+                try:
+                    segment = build_app1(payload, comment)
+                except ValueError as e:
+                    # the meta data is too large, keep the image as it is
+                    logger.warning(f"Could not write meta data to {dst}: {e}")
+            fdst.write(head)
+            fdst.write(segment)
+            if hasher is not None:
+                hasher.update(head)
+            for chunk in iter(lambda: fsrc.read(COPY_BUFFER_SIZE), b''):
+                fdst.write(chunk)
+                if hasher is not None:
+                    hasher.update(chunk)
+        shutil.copystat(src, part)
+        os.replace(part, dst)
+    finally:
+        part.unlink(missing_ok=True)
+    if move:
+        src.unlink()
+    return 'streamed'
+
+
+def link_or_copy(src, dst):
+    """
+    Creates dst with the content of src without copying the data where possible.
+
+    Tries a reflink first, as the files stay independent, then a hardlink and falls back to a streamed copy.
+    Hardlinked files share their content, so the caller must not modify dst in place afterwards.
+
+    Returns:
+        tuple: (method, bytes copied) with method one of 'reflink', 'hardlink' or 'copy'.
+    """
+    src, dst = Path(src), Path(dst)
+    if _reflink(src, dst):
+        return 'reflink', 0
+    part = dst.with_name(f".{dst.name}.part")
+    # left behind by a crashed import
+    part.unlink(missing_ok=True)
+    try:
+        os.link(src, part)
+        os.replace(part, dst)
+        return 'hardlink', 0
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP):
+            raise
+    finally:
+        part.unlink(missing_ok=True)
+    ingest_capture(src, dst)
+    return 'copy', dst.stat().st_size
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        return False
+    part = dst.with_name(f".{dst.name}.part")
+    try:
+        with open(src, 'rb') as fsrc, open(part, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, part)
+        os.replace(part, dst)
+        return True
+    except OSError:
+        # not supported by the filesystem or across devices
+        return False
+    finally:
+        part.unlink(missing_ok=True)
+
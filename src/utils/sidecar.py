@@ -0,0 +1,151 @@
+"""
+Module: sidecar.py
+Author: Sebastian Sander
+This module contains the functions to read and write the meta data sidecar files of captures and sessions. The
+sidecars are YAML files by default, JSON sidecars parse several times faster and can be chosen per database.
+YAML is parsed and dumped with libyaml if PyYAML was built with it.
+Run the module to migrate the sidecars of a project to another format or to benchmark the formats:
+
+    python -m src.utils.sidecar migrate <project_dir> --to json
+    python -m src.utils.sidecar benchmark --captures 20000
+"""
+
+import json
+import os
+from pathlib import Path
+
+import yaml
+
+import logging
+import logging.config
+logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
+logger = logging.getLogger(__name__)
+
+# the libyaml bindings are an optional part of PyYAML
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+SIDECAR_YAML = 'yaml'
+SIDECAR_JSON = 'json'
+# sidecar format -> file suffix
+SIDECAR_FORMATS = {
+    SIDECAR_YAML: '.yml',
+    SIDECAR_JSON: '.json',
+}
+
+
+def sidecar_path(path, sidecar_format=SIDECAR_YAML):
+    """
+    Returns the sidecar path of an image or a session, path with the suffix of the format.
+    """
+    return Path(path).with_suffix(SIDECAR_FORMATS[sidecar_format])
+
+
+def dump_sidecar(data, sidecar_format=SIDECAR_YAML):
+    if sidecar_format == SIDECAR_JSON:
+        return json.dumps(data, indent=2, sort_keys=True)
+    if sidecar_format == SIDECAR_YAML:
+        return yaml.dump(data, Dumper=SafeDumper)
+    raise ValueError(f"Unknown sidecar format {sidecar_format}, use one of {', '.join(SIDECAR_FORMATS)}")
+
+
+def load_sidecar(path):
+    """
+    Reads a sidecar, the format is taken from its suffix.
+    """
+    path = Path(path)
+    with path.open('r') as f:
+        if path.suffix == SIDECAR_FORMATS[SIDECAR_JSON]:
+            return json.load(f)
+        return yaml.load(f, Loader=SafeLoader)
+
+
+def find_sidecar(path):
+    """
+    Returns the existing sidecar of an image, in any format. Raises FileNotFoundError if there is none.
+    """
+    for sidecar_format in SIDECAR_FORMATS:
+        candidate = sidecar_path(path, sidecar_format)
+        if candidate.is_file():
+            return candidate
+    raise FileNotFoundError(f"No sidecar found for {path}")
+
+
+def migrate_sidecars(project_dir, sidecar_format):
+    """
+    Rewrites the capture and session sidecars of a project in the given format and removes the old files.
+    The project must not be open while it is migrated.
+
+    Returns:
+        int: the number of migrated sidecars.
+    """
+    suffix = SIDECAR_FORMATS[sidecar_format]
+    old_suffixes = {s for s in SIDECAR_FORMATS.values() if s != suffix}
+    migrated = 0
+    for path in sorted((Path(project_dir) / 'captures').rglob('*')):
+        if path.suffix not in old_suffixes or not path.is_file():
+            continue
+        target = path.with_suffix(suffix)
+        tmp_file = target.with_name(f".{target.name}.tmp")
+        tmp_file.write_text(dump_sidecar(load_sidecar(path), sidecar_format))
+        os.replace(tmp_file, target)
+        path.unlink()
+        migrated += 1
+    logger.info(f"Migrated {migrated} sidecars of {project_dir} to {sidecar_format}")
+    return migrated
+
+
+def benchmark(captures=10000):
+    """
+    Measures the dump and parse throughput of the sidecar formats for the given number of captures.
+
+    Returns:
+        dict: format -> {'dump': captures per second, 'parse': captures per second}.
+    """
+    import time
+
+    meta_infos = [{
+        'Species Info': {'order': 'Coleoptera', 'family': 'Carabidae', 'genus': 'Carabus',
+                         'species': 'Carabus auratus', 'label': f"CAR-{i:06d}"},
+        'Collection Info': {'museum': 'Senckenberg - Frankfurt', 'collection': 'Insects', 'country': 'Germany',
+                            'region': 'Hesse', 'date': '1923-05-14', 'collector': 'Unknown'},
+        'contentHash': f"{i:064x}",
+        'exif': {'camera': 'Sony A7R', 'exposure': '1/125', 'iso': 100, 'aperture': 8.0},
+    } for i in range(captures)]
+    codecs = {
+        'yaml (Python)': (lambda data: yaml.dump(data, Dumper=yaml.SafeDumper),
+                          lambda text: yaml.load(text, Loader=yaml.SafeLoader)),
+        'json': (lambda data: dump_sidecar(data, SIDECAR_JSON), json.loads),
+    }
+    if SafeLoader is not yaml.SafeLoader:
+        codecs['yaml (libyaml)'] = (lambda data: dump_sidecar(data, SIDECAR_YAML),
+                                    lambda text: yaml.load(text, Loader=SafeLoader))
+    results = {}
+    for name, (dump, parse) in codecs.items():
+        start = time.perf_counter()
+        texts = [dump(meta_info) for meta_info in meta_infos]
+        dumped = time.perf_counter()
+        for text in texts:
+            parse(text)
+        parsed = time.perf_counter()
+        results[name] = {'dump': captures / (dumped - start), 'parse': captures / (parsed - dumped)}
+    return results
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Migrate and benchmark the meta data sidecars of captures")
+    commands = parser.add_subparsers(dest='command', required=True)
+    migrate_parser = commands.add_parser('migrate', help="rewrite the sidecars of a project in another format")
+    migrate_parser.add_argument('project_dir', type=Path)
+    migrate_parser.add_argument('--to', choices=list(SIDECAR_FORMATS), default=SIDECAR_JSON)
+    benchmark_parser = commands.add_parser('benchmark', help="measure the dump and parse throughput")
+    benchmark_parser.add_argument('--captures', type=int, default=10000)
+
+    args = parser.parse_args()
+    if args.command == 'migrate':
+        print(f"{migrate_sidecars(args.project_dir, args.to)} sidecars migrated")
+    elif args.command == 'benchmark':
+        for name, result in benchmark(args.captures).items():
+            print(f"{name:28}dump {result['dump']:10.0f} captures/s\tparse {result['parse']:10.0f} captures/s")
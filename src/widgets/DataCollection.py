@@ -150,6 +150,16 @@ class SessionInfoWidget(ListWidget):
                 l = label.capitalize().replace("_", " ")
                 self.fields[l].set_value(value)
 
+    def update_session_data(self, changes):
+        """
+        Shows the changed fields of the session only.
+        """
+        self.session_data.update(changes)
+        for label, value in changes.items():
+            l = label.capitalize().replace("_", " ")
+            if l in self.fields:
+                self.fields[l].set_value(value)
+
     def get_data(self):
         return self.session_data
 
@@ -824,6 +834,9 @@ class DataCollection(QWidget):
     def set_session_data(self, data):
         self.session_widget.set_session_data(data)
 
+    def update_session_data(self, changes):
+        self.session_widget.update_session_data(changes)
+
     def find_widget_tab(self, target_widget):
         for index in range(self.tab_widget.count()):
             tab = self.tab_widget.widget(index)
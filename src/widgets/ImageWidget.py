@@ -87,6 +87,8 @@ class ImageWidget(QWidget):
         self.db_adapter = db_adapter
         self.geo_data_dir = geo_data_dir
         self.panel = panel
+        self.sid = None
+        self.current_session = None
         self.panel.label.hide()
         logger.debug("initializing image widget")
         super().__init__()
@@ -127,6 +129,11 @@ class ImageWidget(QWidget):
         self.close_button.clicked.connect(self.close)
         self.save_button.clicked.connect(self.savedata)
         self.db_adapter.sessions_signal.connect(self.set_session_data)
+        self.db_adapter.session_added_signal.connect(self.set_current_session)
+        self.db_adapter.session_updated_signal.connect(self.update_session_data)
+        self.db_adapter.capture_added_signal.connect(self.add_capture)
+        self.db_adapter.session_removed_signal.connect(self.remove_session)
+        self.db_adapter.save_failed_signal.connect(self.on_save_failed)
         self.panel.image_captured.connect(self.set_img_dir)
         self.histogram_button.clicked.connect(self.show_histogram)
 
@@ -137,24 +144,51 @@ class ImageWidget(QWidget):
     def set_session_data(self, sessions):
         sessions_ids = list(sessions.keys())
         if sessions_ids:
-            self.sid = sessions_ids[-1]
-            self.current_session = sessions[self.sid]
-            self.data_collector.set_session_data(self.current_session)
+            self.set_current_session(sessions_ids[-1], sessions[sessions_ids[-1]])
+
+    def set_current_session(self, sid, session):
+        self.sid = sid
+        # the session dicts belong to the db, the widget keeps its own copy
+        self.current_session = dict(session, captures=list(session['captures']))
+        self.data_collector.set_session_data(self.current_session)
+
+    def update_session_data(self, sid, changes):
+        if sid != self.sid:
+            return
+        self.current_session = {**self.current_session, **changes}
+        self.data_collector.update_session_data(changes)
+
+    def add_capture(self, sid, capture):
+        if sid != self.sid:
+            return
+        captures = [*self.current_session['captures'], capture]
+        self.current_session = {**self.current_session, 'captures': captures}
+        self.data_collector.update_session_data({'captures': captures})
+
+    def remove_session(self, sid):
+        if sid == self.sid:
+            self.sid = None
+            self.current_session = None
 
     def set_img_dir(self, img_dir):
         self.img_dir = img_dir
+        self.enableButtons()
 
     def enableButtons(self):
         """
         Enables the buttons of the widget.
         """
         logger.debug("enabling buttons")
+        self.save_button.setEnabled(True)
+        self.histogram_button.setEnabled(True)
 
     def disableButtons(self):
         """
         Disables the buttons of the widget.
         """
         logger.debug("disabling buttons")
+        self.save_button.setEnabled(False)
+        self.histogram_button.setEnabled(False)
 
     def enhanceButtonClicked(self):
         """
@@ -164,7 +198,8 @@ class ImageWidget(QWidget):
 
     def savedata(self):
         """
-        Opens a file dialog to save the image.
+        Queues the image and its meta data for saving. The save runs in the background, so the next
+        capture can be taken while the image is still being written.
         """
         logger.info("Retreiving meta info from Panel")
         meta_info = self.data_collector.get_data()
@@ -172,14 +207,19 @@ class ImageWidget(QWidget):
         payload = {
             'img_dir' : self.img_dir,
             'meta_info' : meta_info,
-            'sid' : self.sid
+            'sid' : self.sid,
+            'move' : True
         }
-        try:
-            if self.db_adapter.save_image_data(payload):
-                if QMessageBox.question(self, 'Title', ' Image and metadata saved! Go to capture mode?').name == 'Yes':    
-                    self.close()
-        except Exception as e:
-            QMessageBox.warning(self, "Something went wrong", str(e))
+        self.db_adapter.save_image_data_async(payload)
+        # the temporary capture is moved into the project, it can be neither saved again nor read from here
+        self.disableButtons()
+        if QMessageBox.question(self, 'Title', ' Image and metadata are being saved! Go to capture mode?').name == 'Yes':
+            self.close()
+
+    def on_save_failed(self, message):
+        # a failed save moves the temporary capture back, it can be saved again
+        self.enableButtons()
+        QMessageBox.warning(self, "Something went wrong", message)
 
     def closeEvent(self, event):
         self.close_signal.emit(True)
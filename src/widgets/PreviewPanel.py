@@ -20,6 +20,7 @@ from pathlib import Path
 
 from src.threads.CameraStreamer import CameraStreamer
 from src.threads.VideoCaptureDevice import VideoCaptureDevice
+from src.threads.FrameBuffer import FrameBuffer
 from src.threads.ImageCapture import ImageCapture
 from src.widgets.SpinnerWidget import LoadingSpinner
 
@@ -79,9 +80,15 @@ class Panel(QLabel):
 class PreviewPanel(QLabel):
     """
     A widget that displays a live preview of the camera stream and allows capturing images.
+
+    The stream workers put the sampled frames into a small frame buffer, the panel takes the latest frame from it
+    at its own refresh rate. Frames the panel does not get to are dropped instead of piling up in the event queue.
+    A capture is started once the streamer reports that it is idle, the GUI thread never waits for the stream.
     """
     stop_stream_signal = pyqtSignal()
     image_captured = pyqtSignal(str)
+    REFRESH_MS = 33
+    FRAME_BUFFER_CAPACITY = 2
 
     def __init__(self, fs, panel_res):
         """
@@ -98,7 +105,14 @@ class PreviewPanel(QLabel):
         self.is_streaming = False
         self.img_dir = ''
         self.thread_pool = QThreadPool()
-        
+        # the workers of the current stream
+        self.camera_streamer = None
+        self.video_device = None
+        self.capture_pending = False
+        self.frames = FrameBuffer(PreviewPanel.FRAME_BUFFER_CAPACITY)
+        self.timer = QTimer(self)
+        self.timer.setInterval(PreviewPanel.REFRESH_MS)
+
         self.init_ui()
         self.connect_signals()
         
@@ -123,18 +137,18 @@ class PreviewPanel(QLabel):
         Connects the signals of the PreviewPanel widget.
         """
         logger.debug("connecting signals for preview panel")
-        # self.timer.timeout.connect(self.update_panel)
+        self.timer.timeout.connect(self.refresh_panel)
+        # connected once, it stops the workers of the current stream
+        self.stop_stream_signal.connect(self.stop_workers)
 
     def set_text(self, text):
         self.label.setText(text)
 
     def connect_video_device(self, device_dir):
         logger.info("connecting to video device dir")
-        self.video_device = VideoCaptureDevice(self.fs, device_dir)
-        self.video_device.signals.send_frame.connect(self.update_panel)
+        self.video_device = VideoCaptureDevice(self.fs, device_dir, frames=self.frames)
         self.video_device.signals.device_open.connect(self.loadingSpinner.stop)
         self.video_device.signals.device_open.connect(self.loadingSpinner.hide)
-        self.stop_stream_signal.connect(self.video_device.quit)
         self.thread_pool.start(self.video_device)
 
     def start_stream(self):
@@ -142,12 +156,18 @@ class PreviewPanel(QLabel):
         Starts the camera stream preview.
         """
         logger.debug("starting preview")
-        self.camera_streamer = CameraStreamer(self.fs)
+        self.camera_streamer = CameraStreamer(self.fs, frames=self.frames)
         self.camera_streamer.set_camera_data(self.model, self.port)
         self.camera_streamer.signals.building_stream.connect(self.loadingSpinner.start)
         self.camera_streamer.signals.building_stream.connect(self.loadingSpinner.show)
         self.camera_streamer.signals.stream_enabled.connect(self.connect_video_device)
-        self.stop_stream_signal.connect(self.camera_streamer.stop_running)
+        # frames read through the camera session need no video device
+        self.camera_streamer.signals.preview_ready.connect(self.loadingSpinner.stop)
+        self.camera_streamer.signals.preview_ready.connect(self.loadingSpinner.hide)
+        self.camera_streamer.signals.stream_failed.connect(self.on_stream_failed)
+        self.video_device = None
+        self.frames.clear()
+        self.timer.start()
         self.thread_pool.start(self.camera_streamer)
 
     def restart_stream(self):
@@ -156,9 +176,20 @@ class PreviewPanel(QLabel):
         
     def stop_stream(self):
         self.stop_stream_signal.emit()
+        self.stop_refresh()
         self.is_streaming = False
         self.panel.freeze()
 
+    def stop_workers(self):
+        if self.camera_streamer is not None:
+            self.camera_streamer.stop_running()
+        if self.video_device is not None:
+            self.video_device.quit()
+
+    def stop_refresh(self):
+        self.timer.stop()
+        logger.info(f"live view frames: {self.frames.stats}")
+
     def capture_image(self):
         """
         Captures an image from the camera stream.
@@ -172,14 +203,38 @@ class PreviewPanel(QLabel):
         self.image_capture.signals.finished.connect(self.loadingSpinner.hide)
         self.image_capture.signals.finished.connect(self.restart_stream)
         self.image_capture.signals.img_captured.connect(self.on_image_captured)
+        self.stop_refresh()
         self.panel.freeze()
-        print(self.thread_pool.activeThreadCount())
-        while self.thread_pool.activeThreadCount() > 0:
-            self.stop_stream_signal.emit()
-        print(self.thread_pool.activeThreadCount())
+        self.capture_pending = True
+        if self.camera_streamer is None:
+            self.on_streamer_state_changed(CameraStreamer.IDLE)
+            return
+        # the stream workers return after their current frame, the camera is free once the streamer is idle
+        self.camera_streamer.signals.state_changed.connect(self.on_streamer_state_changed)
+        self.stop_stream_signal.emit()
+        if self.camera_streamer.state == CameraStreamer.IDLE:
+            # the streamer was idle before the slot was connected
+            self.on_streamer_state_changed(CameraStreamer.IDLE)
+
+    def on_streamer_state_changed(self, state):
+        if state != CameraStreamer.IDLE or not self.capture_pending:
+            return
+        self.capture_pending = False
+        if self.camera_streamer is not None:
+            self.camera_streamer.signals.state_changed.disconnect(self.on_streamer_state_changed)
+        self.start_capture()
+
+    def start_capture(self):
         self.thread_pool.setMaxThreadCount(1)
         self.thread_pool.start(self.image_capture)
 
+    def on_stream_failed(self, message):
+        self.stop_refresh()
+        self.loadingSpinner.stop()
+        self.loadingSpinner.hide()
+        self.panel.freeze()
+        self.set_text(f"Live view failed: {message}")
+
     def on_image_captured(self, img_dir):
         try:
             img = cv2.imread(img_dir)
@@ -214,6 +269,14 @@ class PreviewPanel(QLabel):
     def set_is_capture_ready(self, is_ready):
         self.is_capture_ready = is_ready
 
+    def refresh_panel(self):
+        """
+        Shows the latest frame of the frame buffer, called by the refresh timer.
+        """
+        data = self.frames.get_latest()
+        if data is not None:
+            self.update_panel(data)
+
     @pyqtSlot(tuple)
     def update_panel(self, data):
         """
@@ -233,6 +296,7 @@ class PreviewPanel(QLabel):
         Closes the PreviewPanel widget.
         """
         logger.debug("quitting preview panel")
+        self.timer.stop()
         self.panel.clear_image()
         super().close()
 
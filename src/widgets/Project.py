@@ -12,6 +12,11 @@ Classes:
 - ProjectMerger: A QWidget subclass for merging projects.
 - ProjectCreator: A QWidget subclass for creating projects.
 - ProjectLoader: A QWidget subclass for loading projects.
+- SessionTableModel: A lazily fetched QAbstractTableModel of the sessions of a project.
+- CaptureModel: A lazily fetched QAbstractListModel of the captures of a session with asynchronously decoded thumbnails.
+- CaptureViewer: A QWidget subclass showing the captures of a session as a thumbnail grid.
+- CaptureSearch: A QWidget subclass for searching the captures of a project.
+- CatalogBrowser: A read-only QWidget subclass for searching the captures of many projects in the global catalog.
 Functions:
 - create_password_validator: Creates a password validator.
 - create_name_validator: Creates a name validator.
@@ -32,11 +37,16 @@ from pathlib import Path
 import platform
 import os
 import subprocess
-from PyQt6.QtCore import pyqtSignal, Qt, QDir, QRegularExpression, QAbstractTableModel, QModelIndex, QThread
-from PyQt6.QtGui import QIcon, QRegularExpressionValidator, QStandardItemModel, QStandardItem, QAction
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from PyQt6.QtCore import (pyqtSignal, Qt, QDir, QRegularExpression, QAbstractTableModel, QAbstractListModel, QModelIndex,
+                          QThread, QThreadPool, QSize)
+from PyQt6.QtGui import QIcon, QRegularExpressionValidator, QStandardItemModel, QStandardItem, QAction, QPixmap
 from PyQt6.QtWidgets import (QApplication, QDialog, QWidget, QVBoxLayout, QLineEdit, QPushButton, QFileDialog, QLabel, 
                              QListWidget, QHBoxLayout, QTableView, QAbstractItemView, QHeaderView, 
-                             QCheckBox, QGridLayout, QMessageBox, QInputDialog, QComboBox, QTextEdit, QDialogButtonBox, QMenu, QSizePolicy)
+                             QCheckBox, QGridLayout, QMessageBox, QInputDialog, QComboBox, QTextEdit, QDialogButtonBox, QMenu, QSizePolicy, QProgressBar, QListView)
+from src.db.GlobalCatalog import find_projects
+from src.threads.ThumbnailWorker import ThumbnailWorker
 import logging
 import logging.config
 logging.config.fileConfig('configs/logging/logging.conf', disable_existing_loggers=False)
@@ -180,14 +190,22 @@ class ProjectMerger(QWidget):
         right_layout = QVBoxLayout()
         self.setLayout(main_layout) 
         self.keep_empty_checkbox = QCheckBox("Keep empty source sessions")
+        self.link_files_checkbox = QCheckBox("Link images instead of copying (same volume)")
         # Left side (target project)
         target_label = QLabel("Target Project Information")
         self.merge_button = QPushButton("Merge Projects")
+        self.cancel_button = QPushButton("Cancel Merge")
+        self.progress_bar = QProgressBar()
         left_layout.addWidget(target_label)
         left_layout.addWidget(self.target_project_view)
         left_layout.addWidget(self.keep_empty_checkbox)
+        left_layout.addWidget(self.link_files_checkbox)
         left_layout.addWidget(self.merge_button)
+        left_layout.addWidget(self.progress_bar)
+        left_layout.addWidget(self.cancel_button)
         self.merge_button.setEnabled(False)
+        self.progress_bar.hide()
+        self.cancel_button.hide()
         # Right side (source project - initially empty)
         source_label = QLabel("Source Project Information")
         
@@ -208,15 +226,46 @@ class ProjectMerger(QWidget):
 
     def connect_signals(self):
         self.merge_button.clicked.connect(self.merge_projects)
+        self.cancel_button.clicked.connect(self.target_project_adapter.cancel_merge)
+        self.target_project_adapter.merge_progress_signal.connect(self.on_merge_progress)
+        self.target_project_adapter.merge_completed_signal.connect(self.on_merge_completed)
+        self.target_project_adapter.merge_failed_signal.connect(self.on_merge_failed)
 
     def merge_projects(self):
         if self.target_project_adapter.get_project_dir() == self.source_project_adapter.get_project_dir():
             QMessageBox.information(self, "Merge Projects", "You cannot merge the same project.")
             return
-        self.setEnabled(False)
-        self.target_project_adapter.merge_project(self.source_project_adapter, self.keep_empty_checkbox.isChecked())
-        QMessageBox.information(self, "Merge Projects", "Done integrating sessions from source project into target project.")
+        self.set_merging(True)
+        self.target_project_adapter.merge_project_async(self.source_project_adapter, self.keep_empty_checkbox.isChecked(),
+                                                        link_files=self.link_files_checkbox.isChecked())
+
+    def set_merging(self, merging):
+        self.merge_button.setEnabled(not merging)
+        self.load_button.setEnabled(not merging)
+        self.keep_empty_checkbox.setEnabled(not merging)
+        self.link_files_checkbox.setEnabled(not merging)
+        self.progress_bar.setVisible(merging)
+        self.cancel_button.setVisible(merging)
+        self.progress_bar.setValue(0)
+
+    def on_merge_progress(self, imported, total):
+        self.progress_bar.setMaximum(total)
+        self.progress_bar.setValue(imported)
+
+    def on_merge_completed(self, cancelled):
+        self.set_merging(False)
+        stats = self.target_project_adapter.get_import_stats()
+        summary = (f"{stats['files_copied']} images copied ({stats['bytes_copied'] / 1e6:.1f} MB), "
+                   f"{stats['files_linked']} images linked ({stats['bytes_linked'] / 1e6:.1f} MB).")
+        if cancelled:
+            QMessageBox.information(self, "Merge Projects", f"Merge cancelled, the captures imported so far were kept.\n{summary}")
+        else:
+            QMessageBox.information(self, "Merge Projects", f"Done integrating sessions from source project into target project.\n{summary}")
         self.close()
+
+    def on_merge_failed(self, message):
+        self.set_merging(False)
+        QMessageBox.warning(self, "Merge Projects", f"Merging failed: {message}")
     
     def load_source_project(self):
         try:        
@@ -232,6 +281,10 @@ class ProjectMerger(QWidget):
             QMessageBox.warning(self, f"Something went wrong", str(e))
 
     def closeEvent(self, event):
+        self.target_project_adapter.cancel_merge()
+        self.target_project_adapter.merge_progress_signal.disconnect(self.on_merge_progress)
+        self.target_project_adapter.merge_completed_signal.disconnect(self.on_merge_completed)
+        self.target_project_adapter.merge_failed_signal.disconnect(self.on_merge_failed)
         self.close_signal.emit(True)
         super().closeEvent(event)
 
@@ -512,13 +565,195 @@ class LoginWidget(QWidget):
         self.close_signal.emit(True)
         super().closeEvent(event)
         
+class SessionTableModel(QAbstractTableModel):
+    """
+    Table model of the sessions of a project. The model keeps the session dicts of the DB layer and a list of
+    their ids in display order, the cells are formatted when the view asks for them. Rows are handed to the view
+    in batches of FETCH_SIZE as it scrolls, sorting reorders the id list in place and the deltas of the DBAdapter
+    update single rows.
+    """
+    FETCH_SIZE = 200
+
+    def __init__(self, headers, keys, parent=None):
+        super().__init__(parent)
+        self.headers = headers
+        self.keys = keys
+        self.sessions = {}
+        self.order = []
+        # sid -> row in self.order
+        self.rows = {}
+        self.fetched = 0
+        self.sort_column = None
+        self.sort_order = Qt.SortOrder.AscendingOrder
+
+    def set_sessions(self, sessions):
+        self.beginResetModel()
+        self.sessions = dict(sessions)
+        self.order = list(sessions)
+        self.fetched = min(len(self.order), self.FETCH_SIZE)
+        if self.sort_column is not None:
+            self.order.sort(key=self._sort_key(self.sort_column), reverse=self.sort_order == Qt.SortOrder.DescendingOrder)
+        self._index_rows()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.fetched
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.headers)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        sid = self.order[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return str(self.sessions[sid].get(self.keys[index.column()], None))
+        if role == Qt.ItemDataRole.UserRole:
+            return sid
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.headers[section]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.fetched < len(self.order)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(len(self.order) - self.fetched, self.FETCH_SIZE)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.fetched, self.fetched + count - 1)
+        self.fetched += count
+        self.endInsertRows()
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        self.sort_column, self.sort_order = column, order
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        sids = [self.order[index.row()] for index in persistent]
+        self.order.sort(key=self._sort_key(column), reverse=order == Qt.SortOrder.DescendingOrder)
+        self._index_rows()
+        self.changePersistentIndexList(persistent, [self.index(self.rows[sid], index.column())
+                                                    for sid, index in zip(sids, persistent)])
+        self.layoutChanged.emit()
+
+    def session_id(self, row):
+        return self.order[row]
+
+    def session(self, row):
+        return self.sessions[self.order[row]]
+
+    def add_session(self, sid, session):
+        """
+        Inserts a session at its row in the active sort order, appends it if the model is not sorted. The view
+        shows it once it fetched the rows before it.
+        """
+        self.sessions[sid] = session
+        row = self._insert_row(sid)
+        visible = row < self.fetched or row == self.fetched == len(self.order)
+        if visible:
+            self.beginInsertRows(QModelIndex(), row, row)
+        self.order.insert(row, sid)
+        # only the rows after the inserted one move down
+        for moved in self.order[row + 1:]:
+            self.rows[moved] += 1
+        self.rows[sid] = row
+        if visible:
+            self.fetched += 1
+            self.endInsertRows()
+
+    def update_session(self, sid, changes):
+        """
+        Updates the changed fields of session sid and repaints its row. A change of the sorted column moves the
+        row to its position in the sort order.
+        """
+        row = self.rows.get(sid)
+        if row is None:
+            return
+        self.sessions[sid].update(changes)
+        if row < self.fetched:
+            self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.headers) - 1))
+        if self.sort_column is not None and self.keys[self.sort_column] in changes:
+            self._move_to_sorted_row(sid, row)
+
+    def remove_session(self, sid):
+        row = self.rows.get(sid)
+        if row is None:
+            return
+        visible = row < self.fetched
+        if visible:
+            self.beginRemoveRows(QModelIndex(), row, row)
+        del self.order[row]
+        del self.sessions[sid]
+        if visible:
+            self.fetched -= 1
+        # only the rows after the removed one move up
+        del self.rows[sid]
+        for moved in self.order[row:]:
+            self.rows[moved] -= 1
+        if visible:
+            self.endRemoveRows()
+
+    def _move_to_sorted_row(self, sid, row):
+        # the row is taken out and put back at its bisect position, the view is told as far as it fetched the rows
+        del self.order[row]
+        target = self._insert_row(sid)
+        self.order.insert(row, sid)
+        if target == row:
+            return
+        visible_before, visible_after = row < self.fetched, target < self.fetched
+        if visible_before and visible_after:
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), target + 1 if target > row else target)
+        elif visible_before:
+            self.beginRemoveRows(QModelIndex(), row, row)
+        elif visible_after:
+            self.beginInsertRows(QModelIndex(), target, target)
+        del self.order[row]
+        self.order.insert(target, sid)
+        # only the rows between the old and the new position move
+        for moved in range(min(row, target), max(row, target) + 1):
+            self.rows[self.order[moved]] = moved
+        if visible_before and visible_after:
+            self.endMoveRows()
+        elif visible_before:
+            self.fetched -= 1
+            self.endRemoveRows()
+        elif visible_after:
+            self.fetched += 1
+            self.endInsertRows()
+
+    def _insert_row(self, sid):
+        # after the sessions with an equal key, like the stable sort of sort()
+        if self.sort_column is None:
+            return len(self.order)
+        sort_key = self._sort_key(self.sort_column)
+        key = sort_key(sid)
+        if self.sort_order == Qt.SortOrder.DescendingOrder:
+            return bisect_left(self.order, True, key=lambda other: sort_key(other) < key)
+        return bisect_right(self.order, key, key=sort_key)
+
+    def _index_rows(self):
+        self.rows = {sid: row for row, sid in enumerate(self.order)}
+
+    def _sort_key(self, column):
+        key = self.keys[column]
+        def sort_key(sid):
+            value = self.sessions[sid].get(key)
+            if value is None:
+                return (1, '')
+            return (0, value) if isinstance(value, (int, float)) else (0, str(value).lower())
+        return sort_key
+
+
 class SessionViewer(QWidget):
     def __init__(self, parent=None, db_adapter=None, current_user=None):
         super().__init__(parent)
         self.db_adapter = db_adapter
         self.current_user = current_user
         self.fields = ["Name", "Capturer", "Museum", "Collection Name", "Session Dir", "# Captures"] # besser als uebergabe parameter, damit backend und hier immer gleich
-        self.row_ids = {}
+        self.keys = [field.replace(" ","_").lower().replace("#", "num") for field in self.fields]
         # Create the table view
         self.table_view = QTableView()
         self.table_view.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
@@ -528,35 +763,30 @@ class SessionViewer(QWidget):
         self.table_view.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
         self.table_view.customContextMenuRequested.connect(self.create_context_menu)
         self.table_view.verticalHeader().setVisible(False)
-        self.table_view.setSortingEnabled(True)
-        # Set the table model (you need to provide the data)
-        self.table_model = None  # Replace with your data model
+        # the model is created once, updates keep the sort order and the selection
+        self.table_model = SessionTableModel(self.fields, self.keys, self)
         self.table_view.setModel(self.table_model)
+        self.table_view.setSortingEnabled(True)
 
         # Set up the layout
         layout = QVBoxLayout()
         layout.addWidget(self.table_view)
         self.setLayout(layout)
 
-        self.table_model = QStandardItemModel(1, 5)
-        self.table_model.setHorizontalHeaderLabels(self.fields)
-        self.table_view.setModel(self.table_model)
-
     def set_data(self, data):
-        # Create and set the table model with the provided data
-        self.table_model = QStandardItemModel(len(data), 5)
-        self.table_model.setHorizontalHeaderLabels(self.fields)
-        fields = [field.replace(" ","_").lower().replace("#", "num") for field in self.fields]
-        for row, session_entry in enumerate(data.items()):
-            key, session = session_entry
-            for column, field in enumerate(fields):
-                item = QStandardItem(str(session.get(field,None)))
-                self.table_model.setItem(row, column, item)
-            self.row_ids[row] = key
-        self.table_view.setModel(self.table_model)
+        self.table_model.set_sessions(data)
+
+    def add_session(self, sid, session):
+        self.table_model.add_session(sid, session)
+
+    def update_session(self, sid, changes):
+        self.table_model.update_session(sid, changes)
+
+    def remove_session(self, sid):
+        self.table_model.remove_session(sid)
 
     def sort_by_column(self, column):
-        self.table_model.sort(column, Qt.AscendingOrder)
+        self.table_model.sort(column, Qt.SortOrder.AscendingOrder)
 
     def column_clicked(self, column):
         self.sort_by_column(column)
@@ -570,14 +800,17 @@ class SessionViewer(QWidget):
         # Erstelle die Aktionen für das Menü
         delete_action = QAction("Delete Session", self.table_view)
         open_in_file_browser_action = QAction("Open in filebrowser", self.table_view)
+        show_captures_action = QAction("Show Captures", self.table_view)
         
         # Füge die Aktionen dem Menü hinzu
         menu.addAction(delete_action)
         menu.addAction(open_in_file_browser_action)
+        menu.addAction(show_captures_action)
         
         # Verbinde die Aktionen mit Slots
         delete_action.triggered.connect(self.delete_session)
         open_in_file_browser_action.triggered.connect(self.open_in_file_browser)
+        show_captures_action.triggered.connect(self.show_captures)
         user = self.db_adapter.get_current_user()
         if not user:
             return
@@ -591,8 +824,7 @@ class SessionViewer(QWidget):
             row = self.context_menu_row
             if row == -1:
                 return
-            column = self.fields.index("Session Dir")
-            relative_dir = self.table_model.item(row, column).text()
+            relative_dir = self.table_model.session(row)['session_dir']
             project_dir = self.db_adapter.get_project_dir() / relative_dir
 
             if not project_dir.is_dir():
@@ -602,14 +834,21 @@ class SessionViewer(QWidget):
             self.open_dir_thread = OpenDirThread(project_dir)
             self.open_dir_thread.start()
 
+    def show_captures(self):
+        row = self.context_menu_row
+        if row == -1:
+            return
+        self.capture_viewer = CaptureViewer(self.db_adapter, self.table_model.session_id(row), self.table_model.session(row))
+        self.capture_viewer.show()
+
     def delete_session(self):
         row = self.context_menu_row
         if row == -1:
             return
-        session_id = self.row_ids[row]
-        session_name = self.table_model.item(row,0).text()
-        captures_column = self.fields.index('# Captures')
-        num_captures = self.table_model.item(row, captures_column).text()
+        session_id = self.table_model.session_id(row)
+        session = self.table_model.session(row)
+        session_name = session['name']
+        num_captures = session['num_captures']
         confirm = QMessageBox.question(self, "Confirm Deletion",
                                        f"{session_name} contains {num_captures} captures! Are you shure you want to delete it?")
         if not confirm == QMessageBox.StandardButton.Yes:
@@ -621,8 +860,348 @@ class SessionViewer(QWidget):
         except Exception as e:
             QMessageBox.warning(self, "Something went wrong", str(e))
 
+class CaptureModel(QAbstractListModel):
+    """
+    List model of the captures of a session. The thumbnails are decoded at reduced resolution on a thread pool
+    when the view paints a cell for the first time, and kept in an LRU cache of at most cache_size thumbnails,
+    so the memory does not grow with the number of captures. Rows are handed to the view in batches of
+    FETCH_SIZE as it scrolls. resolve maps the path of a capture to the file that is decoded, e.g. its cached
+    thumbnail.
+    """
+    FETCH_SIZE = 200
+
+    def __init__(self, project_dir, thumbnail_size=160, cache_size=300, resolve=None, parent=None):
+        super().__init__(parent)
+        self.project_dir = Path(project_dir)
+        self.resolve = resolve
+        self.thumbnail_size = thumbnail_size
+        self.cache_size = cache_size
+        self.captures = []
+        # capture path -> row
+        self.rows = {}
+        self.fetched = 0
+        self.thumbnails = OrderedDict()
+        self.failed = set()
+        # image path -> capture and cancel event of the queued decode
+        self.pending = {}
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max(2, QThreadPool.globalInstance().maxThreadCount() // 2))
+
+    def set_captures(self, captures):
+        self.beginResetModel()
+        self.cancel_pending()
+        self.captures = list(captures)
+        self.rows = {capture: row for row, capture in enumerate(self.captures)}
+        self.fetched = min(len(self.captures), self.FETCH_SIZE)
+        self.thumbnails.clear()
+        self.failed.clear()
+        self.endResetModel()
+
+    def add_capture(self, capture):
+        row = len(self.captures)
+        visible = self.fetched == row
+        if visible:
+            self.beginInsertRows(QModelIndex(), row, row)
+        self.captures.append(capture)
+        self.rows[capture] = row
+        if visible:
+            self.fetched += 1
+            self.endInsertRows()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.fetched
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.fetched < len(self.captures)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(len(self.captures) - self.fetched, self.FETCH_SIZE)
+        if count <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.fetched, self.fetched + count - 1)
+        self.fetched += count
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        capture = self.captures[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return Path(capture).name
+        if role == Qt.ItemDataRole.ToolTipRole:
+            return capture
+        if role == Qt.ItemDataRole.UserRole:
+            return str(self.project_dir / capture)
+        if role == Qt.ItemDataRole.DecorationRole:
+            thumbnail = self.thumbnails.get(capture)
+            if thumbnail is not None:
+                self.thumbnails.move_to_end(capture)
+                return thumbnail
+            self._request(capture)
+        return None
+
+    def cancel_pending(self, first=None, last=None):
+        """
+        Cancels the queued decodes of the rows outside of first..last, all of them by default.
+        """
+        for path, (capture, cancel_event) in list(self.pending.items()):
+            row = self.rows.get(capture)
+            if first is None or row is None or not first <= row <= last:
+                cancel_event.set()
+                del self.pending[path]
+
+    def _request(self, capture):
+        path = str(self.project_dir / capture)
+        if path in self.pending or capture in self.failed:
+            return
+        worker = ThumbnailWorker(path, self.thumbnail_size, resolve=self.resolve)
+        worker.signals.decoded.connect(self._on_decoded)
+        self.pending[path] = (capture, worker.cancel_event)
+        self.pool.start(worker)
+
+    def _on_decoded(self, path, image):
+        capture, _ = self.pending.pop(path, (None, None))
+        if capture not in self.rows:
+            return
+        if image.isNull():
+            self.failed.add(capture)
+            return
+        self.thumbnails[capture] = QPixmap.fromImage(image)
+        while len(self.thumbnails) > self.cache_size:
+            self.thumbnails.popitem(last=False)
+        index = self.index(self.rows[capture])
+        self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+
 class CaptureViewer(QWidget):
-    pass
+    """
+    Thumbnail grid of the captures of a session. New captures of the session are added while the viewer is open.
+    """
+    THUMBNAIL_SIZE = 160
+
+    def __init__(self, db_adapter, sid, session, parent=None):
+        super().__init__(parent)
+        self.db_adapter = db_adapter
+        self.sid = sid
+        self.setWindowTitle(f"Captures of {session['name']}")
+        self.setGeometry(200, 200, 900, 700)
+        # the thumbnails are decoded from the derivative cache of the project instead of the full size captures
+        self.model = CaptureModel(db_adapter.get_project_dir(), self.THUMBNAIL_SIZE,
+                                  resolve=lambda path: db_adapter.get_derivative(path, 'thumbnail'), parent=self)
+        self.model.set_captures(session['captures'])
+
+        self.grid = QListView()
+        self.grid.setViewMode(QListView.ViewMode.IconMode)
+        self.grid.setResizeMode(QListView.ResizeMode.Adjust)
+        self.grid.setMovement(QListView.Movement.Static)
+        # uniform cells keep the layout from asking every row for its thumbnail
+        self.grid.setUniformItemSizes(True)
+        self.grid.setIconSize(QSize(self.THUMBNAIL_SIZE, self.THUMBNAIL_SIZE))
+        self.grid.setGridSize(QSize(self.THUMBNAIL_SIZE + 20, self.THUMBNAIL_SIZE + 40))
+        self.grid.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.grid.setModel(self.model)
+        self.count_label = QLabel()
+        self.update_count()
+
+        layout = QVBoxLayout(self)
+        layout.addWidget(self.count_label)
+        layout.addWidget(self.grid)
+
+        self.grid.verticalScrollBar().valueChanged.connect(self.cancel_hidden_decodes)
+        self.db_adapter.capture_added_signal.connect(self.add_capture)
+        self.db_adapter.session_removed_signal.connect(self.on_session_removed)
+
+    def cancel_hidden_decodes(self):
+        viewport = self.grid.viewport().rect()
+        first = self.grid.indexAt(viewport.topLeft())
+        last = self.grid.indexAt(viewport.bottomRight())
+        first_row = first.row() if first.isValid() else 0
+        last_row = last.row() if last.isValid() else self.model.rowCount() - 1
+        self.model.cancel_pending(first_row, last_row)
+
+    def add_capture(self, sid, capture):
+        if sid == self.sid:
+            self.model.add_capture(capture)
+            self.update_count()
+
+    def on_session_removed(self, sid):
+        if sid == self.sid:
+            self.close()
+
+    def update_count(self):
+        self.count_label.setText(f"{len(self.model.captures)} captures")
+
+    def closeEvent(self, event):
+        self.db_adapter.capture_added_signal.disconnect(self.add_capture)
+        self.db_adapter.session_removed_signal.disconnect(self.on_session_removed)
+        self.model.cancel_pending()
+        super().closeEvent(event)
+
+class CaptureSearch(QWidget):
+    """
+    Searches the captures of the loaded project by taxon, museum, capturer, session and capture date and
+    shows the results page by page.
+    """
+    close_signal = pyqtSignal(bool)
+    PAGE_SIZE = 50
+    SEARCH_FIELDS = ['order', 'family', 'genus', 'species', 'museum', 'capturer', 'session']
+    RESULT_COLUMNS = {'Session Name': 'sessionName', 'Order': 'order', 'Family': 'family', 'Genus': 'genus',
+                      'Species': 'species', 'Museum': 'museum', 'Capturer': 'capturer', 'Timestamp': 'timestamp',
+                      'Directory': 'directory'}
+
+    def __init__(self, db_adapter, parent=None):
+        super().__init__(parent)
+        self.db_adapter = db_adapter
+        self.page = 0
+        self.criteria = {}
+        self.setWindowTitle("Search Captures")
+        self.init_ui()
+
+    def init_ui(self):
+        main_layout = QVBoxLayout(self)
+        form_layout = QGridLayout()
+        self.inputs = {}
+        for i, field in enumerate(self.SEARCH_FIELDS):
+            combo_box = QComboBox()
+            combo_box.setEditable(True)
+            form_layout.addWidget(QLabel(field.title()), i // 4, 2 * (i % 4))
+            form_layout.addWidget(combo_box, i // 4, 2 * (i % 4) + 1)
+            self.inputs[field] = combo_box
+        self.date_from_input = QLineEdit()
+        self.date_from_input.setPlaceholderText("YYYY[-MM[-DD]]")
+        self.date_to_input = QLineEdit()
+        self.date_to_input.setPlaceholderText("YYYY[-MM[-DD]]")
+        row = len(self.SEARCH_FIELDS) // 4 + 1
+        form_layout.addWidget(QLabel("Captured from"), row, 0)
+        form_layout.addWidget(self.date_from_input, row, 1)
+        form_layout.addWidget(QLabel("to"), row, 2)
+        form_layout.addWidget(self.date_to_input, row, 3)
+        main_layout.addLayout(form_layout)
+
+        self.search_button = QPushButton("Search")
+        self.search_button.clicked.connect(self.search)
+        main_layout.addWidget(self.search_button)
+
+        self.result_table = QTableView()
+        self.result_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.result_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.result_table.verticalHeader().setVisible(False)
+        self.result_model = QStandardItemModel(0, len(self.RESULT_COLUMNS))
+        self.result_model.setHorizontalHeaderLabels(list(self.RESULT_COLUMNS.keys()))
+        self.result_table.setModel(self.result_model)
+        main_layout.addWidget(self.result_table)
+
+        page_layout = QHBoxLayout()
+        self.previous_button = QPushButton("Previous")
+        self.next_button = QPushButton("Next")
+        self.page_label = QLabel()
+        self.previous_button.clicked.connect(lambda: self.show_page(self.page - 1))
+        self.next_button.clicked.connect(lambda: self.show_page(self.page + 1))
+        page_layout.addWidget(self.previous_button)
+        page_layout.addWidget(self.page_label)
+        page_layout.addWidget(self.next_button)
+        main_layout.addLayout(page_layout)
+        self.previous_button.setEnabled(False)
+        self.next_button.setEnabled(False)
+        self.refresh_values()
+
+    def refresh_values(self):
+        for field, combo_box in self.inputs.items():
+            text = combo_box.currentText()
+            combo_box.clear()
+            combo_box.addItems([''] + self.db_adapter.get_search_values(field))
+            combo_box.setEditText(text)
+
+    def search(self):
+        self.criteria = {field: combo_box.currentText().strip() for field, combo_box in self.inputs.items()
+                         if combo_box.currentText().strip()}
+        if self.date_from_input.text().strip():
+            self.criteria['date_from'] = self.date_from_input.text().strip()
+        if self.date_to_input.text().strip():
+            self.criteria['date_to'] = self.date_to_input.text().strip()
+        self.show_page(0)
+
+    def show_page(self, page):
+        result = self.db_adapter.search_captures(page=page, page_size=self.PAGE_SIZE, **self.criteria)
+        self.page = page
+        self.result_model.setRowCount(0)
+        for capture in result['captures']:
+            self.result_model.appendRow([QStandardItem(str(capture.get(column) or ''))
+                                         for column in self.RESULT_COLUMNS.values()])
+        num_pages = max(1, -(-result['total'] // self.PAGE_SIZE))
+        self.page_label.setText(f"Page {page + 1} of {num_pages} ({result['total']} captures)")
+        self.previous_button.setEnabled(page > 0)
+        self.next_button.setEnabled(page + 1 < num_pages)
+        self.result_table.resizeColumnsToContents()
+
+    def closeEvent(self, event):
+        self.close_signal.emit(True)
+        super().closeEvent(event)
+
+class CatalogBrowser(CaptureSearch):
+    """
+    Searches the captures of all projects registered in the global catalog. The projects are only read, the
+    browser registers project directories and rescans the changed project files.
+    """
+    RESULT_COLUMNS = {'Project': 'project', **CaptureSearch.RESULT_COLUMNS}
+
+    def __init__(self, global_catalog, parent=None):
+        # the global catalog answers the same search calls as the DBAdapter
+        self.global_catalog = global_catalog
+        super().__init__(global_catalog, parent)
+        self.setWindowTitle("Global Catalog")
+
+    def init_ui(self):
+        super().init_ui()
+        button_layout = QHBoxLayout()
+        self.add_projects_button = QPushButton("Add Projects")
+        self.rescan_button = QPushButton("Rescan Projects")
+        self.projects_label = QLabel()
+        self.add_projects_button.clicked.connect(self.add_projects)
+        self.rescan_button.clicked.connect(self.rescan)
+        button_layout.addWidget(self.projects_label)
+        button_layout.addWidget(self.add_projects_button)
+        button_layout.addWidget(self.rescan_button)
+        self.layout().insertLayout(0, button_layout)
+        self.update_projects_label()
+
+    def add_projects(self):
+        directory = QFileDialog.getExistingDirectory(self, "Select a directory containing projects")
+        if not directory:
+            return
+        project_dirs = find_projects(directory)
+        if not project_dirs:
+            QMessageBox.information(self, "Global Catalog", f"No projects found in {directory}.")
+            return
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            for project_dir in project_dirs:
+                self.global_catalog.register(project_dir)
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.refresh()
+
+    def rescan(self):
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            self.global_catalog.scan()
+        finally:
+            QApplication.restoreOverrideCursor()
+        self.refresh()
+
+    def refresh(self):
+        self.update_projects_label()
+        self.refresh_values()
+        self.show_page(0)
+
+    def update_projects_label(self):
+        projects = self.global_catalog.projects()
+        num_captures = sum(project['num_captures'] for project in projects)
+        self.projects_label.setText(f"{len(projects)} projects, {num_captures} captures")
+
+    def closeEvent(self, event):
+        self.global_catalog.close()
+        super().closeEvent(event)
 
 class SessionCreator(QDialog):
     close_signal = pyqtSignal(bool)
@@ -723,6 +1302,9 @@ class ProjectViewer(QWidget):
 
         self.db_adapter.project_changed_signal.connect(self.update_project_list)
         self.db_adapter.sessions_signal.connect(self.update_session_view)
+        self.db_adapter.session_added_signal.connect(self.session_view.add_session)
+        self.db_adapter.session_updated_signal.connect(self.session_view.update_session)
+        self.db_adapter.session_removed_signal.connect(self.session_view.remove_session)
 
     def set_enable_conext_menu(self, enable):
         self.session_view.set_enable_context_menu(enable)
@@ -747,8 +1329,7 @@ class ProjectViewer(QWidget):
         return item_strings
     
     def update_session_view(self, sessions):
-        self.sessions = sessions
-        self.session_view.set_data(self.sessions)
+        self.session_view.set_data(sessions)
 
     def set_camera_data(self, camera_data):
         pass # think about how to implement this
@@ -1,8 +1,33 @@
 import pytest
 import numpy as np
 import json
+import os
+import yaml
+import errno
 import shutil
+import threading
+import time
+import multiprocessing
+import pandas as pd
+from datetime import datetime
+from pathlib import Path
+from PIL import Image
 from src.db.DB import FileAgnosticDB, DBAdapter, DummyDB
+from src.db.SQLiteCatalog import SQLiteCatalog
+from src.db.StationCatalog import StationCatalog, StationJournal
+from src.db.SessionJournal import SessionJournal
+from src.db.FileLock import FileLock, LockedError
+from src.utils.exif import write_user_comment, read_user_comment, split_app1, read_head
+from src.utils.ingest import ingest_capture, link_or_copy, content_hash, new_hasher
+from src.utils.sidecar import dump_sidecar, load_sidecar, find_sidecar, migrate_sidecars, benchmark, SIDECAR_JSON
+from src.db.ContentIndex import ContentIndex
+from src.db.JsonCatalog import get_csv_header
+from src.db.SearchIndex import SearchIndex
+from src.db.DerivativeCache import DerivativeCache
+from src.db.GlobalCatalog import GlobalCatalog, find_projects
+from PyQt6.QtCore import Qt
+from src.widgets.Project import SessionTableModel, CaptureModel
+from src.db.Transaction import TransactionManager, write_file, append_file, read_staged, FSYNC_NONE, FSYNC_TRANSACTION, FSYNC_BATCH
 
 museum_data = {
     "name": "Senkenberg",
@@ -77,6 +102,21 @@ def dummy_img_dir():
 
 
 
+@pytest.fixture
+def tmp_img_dir(tmp_path, dummy_img):
+    img_dir = tmp_path / 'tmp_img.jpg'
+    exif = Image.Exif()
+    exif[0x010F] = 'Sony'
+    Image.fromarray(dummy_img).save(img_dir, exif=exif)
+    return str(img_dir)
+
+@pytest.fixture
+def sqlite_db(tmp_path):
+    db = FileAgnosticDB(catalog=SQLiteCatalog())
+    project_config['project_dir'] = str(tmp_path / project_config['name'])
+    db.create_project(project_config)
+    return db
+
 @pytest.fixture
 def corrupted_dummy_img():
     pass
@@ -183,6 +223,818 @@ class TestFileAgnosticDB:
         dummy_meta['collectionName'] = None
         file_agnostic_db._update_captures_csv(dummy_meta)
 
+class TestSessionJournal:
+
+    def test_post_new_image_appends(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        for _ in range(2):
+            file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        project_data_dir = file_agnostic_db.get_project_dir() / '.project'
+        assert json.loads((project_data_dir / '.sessions.json').read_text()) == {}
+        assert len((project_data_dir / '.sessions.journal').read_text().splitlines()) == 3
+
+    def test_replay_after_crash(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        journal_file = file_agnostic_db.get_project_dir() / '.project' / '.sessions.journal'
+        with journal_file.open('a') as f:
+            f.write('{"op": "add_capture", "sid": ')
+        db = FileAgnosticDB()
+        db.load_project(file_agnostic_db.get_project_dir())
+        sessions = db.load_sessions()
+        assert sessions[sid]['num_captures'] == 1
+        assert len(sessions[sid]['captures']) == 1
+
+    def test_compaction_on_close(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        sessions = file_agnostic_db.load_sessions()
+        project_data_dir = file_agnostic_db.get_project_dir() / '.project'
+        file_agnostic_db.clear()
+        assert json.loads((project_data_dir / '.sessions.json').read_text()) == sessions
+        assert (project_data_dir / '.sessions.journal').read_text() == ''
+
+    def test_snapshot_is_a_copy(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        sessions = file_agnostic_db.load_sessions()
+        sessions[sid]['captures'].append(sessions[sid]['captures'][0])
+        project_data_dir = file_agnostic_db.get_project_dir() / '.project'
+        file_agnostic_db.clear()
+        compacted = json.loads((project_data_dir / '.sessions.json').read_text())
+        assert len(compacted[sid]['captures']) == compacted[sid]['num_captures'] == 1
+
+    def test_add_captures_once(self, tmp_path):
+        sessions_file = tmp_path / '.sessions.json'
+        sessions_file.write_text(json.dumps({'s1': {'captures': ['a'], 'num_captures': 1}}))
+        journal = SessionJournal(sessions_file, tmp_path / '.sessions.journal', idle_timeout=None).load()
+        journal.append('add_captures', 's1', paths=['a', 'b', 'b', 'c'])
+        journal.append('add_capture', 's1', path='c')
+        assert journal.get('s1') == {'captures': ['a', 'b', 'c'], 'num_captures': 3}
+        journal.append('update_session', 's1', fields={'captures': ['d'], 'num_captures': 1})
+        journal.append('add_capture', 's1', path='a')
+        # replayed from the journal, the view is the same
+        assert SessionJournal(sessions_file, journal.journal_file, idle_timeout=None).load().get('s1') == \
+            journal.get('s1') == {'captures': ['d', 'a'], 'num_captures': 2}
+
+class TestFileCache:
+
+    def test_repeated_reads_hit(self, file_agnostic_db):
+        file_agnostic_db.get_project_info()
+        file_agnostic_db.load_sessions()
+        before = file_agnostic_db.get_cache_stats()
+        for _ in range(3):
+            file_agnostic_db.get_project_info()
+            file_agnostic_db.load_sessions()
+        stats = file_agnostic_db.get_cache_stats()
+        assert stats['hits'] - before['hits'] == 6
+        assert stats['misses'] == before['misses']
+
+    def test_external_edit_is_picked_up(self, file_agnostic_db):
+        file_agnostic_db.get_project_info()
+        project_file = file_agnostic_db.get_project_dir() / '.project' / '.project.json'
+        project_info = json.loads(project_file.read_text())
+        project_info['name'] = 'changed by another station'
+        project_file.write_text(json.dumps(project_info))
+        assert file_agnostic_db.get_project_info()['name'] == 'changed by another station'
+
+    def test_external_session_is_picked_up(self, file_agnostic_db):
+        file_agnostic_db.load_sessions()
+        project_data_dir = file_agnostic_db.get_project_dir() / '.project'
+        with (project_data_dir / '.sessions.journal').open('a') as f:
+            f.write(json.dumps({'op': 'add_session', 'sid': 'abc', 'session': {'name': 'session-001', 'session_dir': 'captures/session-001', 'num_captures': 0, 'captures': []}}) + "\n")
+        assert 'abc' in file_agnostic_db.load_sessions()
+
+    def test_cached_values_are_copies(self, file_agnostic_db):
+        file_agnostic_db.get_project_info()['name'] = 'bar'
+        assert file_agnostic_db.get_project_info()['name'] == 'foo'
+
+class TestExifWriter:
+
+    def test_write_user_comment(self, tmp_img_dir, dummy_meta):
+        write_user_comment(tmp_img_dir, str(dummy_meta))
+        assert read_user_comment(tmp_img_dir) == str(dummy_meta)
+        with Image.open(tmp_img_dir) as img:
+            assert img.getexif()[0x010F] == 'Sony'
+
+    def test_image_data_is_not_reencoded(self, tmp_img_dir):
+        _, _, tail_before = split_app1(open(tmp_img_dir, 'rb').read())
+        write_user_comment(tmp_img_dir, 'first')
+        write_user_comment(tmp_img_dir, 'second')
+        _, _, tail_after = split_app1(open(tmp_img_dir, 'rb').read())
+        assert tail_before == tail_after
+        assert read_user_comment(tmp_img_dir) == 'second'
+
+    def test_image_without_exif(self, tmp_path, dummy_img):
+        img_path = tmp_path / 'no_exif.jpg'
+        Image.fromarray(dummy_img).save(img_path)
+        write_user_comment(img_path, 'comment')
+        assert read_user_comment(img_path) == 'comment'
+
+    def test_not_a_jpeg(self, tmp_path, dummy_img):
+        img_path = tmp_path / 'img.png'
+        Image.fromarray(dummy_img).save(img_path)
+        with pytest.raises(ValueError):
+            write_user_comment(img_path, 'comment')
+
+    def test_corrupted_segment_length(self, tmp_path):
+        img_path = tmp_path / 'corrupted.jpg'
+        # an APP0 segment of length 0 followed by image data
+        img_path.write_bytes(b'\xff\xd8\xff\xe0\x00\x00' + bytes(64))
+        with pytest.raises(ValueError, match='segment length'):
+            split_app1(img_path.read_bytes())
+        with open(img_path, 'rb') as f, pytest.raises(ValueError, match='segment length'):
+            read_head(f)
+
+class TestIngest:
+
+    def test_exif_after_comment_segment(self, tmp_path, tmp_img_dir):
+        src = tmp_path / 'commented.jpg'
+        data = open(tmp_img_dir, 'rb').read()
+        # a COM segment before the Exif segment, as some cameras and editors write it
+        src.write_bytes(data[:2] + b'\xff\xfe\x00\x09created' + data[2:])
+        dst = tmp_path / 'capture.jpg'
+        ingest_capture(src, dst, comment='comment')
+        assert dst.read_bytes().count(b'Exif\x00\x00') == 1
+        assert read_user_comment(dst) == 'comment'
+        with Image.open(dst) as img:
+            assert img.getexif()[0x010F] == 'Sony'
+        assert content_hash(dst) == content_hash(src)
+
+    def test_stream_with_comment(self, tmp_path, tmp_img_dir):
+        dst = tmp_path / 'capture.jpg'
+        assert ingest_capture(tmp_img_dir, dst, comment='comment') == 'streamed'
+        assert read_user_comment(dst) == 'comment'
+        assert split_app1(dst.read_bytes())[2] == split_app1(open(tmp_img_dir, 'rb').read())[2]
+        assert Path(tmp_img_dir).is_file()
+        assert not list(tmp_path.glob('.*.part'))
+
+    def test_move_with_comment(self, tmp_path, tmp_img_dir):
+        dst = tmp_path / 'capture.jpg'
+        ingest_capture(tmp_img_dir, dst, comment='comment', move=True)
+        assert read_user_comment(dst) == 'comment'
+        assert not Path(tmp_img_dir).exists()
+
+    def test_move_without_comment(self, tmp_path, tmp_img_dir):
+        content = Path(tmp_img_dir).read_bytes()
+        dst = tmp_path / 'capture.jpg'
+        assert ingest_capture(tmp_img_dir, dst, move=True) == 'streamed'
+        assert dst.read_bytes() == content
+        assert not Path(tmp_img_dir).exists()
+
+    def test_link_over_stale_part(self, tmp_path, tmp_img_dir):
+        dst = tmp_path / 'capture.jpg'
+        (tmp_path / '.capture.jpg.part').write_bytes(b'torn')
+        link_or_copy(tmp_img_dir, dst)
+        assert dst.read_bytes() == Path(tmp_img_dir).read_bytes()
+        assert not list(tmp_path.glob('.*.part'))
+
+    def test_not_a_jpeg_is_copied(self, tmp_path, dummy_img):
+        src = tmp_path / 'img.png'
+        Image.fromarray(dummy_img).save(src)
+        dst = tmp_path / 'capture.png'
+        ingest_capture(src, dst, comment='comment')
+        assert dst.read_bytes() == src.read_bytes()
+
+    def test_post_new_image_moves_capture(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        _, session = file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid, 'move': True})
+        capture = file_agnostic_db.get_project_dir() / session['captures'][0]
+        assert not Path(tmp_img_dir).exists()
+        assert 'captureID' in read_user_comment(capture)
+
+@pytest.fixture
+def source_adapter(tmp_path, dummy_meta):
+    db = FileAgnosticDB()
+    db.create_project(dict(project_config, project_dir=str(tmp_path / 'source')))
+    sessions = db.create_session(session_data.copy())
+    sid = list(sessions.keys())[-1]
+    for i in range(5):
+        img_dir = tmp_path / f'source_{i}.jpg'
+        Image.fromarray(np.random.randint(0, 255, (100, 100, 3), dtype=np.uint8)).save(img_dir)
+        db.post_new_image({'img_dir': str(img_dir), 'meta_info': dummy_meta.copy(), 'sid': sid})
+    return DBAdapter(db)
+
+class TestBulkImport:
+
+    def test_merge_project(self, file_agnostic_db, source_adapter):
+        progress = []
+        project_info, sessions = file_agnostic_db.merge_project(source_adapter, False, progress=lambda done, total: progress.append((done, total)))
+        sid, session = list(sessions.items())[-1]
+        assert project_info['num_captures'] == '5'
+        assert session['num_captures'] == 5
+        assert progress[-1] == (5, 5)
+        for capture in session['captures']:
+            assert (file_agnostic_db.get_project_dir() / capture).is_file()
+            assert (file_agnostic_db.get_project_dir() / capture).with_suffix('.yml').is_file()
+        assert len(file_agnostic_db.query_captures()) == 5
+
+    def test_merge_twice_skips_existing_sessions(self, file_agnostic_db, source_adapter):
+        file_agnostic_db.merge_project(source_adapter, False)
+        project_info, sessions = file_agnostic_db.merge_project(source_adapter, False)
+        assert project_info['num_captures'] == '5'
+        assert len(sessions) == 1
+
+    def test_cancel_merge(self, monkeypatch, file_agnostic_db, source_adapter):
+        cancel_event = threading.Event()
+        copied = []
+        def slow_ingest(*args, **kwargs):
+            if cancel_event.is_set():
+                time.sleep(0.2)
+            ingest_capture(*args, **kwargs)
+            copied.append(args[1])
+            if len(copied) == 2:
+                cancel_event.set()
+        monkeypatch.setattr('src.db.DB.ingest_capture', slow_ingest)
+        monkeypatch.setattr(FileAgnosticDB, 'IMPORT_WORKERS', 1)
+        project_info, sessions = file_agnostic_db.merge_project(source_adapter, False, cancel_event=cancel_event)
+        session = list(sessions.values())[-1]
+        n_imported = int(project_info['num_captures'])
+        assert 2 <= n_imported < 5
+        assert session['num_captures'] == n_imported
+        session_dir = file_agnostic_db.get_project_dir() / session['session_dir']
+        assert sorted(str(p.relative_to(file_agnostic_db.get_project_dir())) for p in session_dir.glob('*.jpg')) == sorted(session['captures'])
+
+    def test_failed_copy_keeps_prefix(self, monkeypatch, file_agnostic_db, source_adapter):
+        copied = []
+        def failing_ingest(*args, **kwargs):
+            if len(copied) == 2:
+                raise OSError("No space left on device")
+            ingest_capture(*args, **kwargs)
+            copied.append(args[1])
+        monkeypatch.setattr('src.db.DB.ingest_capture', failing_ingest)
+        monkeypatch.setattr(FileAgnosticDB, 'IMPORT_WORKERS', 1)
+        with pytest.raises(OSError):
+            file_agnostic_db.merge_project(source_adapter, False)
+        session = list(file_agnostic_db.load_sessions().values())[-1]
+        assert session['num_captures'] == 2
+        session_dir = file_agnostic_db.get_project_dir() / session['session_dir']
+        assert sorted(str(p.relative_to(file_agnostic_db.get_project_dir())) for p in session_dir.glob('*.jpg')) == sorted(session['captures'])
+        assert len(list(session_dir.glob('*_cap-*.yml'))) == 2
+
+    def test_progress_counts_skipped_captures(self, tmp_path, file_agnostic_db, source_adapter, dummy_meta):
+        source_db = source_adapter.db_manager
+        sid, source_session = list(source_db.load_sessions().items())[-1]
+        # the same image twice in the source session, the second one is skipped as a duplicate
+        duplicate = tmp_path / 'duplicate.jpg'
+        shutil.copy(source_db.get_project_dir() / source_session['captures'][0], duplicate)
+        source_db.post_new_image({'img_dir': str(duplicate), 'meta_info': dummy_meta.copy(), 'sid': sid})
+        progress = []
+        project_info, _ = file_agnostic_db.merge_project(source_adapter, False, progress=lambda done, total: progress.append((done, total)))
+        assert project_info['num_captures'] == '5'
+        assert progress[-1] == (6, 6)
+
+    def test_merge_with_links(self, file_agnostic_db, source_adapter):
+        _, sessions = file_agnostic_db.merge_project(source_adapter, False, link_files=True)
+        stats = file_agnostic_db.get_import_stats()
+        assert stats['files_linked'] + stats['files_copied'] == 5
+        assert stats['files_linked'] == 5
+        assert stats['bytes_copied'] == 0
+        source_captures = list(source_adapter.load_sessions().values())[-1]['captures']
+        target_captures = list(sessions.values())[-1]['captures']
+        for source_capture, target_capture in zip(source_captures, target_captures):
+            source_file = source_adapter.get_project_dir() / source_capture
+            target_file = file_agnostic_db.get_project_dir() / target_capture
+            assert source_file.read_bytes() == target_file.read_bytes()
+
+    def test_merge_copy_stats(self, file_agnostic_db, source_adapter):
+        file_agnostic_db.merge_project(source_adapter, False)
+        stats = file_agnostic_db.get_import_stats()
+        assert stats['files_copied'] == 5
+        assert stats['bytes_copied'] > 0
+
+    def test_link_or_copy_falls_back_to_copy(self, monkeypatch, tmp_path, tmp_img_dir):
+        def no_link(src, dst):
+            raise OSError(errno.EXDEV, "cross-device link")
+        monkeypatch.setattr('src.utils.ingest.os.link', no_link)
+        monkeypatch.setattr('src.utils.ingest.fcntl', None)
+        dst = tmp_path / 'capture.jpg'
+        method, bytes_copied = link_or_copy(tmp_img_dir, dst)
+        assert method == 'copy'
+        assert bytes_copied == dst.stat().st_size
+        assert dst.read_bytes() == Path(tmp_img_dir).read_bytes()
+
+    def test_merge_into_sqlite(self, sqlite_db, source_adapter):
+        project_info, sessions = sqlite_db.merge_project(source_adapter, False)
+        assert project_info['num_captures'] == '5'
+        assert len(list(sessions.values())[-1]['captures']) == 5
+
+    def test_merge_project_async(self, qtbot, file_agnostic_db, source_adapter):
+        adapter = DBAdapter(file_agnostic_db)
+        with qtbot.waitSignal(adapter.merge_completed_signal, timeout=5000) as blocker:
+            adapter.merge_project_async(source_adapter, False)
+        assert blocker.args == [False]
+        assert file_agnostic_db.get_project_info()['num_captures'] == '5'
+
+class TestContentIndex:
+
+    def test_hash_ignores_exif(self, tmp_path, tmp_img_dir):
+        dst = tmp_path / 'capture.jpg'
+        hasher = new_hasher()
+        ingest_capture(tmp_img_dir, dst, comment='comment', hasher=hasher)
+        assert hasher.hexdigest() == content_hash(dst) == content_hash(tmp_img_dir)
+
+    def test_hash_stored_with_capture(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        _, session = file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        capture = session['captures'][0]
+        meta_info = yaml.safe_load((file_agnostic_db.get_project_dir() / capture).with_suffix('.yml').read_text())
+        assert meta_info['contentHash'] == content_hash(tmp_img_dir)
+        assert file_agnostic_db.content_index.get(meta_info['contentHash']) == [capture]
+
+    def test_merge_skips_existing_captures(self, tmp_path, file_agnostic_db, source_adapter, dummy_meta):
+        # a second source session with the same image
+        source_db = source_adapter.db_manager
+        sessions = source_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        capture = (source_db.get_project_dir() / list(sessions.values())[0]['captures'][0])
+        shutil.copy(capture, tmp_path / 'copy.jpg')
+        source_db.post_new_image({'img_dir': str(tmp_path / 'copy.jpg'), 'meta_info': dummy_meta.copy(), 'sid': sid})
+        project_info, _ = file_agnostic_db.merge_project(source_adapter, False)
+        assert project_info['num_captures'] == '5'
+        assert file_agnostic_db.get_import_stats()['files_skipped'] == 1
+
+    def test_find_duplicates(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        for _ in range(2):
+            _, session = file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        # captures of projects without an index are hashed on demand
+        (file_agnostic_db.get_project_dir() / '.project' / ContentIndex.FILE_NAME).unlink()
+        file_agnostic_db.load_project(file_agnostic_db.get_project_dir())
+        duplicates = file_agnostic_db.find_duplicates()
+        assert list(duplicates.values()) == [session['captures']]
+
+    def test_delete_session_updates_index(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        first_sid = list(sessions.keys())[-1]
+        file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': first_sid})
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        file_agnostic_db.delete_session(first_sid)
+        index = ContentIndex(file_agnostic_db.get_project_dir()).load()
+        paths = index.get(content_hash(tmp_img_dir))
+        assert len(paths) == 1
+        assert paths[0].startswith(f'captures/{sid}/')
+
+class TestStableSessions:
+
+    def test_session_dir_is_keyed_by_id(self, file_agnostic_db):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid, session = list(sessions.items())[-1]
+        assert session['session_dir'] == f'captures/{sid}'
+        assert session['name'] == 'session-001'
+        assert (file_agnostic_db.get_project_dir() / session['session_dir']).is_dir()
+
+    def test_delete_session_keeps_other_sessions(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sids = []
+        for _ in range(3):
+            sessions = file_agnostic_db.create_session(session_data.copy())
+            sid = list(sessions.keys())[-1]
+            file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+            sids.append(sid)
+        before = file_agnostic_db.load_sessions()
+        project_info, sessions = file_agnostic_db.delete_session(sids[0])
+        assert sessions == {sid: before[sid] for sid in sids[1:]}
+        assert project_info['num_captures'] == '2'
+        for session in sessions.values():
+            for capture in session['captures']:
+                assert (file_agnostic_db.get_project_dir() / capture).is_file()
+        # labels are not reused
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        assert list(sessions.values())[-1]['name'] == 'session-004'
+
+    def test_removed_captures_are_purged_on_close(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sids = []
+        for _ in range(2):
+            sessions = file_agnostic_db.create_session(session_data.copy())
+            sid = list(sessions.keys())[-1]
+            file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+            sids.append(sid)
+        file_agnostic_db.delete_session(sids[0])
+        project_dir = file_agnostic_db.get_project_dir()
+        file_agnostic_db.clear()
+        csv = pd.read_csv(project_dir / 'captures.csv')
+        assert len(csv) == 1
+        assert csv['Session Name'].tolist() == ['session-002']
+
+class TestCaptureStore:
+
+    def _post_images(self, db, tmp_img_dir, dummy_meta, n_sessions=2, n_captures=2):
+        sids = []
+        for _ in range(n_sessions):
+            sessions = db.create_session(session_data.copy())
+            sid = list(sessions.keys())[-1]
+            for _ in range(n_captures):
+                db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+            sids.append(sid)
+        return sids
+
+    def test_partition_per_session(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sids = self._post_images(file_agnostic_db, tmp_img_dir, dummy_meta)
+        store_dir = file_agnostic_db.get_project_dir() / '.project' / 'captures'
+        assert sorted(p.stem for p in store_dir.glob('*.parquet')) == sorted(sids)
+        assert file_agnostic_db.catalog.store.count(sids[0]) == 2
+
+    def test_query_captures(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sids = self._post_images(file_agnostic_db, tmp_img_dir, dummy_meta)
+        captures = file_agnostic_db.query_captures(columns=['directory', 'species'], sessions=[sids[1]])
+        assert list(captures.columns) == ['directory', 'species']
+        assert len(captures) == 2
+        assert all(directory.startswith(f"captures/{sids[1]}/") for directory in captures['directory'])
+        assert len(file_agnostic_db.query_captures(species=dummy_meta['species'])) == 4
+        assert len(file_agnostic_db.query_captures(species='unknown')) == 0
+
+    def test_csv_export(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        self._post_images(file_agnostic_db, tmp_img_dir, dummy_meta)
+        project_dir = file_agnostic_db.get_project_dir()
+        file_agnostic_db.export_catalog()
+        csv = pd.read_csv(project_dir / 'captures.csv')
+        assert csv.columns.tolist() == get_csv_header()
+        assert len(csv) == 4
+
+    def test_delete_session_removes_partition(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sids = self._post_images(file_agnostic_db, tmp_img_dir, dummy_meta)
+        file_agnostic_db.delete_session(sids[0])
+        store_dir = file_agnostic_db.get_project_dir() / '.project' / 'captures'
+        assert not (store_dir / f"{sids[0]}.parquet").exists()
+        assert len(file_agnostic_db.query_captures()) == 2
+
+    def test_migrate_captures_csv(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sids = self._post_images(file_agnostic_db, tmp_img_dir, dummy_meta)
+        project_dir = file_agnostic_db.get_project_dir()
+        file_agnostic_db.clear()
+        # a project written before the capture store existed
+        shutil.rmtree(project_dir / '.project' / 'captures')
+        db = FileAgnosticDB()
+        db.load_project(project_dir)
+        assert len(db.query_captures(sessions=[sids[0]])) == 2
+        assert len(db.query_captures()) == 4
+
+    def test_sqlite_query_captures(self, sqlite_db, tmp_img_dir, dummy_meta):
+        sids = self._post_images(sqlite_db, tmp_img_dir, dummy_meta)
+        captures = sqlite_db.query_captures(columns=['directory', 'species'], sessions=[sids[1]])
+        assert list(captures.columns) == ['directory', 'species']
+        assert len(captures) == 2
+        assert len(sqlite_db.query_captures(species=dummy_meta['species'])) == 4
+
+class TestSearchIndex:
+
+    @pytest.fixture
+    def search_index(self):
+        search_index = SearchIndex()
+        search_index.add([
+            {'directory': 'captures/a/1.jpg', 'genus': 'Carabus', 'museum': 'Senkenberg', 'capturer': 'Toni', 'timestamp': '2024-12-31T10:00:00'},
+            {'directory': 'captures/a/2.jpg', 'genus': 'Carabus', 'museum': 'Koenig', 'capturer': 'Toni', 'timestamp': '2025-01-02T10:00:00'},
+            {'directory': 'captures/b/1.jpg', 'genus': 'carabus', 'museum': 'Senkenberg', 'capturer': 'Anna', 'timestamp': '2025-03-14T10:00:00'},
+            {'directory': 'captures/b/2.jpg', 'genus': 'Apis', 'museum': 'Senkenberg', 'capturer': 'Anna', 'timestamp': '2025-06-01T10:00:00'},
+        ])
+        return search_index
+
+    def _directories(self, result):
+        return [capture['directory'] for capture in result['captures']]
+
+    def test_search_intersects_fields(self, search_index):
+        result = search_index.search(genus='CARABUS', museum='Senkenberg')
+        assert self._directories(result) == ['captures/a/1.jpg', 'captures/b/1.jpg']
+        assert search_index.search(capturer=['Toni', 'Anna'], genus='Apis')['total'] == 1
+        assert search_index.search(genus='Bombus')['total'] == 0
+        assert search_index.search()['total'] == 4
+
+    def test_search_by_date(self, search_index):
+        assert self._directories(search_index.search(genus='Carabus', date='2025')) == ['captures/a/2.jpg', 'captures/b/1.jpg']
+        assert search_index.search(date='2025-03')['total'] == 1
+        assert search_index.search(date_from='2025-01-02', date_to='2025-03')['total'] == 2
+        assert search_index.search(date='2025', date_to='2025-01')['total'] == 1
+
+    def test_paging(self, search_index):
+        pages = [search_index.search(page=page, page_size=3) for page in range(2)]
+        assert [len(page['captures']) for page in pages] == [3, 1]
+        assert pages[1]['total'] == 4
+
+    def test_remove_prefix(self, search_index):
+        search_index.remove_prefix('captures/b/')
+        assert len(search_index) == 2
+        assert search_index.search(capturer='Anna')['total'] == 0
+        assert search_index.search(date='2025')['total'] == 1
+        assert search_index.values('museum') == ['Koenig', 'Senkenberg']
+
+    def test_unknown_field(self, search_index):
+        with pytest.raises(ValueError):
+            search_index.search(colour='red')
+
+    def test_search_captures(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sids = []
+        for genus in ('Burdus', 'Apis'):
+            sessions = file_agnostic_db.create_session(session_data.copy())
+            sid = list(sessions.keys())[-1]
+            file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta | {'genus': genus}, 'sid': sid})
+            sids.append(sid)
+        assert file_agnostic_db.search_captures(genus='burdus')['total'] == 1
+        # the built index is updated by new captures and deleted sessions
+        file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta | {'genus': 'Apis'}, 'sid': sids[0]})
+        assert file_agnostic_db.search_captures(genus='Apis')['total'] == 2
+        file_agnostic_db.delete_session(sids[1])
+        result = file_agnostic_db.search_captures(genus='Apis', museum=dummy_meta['museum'], session='session-001')
+        assert result['total'] == 1
+        assert result['captures'][0]['directory'].startswith(f"captures/{sids[0]}/")
+        assert file_agnostic_db.get_search_values('genus') == ['Apis', 'Burdus']
+
+    @pytest.mark.parametrize('db_fixture', ['file_agnostic_db', 'sqlite_db'])
+    def test_search_after_reload(self, request, db_fixture, tmp_img_dir, dummy_meta):
+        db = request.getfixturevalue(db_fixture)
+        sessions = db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        project_dir = db.get_project_dir()
+        db.clear()
+        db.load_project(project_dir)
+        today = datetime.now().date().isoformat()
+        assert db.search_captures(species='Burdus burdulus', date=today)['total'] == 1
+
+class TestGlobalCatalog:
+
+    def _create_project(self, directory, catalog=None):
+        db = FileAgnosticDB(catalog=catalog)
+        db.create_project(project_config | {'project_dir': str(directory), 'name': directory.name})
+        return db
+
+    def _post_image(self, db, tmp_img_dir, meta_info, sid=None):
+        if sid is None:
+            sessions = db.create_session(session_data.copy())
+            sid = list(sessions.keys())[-1]
+        db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': meta_info, 'sid': sid})
+        return sid
+
+    @pytest.fixture
+    def projects(self, tmp_path, tmp_img_dir, dummy_meta):
+        (tmp_path / 'projects').mkdir()
+        json_db = self._create_project(tmp_path / 'projects' / 'json_project')
+        sqlite_db = self._create_project(tmp_path / 'projects' / 'sqlite_project', catalog=SQLiteCatalog())
+        self._post_image(json_db, tmp_img_dir, dummy_meta | {'genus': 'Carabus'})
+        self._post_image(json_db, tmp_img_dir, dummy_meta.copy())
+        self._post_image(sqlite_db, tmp_img_dir, dummy_meta | {'genus': 'Carabus', 'museum': 'Koenig'})
+        return json_db, sqlite_db
+
+    def test_search_across_projects(self, tmp_path, projects):
+        catalog = GlobalCatalog(tmp_path / 'global.db')
+        for project_dir in find_projects(tmp_path / 'projects'):
+            catalog.register(project_dir)
+        assert [project['num_captures'] for project in catalog.projects()] == [2, 1]
+        result = catalog.search_captures(genus='carabus')
+        assert result['total'] == 2
+        assert {capture['project'] for capture in result['captures']} == {'json_project', 'sqlite_project'}
+        assert catalog.search_captures(genus='Carabus', museum='Koenig')['captures'][0]['project'] == 'sqlite_project'
+        assert catalog.search_captures(project='json_project')['total'] == 2
+        assert catalog.search_captures(date=datetime.now().date().isoformat()[:4])['total'] == 3
+        assert catalog.search_captures(date_to='2000')['total'] == 0
+        assert catalog.get_search_values('genus') == ['Burdus', 'Carabus']
+        catalog.close()
+
+    def test_incremental_scan(self, tmp_path, projects, tmp_img_dir, dummy_meta):
+        json_db, sqlite_db = projects
+        catalog = GlobalCatalog(tmp_path / 'global.db')
+        catalog.register(json_db.get_project_dir())
+        catalog.register(sqlite_db.get_project_dir())
+        assert catalog.scan() == {'read': 0, 'removed': 0}
+        sid = self._post_image(json_db, tmp_img_dir, dummy_meta.copy())
+        # only the partition of the new session is read
+        assert catalog.scan() == {'read': 1, 'removed': 0}
+        json_db.delete_session(sid)
+        assert catalog.scan() == {'read': 0, 'removed': 1}
+        assert catalog.search_captures()['total'] == 3
+        catalog.unregister(sqlite_db.get_project_dir())
+        assert catalog.search_captures()['total'] == 2
+        catalog.close()
+
+    def test_legacy_project(self, tmp_path, projects):
+        json_db, _ = projects
+        project_dir = json_db.get_project_dir()
+        json_db.clear()
+        # a project written before the capture store existed
+        shutil.rmtree(project_dir / '.project' / 'captures')
+        catalog = GlobalCatalog(tmp_path / 'global.db')
+        catalog.register(project_dir)
+        assert catalog.search_captures(genus='Carabus')['total'] == 1
+        catalog.close()
+
+class TestTransactions:
+
+    def test_write_outside_transaction(self, tmp_path):
+        assert write_file(tmp_path / 'a.json', '{}')
+        assert (tmp_path / 'a.json').read_text() == '{}'
+        assert [path.name for path in tmp_path.iterdir()] == ['a.json']
+
+    def test_transaction_stages_writes(self, tmp_path):
+        manager = TransactionManager(tmp_path / 'log')
+        (tmp_path / 'a.json').write_text('old')
+        with manager.transaction('test'):
+            write_file(tmp_path / 'a.json', 'first')
+            write_file(tmp_path / 'a.json', 'new')
+            write_file(tmp_path / 'b.json', 'b')
+            assert (tmp_path / 'a.json').read_text() == 'old'
+            assert read_staged(tmp_path / 'a.json') == b'new'
+        assert (tmp_path / 'a.json').read_text() == 'new'
+        assert (tmp_path / 'b.json').read_text() == 'b'
+        assert manager.stats == {'transactions': 1, 'files_written': 2, 'fsyncs': 1}
+
+    def test_failed_transaction_is_discarded(self, tmp_path):
+        manager = TransactionManager(tmp_path / 'log')
+        with pytest.raises(RuntimeError):
+            with manager.transaction('test'):
+                write_file(tmp_path / 'a.json', 'new')
+                raise RuntimeError()
+        assert not (tmp_path / 'a.json').exists()
+        assert read_staged(tmp_path / 'a.json') is None
+
+    @pytest.mark.parametrize('policy, fsyncs', [(FSYNC_NONE, 0), (FSYNC_TRANSACTION, 6), (FSYNC_BATCH, 2)])
+    def test_fsync_policy(self, tmp_path, policy, fsyncs):
+        manager = TransactionManager(tmp_path / 'log', fsync_policy=policy, batch_size=3)
+        for i in range(6):
+            with manager.transaction('test'):
+                write_file(tmp_path / 'a.json', str(i))
+                write_file(tmp_path / 'b.json', str(i))
+        assert manager.stats['fsyncs'] == fsyncs
+        assert (tmp_path / 'log').exists() == (policy != FSYNC_NONE)
+
+    def test_recover(self, tmp_path):
+        manager = TransactionManager(tmp_path / 'log')
+        (tmp_path / 'journal').write_text('line 1\n')
+        with manager.transaction('test'):
+            write_file(tmp_path / 'a.json', 'new')
+            append_file(tmp_path / 'journal', 'line 2\n')
+        # a crash before the checkpoint lost the applied files and tore the next record
+        (tmp_path / 'a.json').write_text('')
+        (tmp_path / 'journal').write_text('line 1\nli')
+        with (tmp_path / 'log').open('a') as f:
+            f.write('{"name": "torn", "wri')
+        assert TransactionManager(tmp_path / 'log').recover() == 1
+        assert (tmp_path / 'a.json').read_text() == 'new'
+        assert (tmp_path / 'journal').read_text() == 'line 1\nline 2\n'
+        assert (tmp_path / 'log').read_text() == ''
+        # replaying again does not duplicate the appended lines
+        manager.recover()
+        assert (tmp_path / 'journal').read_text() == 'line 1\nline 2\n'
+
+    def test_post_new_image_is_one_transaction(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        before = file_agnostic_db.get_transaction_stats()
+        file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        after = file_agnostic_db.get_transaction_stats()
+        assert after['transactions'] - before['transactions'] == 1
+        assert after['fsyncs'] - before['fsyncs'] == 1
+        # session yml, sidecar, project info and capture partition
+        assert after['files_written'] - before['files_written'] == 4
+
+    def test_load_project_recovers(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        project_dir = file_agnostic_db.get_project_dir()
+        log = (project_dir / '.project' / '.transactions.log').read_bytes()
+        file_agnostic_db.clear()
+        # the project info update was not on disk when the process died
+        project_file = project_dir / '.project' / '.project.json'
+        project_file.write_text(project_file.read_text().replace('"num_captures": "1"', '"num_captures": "0"'))
+        (project_dir / '.project' / '.transactions.log').write_bytes(log)
+        db = FileAgnosticDB()
+        assert db.load_project(project_dir)['num_captures'] == '1'
+
+    def test_failed_post_leaves_no_trace(self, file_agnostic_db, tmp_img_dir, dummy_meta, monkeypatch):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        def fail(meta_infos):
+            raise RuntimeError("index failed")
+        monkeypatch.setattr(file_agnostic_db, '_index_captures', fail)
+        with pytest.raises(RuntimeError):
+            file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        project_dir = file_agnostic_db.get_project_dir()
+        assert file_agnostic_db.load_sessions()[sid]['num_captures'] == 0
+        assert 'add_capture' not in (project_dir / '.project' / '.sessions.journal').read_text()
+        assert int(file_agnostic_db.get_project_info()['num_captures']) == 0
+        assert not list((project_dir / sessions[sid]['session_dir']).glob('*.jpg'))
+        assert not file_agnostic_db.content_index.indexed_paths()
+        file_agnostic_db.clear()
+        db = FileAgnosticDB()
+        db.load_project(project_dir)
+        assert db.load_sessions()[sid]['num_captures'] == 0
+
+    def test_large_files_are_not_logged(self, tmp_path, monkeypatch):
+        manager = TransactionManager(tmp_path / 'log', inline_size=16)
+        data = b'x' * 1000
+        replace = os.replace
+        def crash(src, dst):
+            if str(src).endswith('.redo'):
+                raise OSError("crash")
+            replace(src, dst)
+        monkeypatch.setattr(os, 'replace', crash)
+        with pytest.raises(OSError):
+            with manager.transaction('test'):
+                write_file(tmp_path / 'a.bin', data)
+                write_file(tmp_path / 'b.json', 'small')
+        monkeypatch.setattr(os, 'replace', replace)
+        # the log refers to the shadow file instead of holding the content
+        assert (tmp_path / 'log').stat().st_size < len(data)
+        assert TransactionManager(tmp_path / 'log', inline_size=16).recover() == 1
+        assert (tmp_path / 'a.bin').read_bytes() == data
+        assert (tmp_path / 'b.json').read_text() == 'small'
+        assert not list(tmp_path.glob('*.redo'))
+
+    def test_recover_moved_project(self, tmp_path):
+        project_dir = tmp_path / 'old'
+        (project_dir / '.project').mkdir(parents=True)
+        manager = TransactionManager(project_dir / '.project' / 'log', root_dir=project_dir)
+        with manager.transaction('test'):
+            write_file(project_dir / 'a.json', 'new')
+        log = (project_dir / '.project' / 'log').read_bytes()
+        (project_dir / 'a.json').write_text('')
+        project_dir.rename(tmp_path / 'new')
+        project_dir = tmp_path / 'new'
+        (project_dir / '.project' / 'log').write_bytes(log)
+        TransactionManager(project_dir / '.project' / 'log', root_dir=project_dir).recover()
+        assert (project_dir / 'a.json').read_text() == 'new'
+        assert not (tmp_path / 'old').exists()
+
+class TestSQLiteCatalog:
+
+    def test_create_project(self, sqlite_db):
+        conf = sqlite_db.get_project_info()
+        assert conf['name'] == 'foo'
+        assert int(conf['num_captures']) == 0
+        assert (sqlite_db.get_project_dir() / '.project' / 'catalog.db').is_file()
+
+    def test_post_new_image(self, sqlite_db, tmp_img_dir, dummy_meta):
+        sessions = sqlite_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        for _ in range(3):
+            project_info, session = sqlite_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        assert project_info['num_captures'] == '3'
+        assert session['num_captures'] == 3
+        assert len(session['captures']) == 3
+        for capture in session['captures']:
+            assert (sqlite_db.get_project_dir() / capture).is_file()
+
+    def test_export(self, sqlite_db, tmp_img_dir, dummy_meta):
+        sessions = sqlite_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        sqlite_db.add_museum(museum_data)
+        _, session = sqlite_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        sqlite_db.export_catalog()
+        project_data_dir = sqlite_db.get_project_dir() / '.project'
+        assert json.loads((project_data_dir / '.sessions.json').read_text()) == {sid: session}
+        assert len(json.loads((project_data_dir / '.museums.json').read_text())) == 1
+        rows = (sqlite_db.get_project_dir() / 'captures.csv').read_text().splitlines()
+        assert len(rows) == 2
+
+    def test_open_json_project(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        db = FileAgnosticDB(catalog=SQLiteCatalog())
+        db.load_project(file_agnostic_db.get_project_dir())
+        assert db.load_sessions() == file_agnostic_db.load_sessions()
+        assert db.get_project_info()['num_captures'] == '1'
+
+    def test_delete_session(self, sqlite_db, tmp_img_dir, dummy_meta):
+        sids = []
+        for _ in range(2):
+            sessions = sqlite_db.create_session(session_data.copy())
+            sids.append(list(sessions.keys())[-1])
+        sqlite_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sids[1]})
+        project_info, sessions = sqlite_db.delete_session(sids[0])
+        assert list(sessions.keys()) == [sids[1]]
+        assert project_info['num_captures'] == '1'
+
+    def test_connection_per_thread(self, sqlite_db, tmp_img_dir, dummy_meta):
+        sids = [list(sqlite_db.create_session(session_data.copy()).keys())[-1] for _ in range(2)]
+        errors = []
+        def save(sid):
+            try:
+                for _ in range(5):
+                    sqlite_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+            except Exception as e:
+                errors.append(e)
+        threads = [threading.Thread(target=save, args=(sid,)) for sid in sids]
+        for thread in threads:
+            thread.start()
+        # the gui thread reads while the save threads write
+        while any(thread.is_alive() for thread in threads):
+            sqlite_db.get_project_info()
+        for thread in threads:
+            thread.join()
+        assert not errors
+        catalog = sqlite_db.catalog
+        assert len(catalog._connections) >= 3
+        assert catalog.get_project_info()['num_captures'] == '10'
+
 class TestDBAdapter:
     def test_create_project(self, project_dict):
         adapter = DBAdapter(DummyDB())
@@ -192,6 +1044,335 @@ class TestDBAdapter:
         with pytest.raises(NotADirectoryError):
             response = adapter.create_project(None)
 
+    def test_save_image_data_async(self, qtbot, file_agnostic_db, tmp_img_dir, dummy_meta):
+        adapter = DBAdapter(file_agnostic_db)
+        adapter.create_session(session_data.copy())
+        sid = list(file_agnostic_db.load_sessions().keys())[-1]
+        with qtbot.waitSignal(adapter.save_completed_signal, timeout=5000) as blocker:
+            adapter.save_image_data_async({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        assert blocker.args[0]['num_captures'] == '1'
+        assert adapter.pending_saves == 0
+
+    def test_save_invalid_image_data_async(self, qtbot, file_agnostic_db, tmp_path, dummy_meta):
+        adapter = DBAdapter(file_agnostic_db)
+        adapter.create_session(session_data.copy())
+        sid = list(file_agnostic_db.load_sessions().keys())[-1]
+        with qtbot.waitSignal(adapter.save_failed_signal, timeout=5000) as blocker:
+            adapter.save_image_data_async({'img_dir': str(tmp_path / 'missing.jpg'), 'meta_info': dummy_meta.copy(), 'sid': sid})
+        # the validation message reaches the widget
+        assert blocker.args[0].startswith('Invalid image dir: No image data found')
+        assert adapter.pending_saves == 0
+
+    def test_session_deltas(self, qtbot, file_agnostic_db, tmp_img_dir, dummy_meta):
+        adapter = DBAdapter(file_agnostic_db)
+        full_state = []
+        adapter.sessions_signal.connect(full_state.append)
+        with qtbot.waitSignal(adapter.session_added_signal, timeout=1000) as added:
+            adapter.create_session(session_data.copy())
+        sid, session = added.args
+        assert session['name'] == 'session-001'
+        with qtbot.waitSignals([adapter.capture_added_signal, adapter.session_updated_signal], timeout=5000) as blockers:
+            adapter.save_image_data_async({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        capture_args, update_args = (blocker.args for blocker in blockers.all_signals_and_args)
+        assert list(capture_args) == [sid, file_agnostic_db.load_sessions()[sid]['captures'][0]]
+        assert list(update_args) == [sid, {'num_captures': 1}]
+        with qtbot.waitSignal(adapter.session_removed_signal, timeout=1000) as removed:
+            adapter.delete_session(sid)
+        assert list(removed.args) == [sid]
+        assert full_state == []
+
+    def test_save_image_data_async_fails(self, qtbot, file_agnostic_db, dummy_meta):
+        adapter = DBAdapter(file_agnostic_db)
+        with qtbot.waitSignal(adapter.save_failed_signal, timeout=5000):
+            adapter.save_image_data_async({'img_dir': 'missing.jpg', 'meta_info': dummy_meta.copy(), 'sid': None})
+
+
+class TestSessionTableModel:
+    @pytest.fixture
+    def model(self, qtbot):
+        model = SessionTableModel(["Name", "# Captures"], ["name", "num_captures"])
+        model.FETCH_SIZE = 10
+        model.set_sessions({f"sid-{i}": {'name': f"session-{str(i).zfill(3)}", 'num_captures': i % 7}
+                            for i in range(25)})
+        return model
+
+    def test_fetches_rows_lazily(self, model):
+        assert model.rowCount() == 10
+        while model.canFetchMore():
+            model.fetchMore()
+        assert model.rowCount() == 25
+
+    def test_sort(self, model):
+        model.sort(1, Qt.SortOrder.DescendingOrder)
+        assert [model.session(row)['num_captures'] for row in range(3)] == [6, 6, 6]
+        # a reset keeps the sort order
+        model.set_sessions({'a': {'name': 'a', 'num_captures': 1}, 'b': {'name': 'b', 'num_captures': 2}})
+        assert [model.session_id(row) for row in range(2)] == ['b', 'a']
+
+    def test_row_updates(self, model):
+        model.update_session('sid-3', {'num_captures': 42})
+        assert model.data(model.index(3, 1)) == '42'
+        model.remove_session('sid-0')
+        assert model.session_id(0) == 'sid-1'
+        assert model.rows['sid-3'] == 2
+        model.add_session('new', {'name': 'new', 'num_captures': 0})
+        # the new row is shown once the rows before it are fetched
+        assert model.rowCount() == 9
+        while model.canFetchMore():
+            model.fetchMore()
+        assert model.session_id(model.rowCount() - 1) == 'new'
+
+    def test_add_keeps_sort_order(self, model):
+        for order in (Qt.SortOrder.AscendingOrder, Qt.SortOrder.DescendingOrder):
+            model.sort(1, order)
+            model.add_session(f"new-{order.name}", {'name': 'new', 'num_captures': 3})
+            while model.canFetchMore():
+                model.fetchMore()
+            num_captures = [model.session(row)['num_captures'] for row in range(model.rowCount())]
+            assert num_captures == sorted(num_captures, reverse=order == Qt.SortOrder.DescendingOrder)
+            assert all(model.rows[model.session_id(row)] == row for row in range(model.rowCount()))
+            # behind the sessions with the same key
+            assert model.session_id(num_captures.index(3) + num_captures.count(3) - 1) == f"new-{order.name}"
+
+    def test_update_keeps_sort_order(self, model):
+        model.sort(1, Qt.SortOrder.AscendingOrder)
+        # the rows the view knows of, from the signals of the model
+        view_rows = [model.rowCount()]
+        model.rowsInserted.connect(lambda parent, first, last: view_rows.append(view_rows[-1] + last - first + 1))
+        model.rowsRemoved.connect(lambda parent, first, last: view_rows.append(view_rows[-1] - last + first - 1))
+        # into, within and out of the fetched rows
+        for sid, num_captures in (('sid-6', 0), ('sid-7', 5), ('sid-0', 9), ('sid-13', 3)):
+            model.update_session(sid, {'num_captures': num_captures})
+            assert all(model.rows[model.order[row]] == row for row in range(len(model.order)))
+            values = [model.sessions[other]['num_captures'] for other in model.order]
+            assert values == sorted(values)
+            assert view_rows[-1] == model.rowCount()
+        # rows moved into and out of the fetched rows
+        assert len(view_rows) > 2
+        while model.canFetchMore():
+            model.fetchMore()
+        assert model.session_id(model.rowCount() - 1) == 'sid-0'
+
+
+class TestCaptureModel:
+    @pytest.fixture
+    def captures(self, tmp_path):
+        captures = []
+        for i in range(5):
+            Image.new('RGB', (800, 600), (50 * i, 0, 0)).save(tmp_path / f"cap-{i}.jpg")
+            captures.append(f"cap-{i}.jpg")
+        (tmp_path / 'broken.jpg').write_bytes(b'no image')
+        return captures + ['broken.jpg']
+
+    def test_decodes_thumbnails(self, qtbot, tmp_path, captures):
+        model = CaptureModel(tmp_path, thumbnail_size=64, cache_size=3)
+        model.set_captures(captures)
+        for row in range(model.rowCount()):
+            assert model.data(model.index(row), Qt.ItemDataRole.DecorationRole) is None
+        qtbot.waitUntil(lambda: not model.pending, timeout=5000)
+        # the cache keeps the most recently decoded thumbnails only
+        assert len(model.thumbnails) == 3
+        assert all(max(thumbnail.width(), thumbnail.height()) == 64 for thumbnail in model.thumbnails.values())
+        assert model.failed == {'broken.jpg'}
+        model.pool.waitForDone()
+
+    def test_cancel_pending(self, qtbot, tmp_path, captures):
+        model = CaptureModel(tmp_path)
+        model.set_captures(captures)
+        model.pool.setMaxThreadCount(1)
+        model.pool.start(lambda: time.sleep(0.2))
+        for row in range(model.rowCount()):
+            model.data(model.index(row), Qt.ItemDataRole.DecorationRole)
+        model.cancel_pending(0, 1)
+        assert sorted(capture for capture, _ in model.pending.values()) == captures[:2]
+        qtbot.waitUntil(lambda: not model.pending, timeout=5000)
+        model.pool.waitForDone()
+        assert sorted(model.thumbnails) == captures[:2]
+
+    def test_add_capture(self, tmp_path, captures):
+        model = CaptureModel(tmp_path)
+        model.FETCH_SIZE = 2
+        model.set_captures(captures[:4])
+        model.add_capture(captures[4])
+        assert model.rowCount() == 2
+        while model.canFetchMore():
+            model.fetchMore()
+        assert model.data(model.index(4)) == 'cap-4.jpg'
+
+
+class TestDerivativeCache:
+    @pytest.fixture
+    def source(self, tmp_path):
+        source = tmp_path / 'large.jpg'
+        Image.fromarray(np.random.randint(0, 255, (2400, 3200, 3), dtype=np.uint8)).save(source)
+        return source
+
+    def test_generate(self, tmp_path, source):
+        cache = DerivativeCache(tmp_path)
+        assert cache.get('abcd', 'preview') is None
+        paths = cache.generate('abcd', source)
+        with Image.open(paths['thumbnail']) as thumbnail, Image.open(paths['preview']) as preview:
+            assert thumbnail.size == (256, 192)
+            assert preview.size == (1600, 1200)
+        assert cache.get('abcd', 'thumbnail') == paths['thumbnail']
+        with pytest.raises(ValueError):
+            cache.get('abcd', 'poster')
+
+    def test_lru_eviction(self, tmp_path, source):
+        cache = DerivativeCache(tmp_path)
+        for content_hash in ('aa01', 'aa02', 'aa03'):
+            cache.get_or_create(content_hash, source, 'thumbnail')
+        # aa01 becomes the most recently used derivative
+        cache.get('aa01')
+        cache.max_bytes = cache.total_bytes - 1
+        cache.get_or_create('aa04', source, 'thumbnail')
+        assert [content_hash for _, content_hash in cache.entries] == ['aa01', 'aa04']
+        assert cache.get_stats()['evicted'] == 2
+        assert cache.get('aa02') is None
+        # the access order is restored from the files
+        reloaded = DerivativeCache(tmp_path).load()
+        assert list(reloaded.entries) == list(cache.entries)
+        assert reloaded.total_bytes == cache.total_bytes
+
+    def test_generated_on_save(self, file_agnostic_db, tmp_img_dir, dummy_meta):
+        sessions = file_agnostic_db.create_session(session_data.copy())
+        sid = list(sessions.keys())[-1]
+        _, session = file_agnostic_db.post_new_image({'img_dir': tmp_img_dir, 'meta_info': dummy_meta.copy(), 'sid': sid})
+        file_agnostic_db.wait_for_derivatives()
+        assert file_agnostic_db.get_derivative_stats()['generated'] == 2
+        capture = session['captures'][0]
+        path = file_agnostic_db.get_derivative(capture, 'preview')
+        assert path.is_file()
+        assert file_agnostic_db.get_derivative_stats()['hits'] == 1
+
+
+class TestSidecar:
+    @pytest.mark.parametrize('sidecar_format', ['yaml', 'json'])
+    def test_round_trip(self, tmp_path, dummy_meta, sidecar_format):
+        meta_info = {'Species Info': dummy_meta, 'captureID': 3}
+        path = tmp_path / f"cap.{'yml' if sidecar_format == 'yaml' else 'json'}"
+        path.write_text(dump_sidecar(meta_info, sidecar_format))
+        assert find_sidecar(tmp_path / 'cap.jpg') == path
+        assert load_sidecar(path) == meta_info
+
+    def test_merge_json_sidecars(self, tmp_path, file_agnostic_db, dummy_meta):
+        db = FileAgnosticDB(sidecar_format=SIDECAR_JSON)
+        db.create_project(dict(project_config, project_dir=str(tmp_path / 'source')))
+        sid = list(db.create_session(session_data.copy()).keys())[-1]
+        Image.fromarray(np.random.randint(0, 255, (100, 100, 3), dtype=np.uint8)).save(tmp_path / 'json.jpg')
+        _, session = db.post_new_image({'img_dir': str(tmp_path / 'json.jpg'), 'meta_info': dummy_meta.copy(), 'sid': sid})
+        source_cap = db.project_root_dir / session['captures'][0]
+        assert source_cap.with_suffix('.json').is_file()
+        assert (db.project_root_dir / session['session_dir'] / 'session-001.json').is_file()
+        # the yaml project reads the json sidecars of the source
+        _, sessions = file_agnostic_db.merge_project(DBAdapter(db), False)
+        assert (file_agnostic_db.project_root_dir / sessions[sid]['captures'][0]).with_suffix('.yml').is_file()
+
+    def test_migrate(self, file_agnostic_db, source_adapter):
+        project_dir = source_adapter.get_project_dir()
+        yml_files = sorted(project_dir.rglob('captures/**/*.yml'))
+        contents = [load_sidecar(path) for path in yml_files]
+        assert migrate_sidecars(project_dir, SIDECAR_JSON) == len(yml_files) == 6
+        assert not list(project_dir.rglob('captures/**/*.yml'))
+        assert [load_sidecar(path.with_suffix('.json')) for path in yml_files] == contents
+
+    def test_benchmark(self):
+        results = benchmark(captures=20)
+        assert {'yaml (Python)', 'json'} <= set(results)
+        assert all(result['dump'] > 0 and result['parse'] > 0 for result in results.values())
+
+
+
+def _post_from_station(project_dir, station, sid, meta_info, num_captures):
+    # runs in a process of its own, like a capture station on another computer
+    db = FileAgnosticDB(catalog=StationCatalog(station=station, idle_timeout=None))
+    db.load_project(project_dir)
+    for i in range(num_captures):
+        img = Path(project_dir).parent / f"{station}-{i}.jpg"
+        Image.fromarray(np.random.randint(0, 255, (64, 64, 3), dtype=np.uint8)).save(img)
+        db.post_new_image({'img_dir': str(img), 'meta_info': dict(meta_info), 'sid': sid})
+    db.wait_for_derivatives()
+    db.catalog.close()
+
+
+class TestStationCatalog:
+    @pytest.fixture
+    def station_db(self, tmp_path):
+        db = FileAgnosticDB(catalog=StationCatalog(station='main', idle_timeout=None))
+        db.create_project(dict(project_config, project_dir=str(tmp_path / 'shared')))
+        yield db
+        db.catalog.close()
+
+    def test_concurrent_stations(self, station_db, dummy_meta):
+        first = list(station_db.create_session(session_data.copy()).keys())[-1]
+        second = list(station_db.create_session(session_data.copy()).keys())[-1]
+        project_dir = str(station_db.project_root_dir)
+        # two stations capture into each session at the same time
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=_post_from_station, args=(project_dir, f"s{i}", sid, dummy_meta, 5))
+                     for i, sid in enumerate([first, first, second, second])]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(timeout=120)
+        assert [process.exitcode for process in processes] == [0, 0, 0, 0]
+
+        sessions = station_db.load_sessions()
+        for sid in (first, second):
+            assert sessions[sid]['num_captures'] == 10
+            assert len(set(sessions[sid]['captures'])) == 10
+            assert len(station_db.catalog.query_captures(sessions=[sid])) == 10
+        assert station_db.get_project_info()['num_captures'] == '20'
+        assert len(ContentIndex(project_dir).load().indexed_paths()) == 20
+        # compaction folds the journals of all stations into the sessions file
+        station_db.catalog.compact()
+        assert all(journal.stat().st_size == 0 for journal in (station_db.project_root_dir / '.project' / 'stations').glob('*.journal'))
+        assert station_db.load_sessions() == sessions
+
+    def test_station_open_once(self, station_db):
+        with pytest.raises(RuntimeError, match='open already'):
+            StationCatalog(station='main').open(station_db.project_root_dir)
+        other = StationCatalog(station='other')
+        other.open(station_db.project_root_dir)
+        other.close()
+
+    def test_merge_on_read(self, station_db):
+        other = StationCatalog(station='other', idle_timeout=None)
+        other.open(station_db.project_root_dir)
+        sid = list(station_db.create_session(session_data.copy()).keys())[-1]
+        # the session of the main station is read from its journal
+        assert other.get_session(sid)['name'] == 'session-001'
+        other.update_session(sid, {'Capturer': 'Toni'})
+        assert station_db.catalog.get_session(sid)['Capturer'] == 'Toni'
+        other.remove_session(sid)
+        assert sid not in station_db.load_sessions()
+        other.close()
 
+    def test_append_after_compaction(self, tmp_path):
+        sessions_file = tmp_path / '.sessions.json'
+        sessions_file.write_text('{}')
+        main, other = (StationJournal(sessions_file, tmp_path / 'stations', station, tmp_path / 'sessions.lock',
+                                      idle_timeout=None).load() for station in ('main', 'other'))
+        other.append('add_session', 'a', session={'name': 'a', 'captures': [], 'num_captures': 0})
+        main.refresh()
+        # the journal of the other station is truncated and written again, past the offset main has read
+        other.compact()
+        other.append('update_session', 'a', fields={'Capturer': 'Toni', 'Museum': 'Senkenberg - Frankfurt'})
+        main.append('update_session', 'a', fields={'name': 'b'})
+        assert main.sessions['a'] == {'name': 'b', 'captures': [], 'num_captures': 0, 'Capturer': 'Toni',
+                                      'Museum': 'Senkenberg - Frankfurt'}
 
+    def test_remove_session_compacts_after_commit(self, station_db):
+        sid = list(station_db.create_session(session_data.copy()).keys())[-1]
+        station_db.delete_session(sid)
+        assert all(journal.stat().st_size == 0 for journal in (station_db.project_root_dir / '.project' / 'stations').glob('*.journal'))
+        assert sid not in json.loads((station_db.project_root_dir / '.project' / '.sessions.json').read_text())
 
+    def test_file_lock(self, tmp_path):
+        lock_file = tmp_path / 'sessions.lock'
+        with FileLock(lock_file, shared=True), FileLock(lock_file, shared=True):
+            with pytest.raises(LockedError):
+                FileLock(lock_file, blocking=False).acquire()
+        with FileLock(lock_file):
+            with pytest.raises(LockedError):
+                FileLock(lock_file, shared=True, blocking=False).acquire()
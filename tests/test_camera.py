@@ -0,0 +1,372 @@
+import pytest
+import threading
+import time
+import cv2
+import numpy as np
+from pathlib import Path
+from PIL import Image
+from src.db.DB import FileAgnosticDB
+from src.utils.ingest import content_hash
+from src.threads.CameraSession import CameraSessionError
+from src.threads.CameraThread import set_backend, get_session, close_sessions
+from src.threads.GPhoto2Camera import GPhoto2Backend
+from src.threads.SimulatedCamera import SimulatedBackend, SimulatedSession, benchmark as benchmark_capture
+from src.threads.CameraFetcher import CameraFetcher
+from src.threads.ImageCapture import ImageCapture
+from src.threads.CameraStreamer import CameraStreamer
+from src.threads.MJPEGDecoder import MJPEGSplitter, MJPEGDecoder, benchmark
+from src.threads.FrameBuffer import FrameBuffer
+from src.threads.VideoCaptureDevice import VideoCaptureDevice
+
+# no latency, the tests measure the pipeline and not the simulated camera
+NO_LATENCY = {'open': 0, 'preview': 0, 'capture': 0, 'download': 0}
+
+meta_info = {
+    "sessionName": "session-01",
+    "collectionName": "Insect of Afrika",
+    "order": "Burdi",
+    "family": "Burdeae",
+    "genus": "Burdus",
+    "species": "Burdus burdulus",
+    "museum": "Senkenberg - Frankfurt",
+    "capturer": "Toni",
+    "directory": "path/to/file.jpg",
+    "timestap": None,
+    "sessionDir": "dir/to/session/",
+    "captureID": 1
+}
+
+session_data = {
+    "name" : None,
+    "Capturer": 'Thomas',
+    "Museum": 'Senkenberg',
+    "collection_name": "Insects",
+    'captures': []
+}
+
+project_config = {
+    'project_dir': None,
+    'num_captures': 0,
+    'name': 'foo',
+    'description': 'bar',
+    'date': '2020-01-01',
+    'authors': 'baz'}
+
+
+@pytest.fixture
+def simulated_backend():
+    backend = SimulatedBackend(capture_size=(1200, 800), preview_size=(320, 240), latency=NO_LATENCY, seed=0)
+    set_backend(backend)
+    yield backend
+    set_backend(GPhoto2Backend())
+
+
+@pytest.fixture
+def session():
+    return SimulatedSession('Simulated Camera', 'usb:sim', capture_size=(600, 400), preview_size=(320, 240),
+                            latency=NO_LATENCY, seed=0)
+
+
+class TestSimulatedCamera:
+    def test_preview(self, session):
+        frames = [cv2.imdecode(np.frombuffer(session.capture_preview(), np.uint8), cv2.IMREAD_COLOR) for _ in range(2)]
+        assert frames[0].shape == (240, 320, 3)
+        # the frames move
+        assert not np.array_equal(frames[0], frames[1])
+        assert session.previewing
+
+    def test_capture(self, session, tmp_path):
+        session.capture_preview()
+        paths = [session.capture(tmp_path / f"{i}.jpg") for i in range(3)]
+        assert not session.previewing
+        with Image.open(paths[0]) as image:
+            assert image.size == (600, 400)
+        assert len({content_hash(path) for path in paths}) == 3
+        assert session.stats['downloads'] == 3 and not session.storage
+
+    def test_failure_injection(self, session, tmp_path):
+        session.fail_next('capture')
+        with pytest.raises(CameraSessionError):
+            session.capture(tmp_path / 'failed.jpg')
+        assert not session.is_open
+        # the camera is opened again by the next capture
+        assert session.capture(tmp_path / 'ok.jpg').is_file()
+        session.failure_rate['download'] = 1.0
+        with pytest.raises(CameraSessionError):
+            session.capture(tmp_path / 'lost.jpg')
+        assert session.stats['failures'] == 2
+
+    def test_shared_session(self, simulated_backend):
+        session = get_session(SimulatedBackend.MODEL, SimulatedBackend.PORT)
+        assert session is get_session(SimulatedBackend.MODEL, SimulatedBackend.PORT)
+        close_sessions()
+        assert not session.is_open
+
+    def test_detect(self, simulated_backend):
+        fetcher = CameraFetcher()
+        cameras = []
+        fetcher.finished.connect(cameras.extend)
+        fetcher.run()
+        assert cameras == [SimulatedBackend.MODEL]
+        camera_data = fetcher.getCameraData(SimulatedBackend.MODEL)
+        # parsed like the capture view does
+        assert f"usb{camera_data.split('usb')[-1].strip()}" == SimulatedBackend.PORT
+
+
+@pytest.fixture
+def script_streamer(tmp_path):
+    # a streamer that runs a fake stream script instead of gphoto2 and ffmpeg
+    streamer = CameraStreamer(fs=10, loopback=True)
+    streamer.set_camera_data('Fake Camera', 'usb:001,001')
+    streamer.open_session = lambda: None
+    streamer.use_scripts = lambda: True
+    streamer._get_device_dir = lambda: Path('/dev/video-test')
+    streamer.reset_camera = lambda: None
+    streamer._stopGphoto2Slaves = lambda: None
+    return streamer
+
+
+def write_script(tmp_path, lines):
+    script = tmp_path / 'stream.bash'
+    script.write_text("\n".join(lines) + "\n")
+    return str(script)
+
+
+class TestCameraStreamer:
+    def run_streamer(self, streamer):
+        states, failures = [], []
+        streamer.signals.state_changed.connect(states.append)
+        streamer.signals.stream_failed.connect(failures.append)
+        thread = threading.Thread(target=streamer.run)
+        thread.start()
+        return thread, states, failures
+
+    def test_in_process_lifecycle(self, qtbot, simulated_backend):
+        streamer = CameraStreamer(fs=10, frames=FrameBuffer(capacity=3))
+        streamer.set_camera_data(SimulatedBackend.MODEL, SimulatedBackend.PORT)
+        thread, states, failures = self.run_streamer(streamer)
+        assert streamer.wait_for_state({CameraStreamer.STREAMING}, timeout=5)
+        qtbot.waitUntil(lambda: streamer.frames.stats['put'] >= 3)
+        frames = [streamer.frames.get() for _ in range(streamer.frames.depth)]
+        streamer.stop_running()
+        thread.join(timeout=5)
+        qtbot.waitUntil(lambda: states[-1:] == [CameraStreamer.IDLE])
+        assert states == ['building', 'ready', 'streaming', 'stopping', 'idle']
+        assert frames and all(ret for ret, _ in frames) and not failures
+        assert not streamer.session.previewing
+
+    def test_in_process_sampling(self, simulated_backend):
+        # the camera is asked for fs frames per second, not as many as it delivers
+        streamer = CameraStreamer(fs=10)
+        streamer.set_camera_data(SimulatedBackend.MODEL, SimulatedBackend.PORT)
+        thread = threading.Thread(target=streamer.run)
+        thread.start()
+        assert streamer.wait_for_state({CameraStreamer.STREAMING}, timeout=5)
+        previews = streamer.session.stats['previews']
+        time.sleep(0.5)
+        sampled = streamer.session.stats['previews'] - previews
+        streamer.stop_running()
+        thread.join(timeout=5)
+        assert 3 <= sampled <= 7
+        # the frames are sampled by the worker, the decoder decodes each of them
+        assert streamer.decoder.fs is None
+
+    def test_ready_from_script_output(self, qtbot, tmp_path, script_streamer):
+        script_streamer.config['--script'] = write_script(tmp_path, [
+            'echo "Output #0, video4linux2,v4l2, to /dev/video-test" >&2',
+            'sleep 0.2',
+            'echo "frame=    1 fps=0.0 q=-0.0 size=N/A" >&2',
+            'exec sleep 30'])
+        enabled = []
+        script_streamer.signals.stream_enabled.connect(enabled.append)
+        start = time.monotonic()
+        thread, states, failures = self.run_streamer(script_streamer)
+        assert script_streamer.wait_for_state({CameraStreamer.STREAMING}, timeout=5)
+        # ready with the first frame instead of after a fixed sleep
+        assert time.monotonic() - start < 3
+        # the worker blocks while it streams
+        cpu_start = time.process_time()
+        time.sleep(0.5)
+        assert time.process_time() - cpu_start < 0.2
+        script_streamer.stop_running()
+        thread.join(timeout=5)
+        assert not thread.is_alive() and script_streamer.proc is None
+        qtbot.waitUntil(lambda: states[-1:] == [CameraStreamer.IDLE])
+        assert states == ['building', 'ready', 'streaming', 'stopping', 'idle']
+        assert enabled == ['/dev/video-test'] and not failures
+
+    def test_mjpeg_pipe(self, qtbot, tmp_path, session):
+        # the movie script writes the live view to stdout, no loopback device is involved
+        (tmp_path / 'live.mjpeg').write_bytes(b"".join(session.capture_preview() for _ in range(5)))
+        streamer = CameraStreamer(fs=10)
+        streamer.set_camera_data('Fake Camera', 'usb:001,001')
+        streamer.open_session = lambda: None
+        streamer.use_scripts = lambda: True
+        streamer.reset_camera = lambda: None
+        streamer._stopGphoto2Slaves = lambda: None
+        streamer.config['--script'] = write_script(tmp_path, [f"cat {tmp_path / 'live.mjpeg'}", 'exec sleep 30'])
+        thread, states, failures = self.run_streamer(streamer)
+        assert streamer.wait_for_state({CameraStreamer.STREAMING}, timeout=5)
+        qtbot.waitUntil(lambda: streamer.frames.depth >= 1)
+        ret, frame = streamer.frames.get_latest()
+        streamer.stop_running()
+        thread.join(timeout=5)
+        assert not thread.is_alive() and not failures
+        assert ret and frame.shape == (240, 320, 3)
+        # the frames arrive at once, at 10 fps most of them are dropped undecoded
+        assert streamer.decoder.stats['received'] == 5
+        assert streamer.decoder.stats['decoded'] < 5
+        assert streamer.decoder.fs == 10
+
+    def test_script_failure(self, qtbot, tmp_path, script_streamer):
+        script_streamer.config['--script'] = write_script(tmp_path, [
+            'echo "*** Error: No camera found. ***" >&2',
+            'exit 1'])
+        thread, states, failures = self.run_streamer(script_streamer)
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+        qtbot.waitUntil(lambda: len(failures) == 1)
+        assert 'No camera found' in failures[0]
+        assert states == ['building', 'stopping', 'idle']
+
+
+class TestFrameBuffer:
+    def test_drop_oldest(self):
+        frames = FrameBuffer(capacity=2)
+        for i in range(5):
+            frames.put((True, i))
+        assert frames.depth == 2
+        assert frames.get() == (True, 3) and frames.get() == (True, 4) and frames.get() is None
+        assert frames.stats == {'put': 5, 'taken': 2, 'dropped': 3, 'max_depth': 2, 'depth': 0}
+
+    def test_latest(self):
+        frames = FrameBuffer(capacity=3)
+        for i in range(3):
+            frames.put((True, i))
+        assert frames.get_latest() == (True, 2)
+        assert frames.get_latest() is None
+        assert frames.stats['dropped'] == 2 and frames.stats['taken'] == 1
+
+    def test_capacity(self):
+        with pytest.raises(ValueError):
+            FrameBuffer(capacity=0)
+
+    def test_video_device_sampling(self, tmp_path):
+        # a video file is read as fast as the frames can be grabbed, only the sampled frames are decoded
+        video = tmp_path / 'stream.avi'
+        writer = cv2.VideoWriter(str(video), cv2.VideoWriter_fourcc(*'MJPG'), 30, (320, 240))
+        for i in range(30):
+            writer.write(np.full((240, 320, 3), i * 8, np.uint8))
+        writer.release()
+        frames = FrameBuffer(capacity=3)
+        device = VideoCaptureDevice(fs=1, device_dir=str(video), frames=frames)
+        opened = []
+        device.signals.device_open.connect(lambda: opened.append(True))
+        # the panel connects to the signals of each new device, the connections do not add up
+        assert VideoCaptureDevice(fs=1).signals is not device.signals
+        device.run()
+        assert opened == [True]
+        # the first frame is sampled, the device stops at the end of the file
+        assert frames.stats['put'] == 2
+        assert frames.get()[0] and frames.get() == (False, None)
+
+
+class TestMJPEGDecoder:
+    def test_split_chunks(self, session):
+        jpegs = [session.capture_preview() for _ in range(3)]
+        stream = b"garbage" + b"".join(jpegs)
+        splitter = MJPEGSplitter()
+        frames = []
+        for i in range(0, len(stream), 1000):
+            frames.extend(splitter.feed(stream[i:i + 1000]))
+        assert frames == jpegs
+        assert not splitter.dropped
+
+    def test_embedded_thumbnail(self, session):
+        # the end of image marker of an exif thumbnail does not end the frame
+        thumbnail = cv2.imencode('.jpg', np.zeros((8, 8, 3), np.uint8))[1].tobytes()
+        payload = b'Exif\x00\x00' + thumbnail
+        jpeg = session.capture_preview()
+        frame = jpeg[:2] + b'\xff\xe1' + (len(payload) + 2).to_bytes(2, 'big') + payload + jpeg[2:]
+        assert MJPEGSplitter().feed(frame + jpeg) == [frame, jpeg]
+
+    def test_truncated_frame(self, session):
+        jpegs = [session.capture_preview() for _ in range(2)]
+        splitter = MJPEGSplitter()
+        assert splitter.feed(jpegs[0][:len(jpegs[0]) // 2] + jpegs[1]) == [jpegs[1]]
+        assert splitter.dropped == 1
+
+    def test_latest_frame_wins(self, session):
+        release = threading.Event()
+        decoded = []
+        decoder = MJPEGDecoder(lambda ret, frame: (release.wait(5), decoded.append((ret, decoder.sequence))))
+        decoder.start()
+        jpegs = [session.capture_preview() for _ in range(5)]
+        decoder.submit(jpegs[0])
+        # the decoder is busy with the first frame, the frames in between are dropped
+        deadline = time.monotonic() + 5
+        while decoder.stats['decoded'] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        for jpeg in jpegs[1:]:
+            decoder.submit(jpeg)
+        release.set()
+        while len(decoded) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        decoder.stop()
+        # the first and the last frame, each with its own number in the stream
+        assert decoded == [(True, 0), (True, 4)]
+        assert decoder.stats == {'received': 5, 'decoded': 2, 'dropped': 3, 'failed': 0}
+
+    def test_benchmark(self):
+        results = benchmark(num_frames=20, size=(320, 240), fps=200)
+        assert 'mjpeg (in-process)' in results and len(results) == 2
+        assert all(result['cpu_ms'] > 0 for result in results.values())
+        # the in-process decoder drops the frames it falls behind with on a loaded machine, the chains decode all
+        assert 1 <= results.pop('mjpeg (in-process)')['frames'] <= 20
+        assert [result['frames'] for result in results.values()] == [20]
+
+
+class TestCaptureThroughput:
+    def test_capture_and_save(self, simulated_backend, tmp_path):
+        db = FileAgnosticDB()
+        db.create_project(dict(project_config, project_dir=str(tmp_path / 'project')))
+        sid = list(db.create_session(session_data.copy()).keys())[-1]
+        captured, failed = [], []
+        ImageCapture.signals.img_captured.connect(captured.append)
+        ImageCapture.signals.failed_signal.connect(failed.append)
+        num_captures = 10
+        try:
+            for _ in range(num_captures):
+                capture = ImageCapture()
+                capture.set_camera_data(SimulatedBackend.MODEL, SimulatedBackend.PORT)
+                capture.set_image_dir(db.project_root_dir / '.project' / '.tmp_cap')
+                capture.run()
+                db.post_new_image({'img_dir': captured[-1], 'meta_info': dict(meta_info), 'sid': sid, 'move': True})
+            db.wait_for_derivatives()
+        finally:
+            ImageCapture.signals.img_captured.disconnect(captured.append)
+            ImageCapture.signals.failed_signal.disconnect(failed.append)
+        assert not failed
+        session = db.load_sessions()[sid]
+        assert session['num_captures'] == num_captures
+        assert all((db.project_root_dir / capture).is_file() for capture in session['captures'])
+        # the temporary captures are moved into the project
+        assert not list((db.project_root_dir / '.project' / '.tmp_cap').glob('*.jpg'))
+
+    def test_benchmark(self):
+        result = benchmark_capture(num_captures=2)
+        assert result['num_captures'] == 2 and result['captures_per_s'] > 0
+
+    def test_capture_failure(self, simulated_backend, tmp_path):
+        session = get_session(SimulatedBackend.MODEL, SimulatedBackend.PORT)
+        session.fail_next('capture')
+        failed = []
+        ImageCapture.signals.failed_signal.connect(failed.append)
+        try:
+            capture = ImageCapture()
+            capture.set_camera_data(SimulatedBackend.MODEL, SimulatedBackend.PORT)
+            capture.set_image_dir(tmp_path)
+            capture.run()
+        finally:
+            ImageCapture.signals.failed_signal.disconnect(failed.append)
+        assert len(failed) == 1 and 'Simulated capture failure' in failed[0]